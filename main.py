@@ -4,48 +4,417 @@
 # ---------------------------------------------------------*/
 #!/usr/bin/env python3
 
-import numpy as np
-from models.Q_Learning_model import QLearningAgent
-from src.simulate import simulated_game
-from utils.helpers import analyze_q_table
-from src.game import game
-from src.eval import evaluate_agent
-# from models.model import train_q_learning, evaluate_agent
+import sys
+import argparse
+from contextlib import nullcontext
+
+# Only the standard library is imported at module level. Every subcommand imports its subsystem
+# when it runs, so playing a game never loads the training or plotting stack (matplotlib, scipy).
+
+#---------------------------------------------------------*/
+# Parameters
+#---------------------------------------------------------*/
+
+# Cold-start budget per subcommand (ms): importing the modules a subcommand needs, in a fresh interpreter
+startup_budget_ms = {
+    "play": 400,
+    "simulate": 100,
+    "evaluate": 400,
+    "analyze": 400,
+    "tournament": 400,
+    "serve": 400,
+}
+
+# Modules imported by the subcommands (checked by `startup`)
+command_modules = {
+    "play": ["src.game"],
+    "simulate": ["src.simulate"],
+    "evaluate": ["src.eval", "utils.checkpoint"],
+    "analyze": ["utils.helpers", "utils.checkpoint"],
+    "tournament": ["src.tournament"],
+    "serve": ["src.server", "models.policy"],
+}
+
+# Modules that must not be loaded by the subcommands above
+heavy_modules = ("matplotlib", "scipy", "tqdm")
+
+# Training options that only some engines support (rejected for the others instead of ignored)
+engine_options = {
+    "backend": ("agent", "batched", "dyna", "league"),
+    "checkpoint_every": ("agent", "batched"),
+    "csv": ("agent", "batched"),
+    "trace": ("agent", "batched"),
+    "eval_games": ("agent",),
+    "shard": ("sharded",),
+    "shards": ("sharded",),
+    "workers": ("league", "sharded"),
+    "envs": ("batched", "league", "sharded", "tile", "dqn"),
+    "planning_steps": ("dyna",),
+    "seed": ("batched", "dyna", "league", "sharded", "tile", "dqn"),
+}
+
+#---------------------------------------------------------*/
+# Subcommands
+#---------------------------------------------------------*/
+def cmd_play(args):
+    """1) Normal game (against human, machine or solver)"""
+    from src.game import game
+    game(limit=args.limit, opponent=args.opponent, budget_ms=args.budget_ms)
+
+def cmd_simulate(args):
+    """2) Simulated game"""
+    from src.simulate import simulated_game
+    simulated_game()
+
+def train(args, q_table=None, start_episode=0):
+    """Trains with the chosen engine (from scratch or continuing `q_table`) and returns the table."""
+    if args.engine == "dqn":  # Continues the network of a DQN checkpoint on `resume`
+        from models.dqn_model import DQNAgent
+        agent = DQNAgent.load(args.path, seed=args.seed) if getattr(args, "path", None) else DQNAgent(seed=args.seed)
+        return agent.train(args.episodes, n_envs=args.envs or 16, plot=not args.no_plot, start_episode=start_episode)
+
+    if args.engine == "tile":
+        from models.tile_coding_model import TileCodingAgent
+        return TileCodingAgent().train(args.episodes, n_envs=args.envs or 20, seed=args.seed, plot=not args.no_plot)
+
+    if args.engine == "sharded":
+        from models.sharded import train_sharded, train_shard, save_shard, digest
+        seed = args.seed if args.seed is not None else 0
+        shards = args.shards or 4
+        if args.shard is not None:  # One shard of a run spread over several machines
+            q_table, visits = train_shard(args.shard, shards, args.episodes, seed, n_envs=args.envs or 1000)
+            print(f"Shard saved to {save_shard(q_table, visits, args.shard, shards, args.episodes, seed)}")
+            return q_table
+        q_table, _ = train_sharded(args.episodes, shards, seed, n_envs=args.envs or 1000, n_workers=args.workers)
+        print(f"SHA-256: {digest(q_table)}")
+        return q_table
+
+    if args.engine == "league":
+        from models.league import train_league
+        return train_league(total_episodes=args.episodes, n_envs=args.envs or 500, n_workers=args.workers, seed=args.seed,
+                            plot=not args.no_plot, backend=args.backend)[0]
+
+    if args.engine == "dyna":
+        from models.dyna_model import train_dyna_q
+        return train_dyna_q(q_table=q_table, total_episodes=args.episodes, planning_steps=500 if args.planning_steps is None else args.planning_steps,
+                            seed=args.seed, start_episode=start_episode, plot=not args.no_plot, backend=args.backend)[0]
+
+    if args.engine == "batched":
+        from models.batch_model import train_q_learning_batched
+        from utils.traces import TraceRecorder
+        with TraceRecorder(args.trace, model="batched", seed=args.seed, start_episode=start_episode) if args.trace else nullcontext() as recorder:
+            return train_q_learning_batched(q_table=q_table, total_episodes=args.episodes, n_envs=args.envs or 1000, seed=args.seed,
+                                            start_episode=start_episode, plot=not args.no_plot,
+                                            checkpoint_every=args.checkpoint_every, save_csv=args.csv, backend=args.backend,
+                                            recorder=recorder)
+
+    from models.Q_Learning_model import QLearningAgent
+    from utils.metrics import TrainingMetrics, PlotSink
+    model = QLearningAgent(total_episodes=args.episodes, backend=args.backend)
+    if q_table is not None:
+        model.q_table = q_table
+    metrics = TrainingMetrics(capacity=args.episodes // 100 + 1, action_names=model.action_names)
+    if not args.no_plot:
+        metrics.subscribe(PlotSink())
+    return model.train_q_learning(checkpoint_every=args.checkpoint_every, save_csv=args.csv, metrics=metrics,
+                                  eval_games=args.eval_games, trace_path=args.trace, start_episode=start_episode)
+
+def print_result(args, trained):
+    """Prints the result of a training run (Q-table coverage, or win rate of the function approximators)."""
+    from utils.helpers import analyze_q_table
+    if args.engine == "tile":
+        wins, rewards = trained.evaluate(1000, seed=args.seed)
+        print(f"Win rate: {wins.mean():.3f}, average reward: {rewards.mean():.1f} (weights in ./out/tile_coding.qtab)")
+    elif args.engine == "dqn":
+        from src.eval import evaluate_agent
+        wins, rewards, _ = evaluate_agent(None, 1000, seed=args.seed, plot=False, progress=False, model=trained)
+        print(f"Win rate: {wins.mean():.3f}, average reward: {rewards.mean():.1f} (network in ./out/dqn.qtab)")
+    else:
+        print(analyze_q_table(trained))
+
+def cmd_train(args):
+    """3) Train (Q-Table) from scratch"""
+    print_result(args, train(args))
+
+def cmd_resume(args):
+    """4) Train with existing Q-Table"""
+    from models.q_table import convert_q_table
+    from utils.checkpoint import read_header, load_q_table, MAGIC
+
+    with open(args.path, "rb") as f:
+        is_checkpoint = f.read(len(MAGIC)) == MAGIC
+    header = read_header(args.path)[0] if is_checkpoint else {}
+    if header.get("model") == "dqn" and args.engine != "dqn":
+        sys.exit(f"{args.path} is a DQN checkpoint, resume it with --engine dqn.")
+    if args.engine == "dqn" and header.get("model") != "dqn":
+        sys.exit(f"{args.path} is not a DQN checkpoint.")
+    if args.engine == "dqn":
+        print_result(args, train(args, start_episode=header.get("episodes") or 0))
+        return
+    q_table = convert_q_table(load_q_table(args.path), args.backend)  # Copy, the checkpoint is mapped read-only
+    print_result(args, train(args, q_table=q_table, start_episode=header.get("episodes") or 0))
+
+def load_evaluated(path):
+    """Q-table and `model` argument of the evaluation for a saved file (a DQN checkpoint plays with its network)."""
+    from utils.checkpoint import read_header, load_q_table, MAGIC
+    with open(path, "rb") as f:
+        is_checkpoint = f.read(len(MAGIC)) == MAGIC
+    if is_checkpoint and read_header(path)[0].get("model") == "dqn":
+        from models.dqn_model import DQNAgent
+        return None, DQNAgent.load(path)
+    return load_q_table(path), None
+
+def cmd_evaluate(args):
+    """5) Evaluate Q-Table"""
+    from src.eval import evaluate_agent, evaluate_sequential
+    from utils.checkpoint import load_q_table
+    q_table, model = load_evaluated(args.path)
+    if args.target_width is not None or args.baseline is not None:  # Sequential, stops early
+        if model is not None and args.baseline:
+            sys.exit("--baseline compares two Q-tables, it does not work with a DQN checkpoint.")
+        baseline = load_q_table(args.baseline) if args.baseline else None
+        report = evaluate_sequential(q_table, baseline, target_width=args.target_width or 0.1,
+                                     alpha=args.alpha, max_episodes=args.episodes, seed=args.seed, model=model)
+        low, high = report["ci"]
+        print(f"Win rate: {report['win_rate']:.3f} ({low:.3f} - {high:.3f}) after {report['games']} games: {report['decision']}")
+        if baseline is not None:
+            print(f"Baseline win rate: {report['baseline_win_rate']:.3f}, difference {report['difference']:+.3f} (p = {report['p_value']:.2g})")
+        return
+    win_rates, rewards, _ = evaluate_agent(q_table, total_episodes=args.episodes, n_workers=args.workers, seed=args.seed,
+                                           plot=not args.no_plot, trace_path=args.trace, model=model)
+    print(f"Win rate: {win_rates.mean():.3f}, average reward: {rewards.mean():.1f} ({args.episodes} games)")
+
+def cmd_analyze(args):
+    """Prints the coverage of a saved Q-Table (non-zero entries and visited states)"""
+    from utils.helpers import analyze_q_table
+    from utils.checkpoint import load_q_table
+    print(analyze_q_table(load_q_table(args.path)))
+
+def cmd_traces(args):
+    """Summarizes a trace file (memory-mapped, see utils/traces.py)"""
+    import json
+    from utils.traces import load_traces, summarize_traces, trace_runs
+    traces, header = load_traces(args.path)
+    print(json.dumps({"runs": trace_runs(header), **summarize_traces(traces)}, indent=2))
+
+def cmd_merge(args):
+    """Merges the shards of a sharded run (visit-weighted) into ./out/q_table.qtab"""
+    from models.model import encoder, action_names
+    from models.sharded import load_shards, merge_shards, digest
+    from utils.checkpoint import save_checkpoint
+    q_tables, visits, header = load_shards(args.dir)
+    q_table, _ = merge_shards(q_tables, visits)
+    save_checkpoint(q_table, buckets=encoder.buckets, action_names=action_names, episodes=header["total_episodes"],
+                    model="sharded", n_shards=header["n_shards"], seed=header["seed"])
+    print(f"Merged {header['n_shards']} shards, SHA-256: {digest(q_table)}")
+
+def cmd_sweep(args):
+    """7) Hyperparameter sweep (successive halving, results in ./out/sweep_results.jsonl)"""
+    from models.sweep import successive_halving
+    best_config, best_metrics = successive_halving(n_configs=args.configs, min_episodes=args.min_episodes,
+                                                   n_workers=args.workers, seed=args.seed)
+    print(best_config, best_metrics)
+
+def cmd_tournament(args):
+    """8) Headless tournament (Q-Table vs scripted policy or other Q-Table)"""
+    from src.tournament import make_player, run_tournament, print_report
+    try:
+        player1, player2 = make_player(args.player1), make_player(args.player2)
+    except ValueError as error:  # e.g. "mcts:0" or a Q-table with other buckets
+        sys.exit(str(error))
+    report = run_tournament(player1, player2, n_games=args.games, limit=args.limit, seed=args.seed)
+    print_report(report, args.player1, args.player2)
+
+def cmd_serve(args):
+    """Game server for concurrent sessions (JSON lines over TCP, see src/server.py)"""
+    from src.server import serve
+    from models.policy import GreedyPolicy
+    serve(GreedyPolicy.load(args.path), host=args.host, port=args.port, pace_ms=args.pace_ms,
+          batch_window_ms=args.batch_window_ms)
+
+def cmd_export(args):
+    """Exports the greedy policy of a Q-table (uint8 action per state) for playing and serving"""
+    from models.policy import GreedyPolicy
+    policy = GreedyPolicy.load(args.path)
+    policy.save(args.out, source=args.path)
+    print(f"Exported the policy of {args.path} to {args.out} ({len(policy)} states, {int(policy.tied.sum())} tied)")
+
+def cmd_bench(args):
+    """Benchmark suite against the JSON baseline in ./out (exit code 1 on regressions)"""
+    from utils.benchmark import check
+    ok = check(args.only or None, scale=args.scale, repeat=args.repeat, baseline=args.baseline,
+               tolerance=args.tolerance, save_baseline=args.save_baseline)
+    return 0 if ok else 1
+
+def cmd_startup(args):
+    """Measures the cold-start import time of the subcommands against `startup_budget_ms`."""
+    import subprocess
+
+    script = ("import sys, time; t = time.perf_counter(); import {modules}; "
+              "print((time.perf_counter() - t) * 1000, ','.join(m for m in {heavy!r} if m in sys.modules))")
+    unknown = [command for command in args.commands if command not in command_modules]
+    if unknown:
+        raise SystemExit(f"No startup budget for: {', '.join(unknown)}")
+
+    over_budget = False
+    for command in args.commands or list(command_modules):
+        code = script.format(modules=", ".join(command_modules[command]), heavy=heavy_modules)
+        timings = []
+        for _ in range(args.repeat):
+            output = subprocess.run([sys.executable, "-c", code], capture_output=True, text=True, check=True).stdout.split()
+            timings.append(float(output[0]))
+        loaded = output[1] if len(output) > 1 else ""
+        best, budget = min(timings), startup_budget_ms[command]
+        ok = best <= budget and not loaded
+        over_budget |= not ok
+        print(f"{command:<11} {best:7.1f} ms (budget {budget} ms){'' if ok else '  OVER'}"
+              f"{'  loads ' + loaded if loaded else ''}")
+    return 1 if over_budget else 0
+
+#---------------------------------------------------------*/
+# Command Line
+#---------------------------------------------------------*/
+def build_parser():
+    parser = argparse.ArgumentParser(description="Kingdom Game: play, train and evaluate Q-learning agents.")
+    parser.add_argument("--profile", nargs="?", const="./out/profile.json", default=None, metavar="PATH",
+                        help="time the hot path (take_turn, run_episode, ...) and write a JSON report")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    play = subparsers.add_parser("play", help="play a game")
+    play.add_argument("--opponent", choices=["human", "machine", "solver", "mcts"], default="machine")
+    play.add_argument("--budget-ms", type=int, default=75, help="search time per move of the MCTS opponent")
+    play.add_argument("--limit", type=int, default=50, help="number of rounds before a draw")
+    play.set_defaults(handler=cmd_play)
+
+    subparsers.add_parser("simulate", help="watch a simulated random game").set_defaults(handler=cmd_simulate)
+
+    for name, handler, help_text in (("train", cmd_train, "train a Q-table from scratch"),
+                                     ("resume", cmd_resume, "continue training a saved Q-table")):
+        train_parser = subparsers.add_parser(name, help=help_text)
+        engines = ["agent", "batched", "dyna", "league", "sharded", "tile", "dqn"] if name == "train" else ["agent", "batched", "dyna", "dqn"]
+        train_parser.add_argument("--engine", choices=engines, default="agent",
+                                  help="QLearningAgent, lockstep batched training, Dyna-Q, self-play league, seeded shards, tile coding (train only) or DQN")
+        train_parser.add_argument("--episodes", type=int, default=10000)
+        train_parser.add_argument("--backend", choices=["numpy", "dense", "sparse"], default="numpy",
+                                  help="Q-table storage: float64 array, dense float32 or sparse (models/q_table.py)")
+        train_parser.add_argument("--envs", type=int, default=None, help="parallel games (batched/sharded: 1000, league: 500, tile: 20, dqn: 16)")
+        train_parser.add_argument("--seed", type=int, default=None, help="seed (all engines except agent)")
+        train_parser.add_argument("--workers", type=int, default=None, help="processes for league matches / shards (league, sharded; default: all cores)")
+        train_parser.add_argument("--shards", type=int, default=None, help="number of shards (sharded, default: 4)")
+        train_parser.add_argument("--shard", type=int, default=None, help="train only this shard into ./out/shards (sharded)")
+        train_parser.add_argument("--planning-steps", type=int, default=None, help="planned cells per real step (dyna, default: 500)")
+        train_parser.add_argument("--checkpoint-every", type=int, default=None)
+        train_parser.add_argument("--eval-games", type=int, default=None,
+                                  help="games per evaluation point in a background process (agent engine)")
+        train_parser.add_argument("--trace", default=None, metavar="PATH", help="record every turn in a trace file (agent, batched)")
+        train_parser.add_argument("--csv", action="store_true", help="also export the Q-table as CSV")
+        train_parser.add_argument("--no-plot", action="store_true")
+        if name == "resume":
+            train_parser.add_argument("--path", default="./out/q_table.qtab")
+        train_parser.set_defaults(handler=handler)
+
+    evaluate = subparsers.add_parser("evaluate", help="evaluate a saved Q-table or DQN checkpoint")
+    evaluate.add_argument("--path", default="./out/q_table.qtab")
+    evaluate.add_argument("--episodes", type=int, default=1000, help="games (maximum of a sequential evaluation)")
+    evaluate.add_argument("--target-width", type=float, default=None, help="stop when the CI of the win rate is this narrow")
+    evaluate.add_argument("--baseline", default=None, help="stop when better / worse than this Q-table is decided")
+    evaluate.add_argument("--alpha", type=float, default=0.05, help="error rate of the sequential evaluation")
+    evaluate.add_argument("--workers", type=int, default=None, help="worker processes (default: all cores)")
+    evaluate.add_argument("--seed", type=int, default=None)
+    evaluate.add_argument("--trace", default=None, metavar="PATH", help="record every turn in a trace file (fixed number of games)")
+    evaluate.add_argument("--no-plot", action="store_true")
+    evaluate.set_defaults(handler=cmd_evaluate)
+
+    analyze = subparsers.add_parser("analyze", help="print the coverage of a saved Q-table")
+    analyze.add_argument("--path", default="./out/q_table.qtab")
+    analyze.set_defaults(handler=cmd_analyze)
+
+    traces = subparsers.add_parser("traces", help="summarize a trace file")
+    traces.add_argument("path", nargs="?", default="./out/traces.ktrace")
+    traces.set_defaults(handler=cmd_traces)
+
+    merge = subparsers.add_parser("merge", help="merge the shards of a sharded run")
+    merge.add_argument("--dir", default="./out/shards")
+    merge.set_defaults(handler=cmd_merge)
+
+    sweep = subparsers.add_parser("sweep", help="hyperparameter sweep (successive halving)")
+    sweep.add_argument("--configs", type=int, default=27)
+    sweep.add_argument("--min-episodes", type=int, default=1000)
+    sweep.add_argument("--workers", type=int, default=None)
+    sweep.add_argument("--seed", type=int, default=None)
+    sweep.set_defaults(handler=cmd_sweep)
+
+    tournament = subparsers.add_parser("tournament", help="headless games between two players")
+    tournament.add_argument("player1", nargs="?", default="./out/q_table.qtab", help="checkpoint, scripted policy, mcts or mcts:ITERATIONS")
+    tournament.add_argument("player2", nargs="?", default="random", help="checkpoint, scripted policy, mcts or mcts:ITERATIONS")
+    tournament.add_argument("--games", type=int, default=10000)
+    tournament.add_argument("--limit", type=int, default=50)
+    tournament.add_argument("--seed", type=int, default=None)
+    tournament.set_defaults(handler=cmd_tournament)
+
+    serve = subparsers.add_parser("serve", help="host concurrent games over TCP (human vs. AI, AI vs. AI)")
+    serve.add_argument("--path", default="./out/q_table.qtab", help="Q-table or exported policy")
+    serve.add_argument("--host", default="127.0.0.1")
+    serve.add_argument("--port", type=int, default=8765)
+    serve.add_argument("--pace-ms", type=float, default=0, help="delay after every move of a session")
+    serve.add_argument("--batch-window-ms", type=float, default=2, help="how long AI moves of all sessions are collected")
+    serve.set_defaults(handler=cmd_serve)
+
+    export = subparsers.add_parser("export", help="export the greedy policy of a Q-table")
+    export.add_argument("--path", default="./out/q_table.qtab")
+    export.add_argument("--out", default="./out/policy.qpol")
+    export.set_defaults(handler=cmd_export)
+
+    bench = subparsers.add_parser("bench", help="run the benchmark suite and compare it with the baseline")
+    bench.add_argument("--only", nargs="+", metavar="NAME", help="run only these benchmarks")
+    bench.add_argument("--scale", type=float, default=1.0, help="workload size factor (e.g. 0.1 for a quick run)")
+    bench.add_argument("--repeat", type=int, default=3, help="repetitions per benchmark (best is reported)")
+    bench.add_argument("--baseline", default="./out/benchmark_baseline.json")
+    bench.add_argument("--tolerance", type=float, default=0.2, help="allowed slowdown (0.2 = 20%%)")
+    bench.add_argument("--save-baseline", action="store_true", help="store the results as new baseline")
+    bench.set_defaults(handler=cmd_bench)
+
+    startup = subparsers.add_parser("startup", help="measure the cold-start time of the subcommands")
+    startup.add_argument("commands", nargs="*", metavar="command", help=f"any of {', '.join(command_modules)} (default: all)")
+    startup.add_argument("--repeat", type=int, default=3, help="best of N fresh interpreters")
+    startup.set_defaults(handler=cmd_startup)
+
+    return parser
+
+def check_train_args(parser, args):
+    """Rejects options the chosen engine does not support and shard numbers outside the run."""
+    for option, engines in engine_options.items():
+        value = getattr(args, option)
+        given = value is not None and value is not False and value != "numpy"  # `is`: 0 is a given value
+        if given and args.engine not in engines:
+            parser.error(f"--{option.replace('_', '-')} is not supported by --engine {args.engine}")
+    shards = args.shards or 4
+    if args.shards is not None and args.shards < 1:
+        parser.error("--shards must be at least 1")
+    if args.shard is not None and not 0 <= args.shard < shards:
+        parser.error(f"--shard must be between 0 and {shards - 1} (--shards {shards})")
+
+def main(argv=None):
+    parser = build_parser()
+    args = parser.parse_args(argv)
+    if hasattr(args, "engine"):
+        check_train_args(parser, args)
+    if not args.profile:
+        return args.handler(args) or 0
+
+    from utils.profiler import Profiler, print_report
+    with Profiler() as profiler:
+        status = args.handler(args) or 0
+    print_report(profiler.save(args.profile))
+    return status
 
 #---------------------------------------------------------*/
 # Main-Loop
 #---------------------------------------------------------*/
 
 if __name__ == "__main__":
-    
-    model = QLearningAgent(total_episodes=10000)
-    
-    choice = 3
-    
-    # 1) Nornal game (against human or machine)
-    if choice == 1:  
-        game(opponent="machine")  # human / machine1
-    
-    # 2) Simulated game
-    elif choice == 2: 
-        simulated_game()  
-
-    # 3) Train (Q-Table) from scratch
-    elif choice == 3:
-        trained_q_table = model.train_q_learning()
-        result = analyze_q_table(trained_q_table)
-        print(result)
-    
-    # 4) Train with existing Q-Table
-    elif choice == 4: 
-        q_table_loaded = np.load("./out/q_table.npy")
-        trained_q_table = model.train_q_learning(q_table=q_table_loaded, total_episodes=10000, epsilon=0, alpha=0)
-        
-    # 5) Evaluate Q-Table
-    elif choice == 5:
-        q_table_loaded = np.load("./out/q_table.npy")
-        evaluate_agent(q_table_loaded, total_episodes=1000)
+    sys.exit(main())
 
 # -------------------------Notes-----------------------------------------------*\
 #
-# -----------------------------------------------------------------------------*\
\ No newline at end of file
+# -----------------------------------------------------------------------------*\
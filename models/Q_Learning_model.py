@@ -7,15 +7,19 @@
 import numpy as np
 import math
 from src.Kingdom import Kingdom
-from utils.plotting import plot_evaluation
 from tqdm import tqdm
-from src.eval import evaluation_game
+from src.eval import evaluation_game, BackgroundEvaluator
+from models.state_encoder import StateEncoder
+from models.q_table import make_q_table
+from utils.checkpoint import save_checkpoint, export_csv
+from utils.metrics import TrainingMetrics, PlotSink
+from utils.traces import TraceRecorder, attack_outcome
 
 PRINTER = False # Print list of actions-frequencies and win-rates atfer training
 
 class QLearningAgent:
     
-    def __init__(self, total_episodes=1000, max_turns=50):
+    def __init__(self, total_episodes=1000, max_turns=50, backend="numpy"):
         # Discretization parameters - these could be adjusted to tune the learning process
         
         self.castle_strength_buckets = 3  # e.g., [0-20], [21-40], ..., [81-100]
@@ -27,7 +31,10 @@ class QLearningAgent:
         
         # Total number of states (Squared for both Kingdoms)
         self.n_states = (self.castle_strength_buckets * self.resource_buckets * self.soldier_buckets) ** 2
-        self.q_table = np.zeros((self.n_states, self.n_actions))
+        self.q_table = make_q_table(self.n_states, self.n_actions, backend)  # "numpy", "dense" or "sparse"
+
+        # Precomputed lookup tables for the discretization
+        self.encoder = StateEncoder(self.castle_strength_buckets, self.resource_buckets, self.soldier_buckets)
 
         # Placeholder variables for the learning rate, discount factor, and exploration rate
         self.alpha = 0.9  # Learning rate
@@ -48,25 +55,19 @@ class QLearningAgent:
     # ---------------------------------------------------------*/
     def discretize_state(self, kingdom):
         """Discretizes the state of a kingdom into predefined buckets for Q-learning. """
-        castle_strength = min(int(kingdom.castle_strength / (100 / self.castle_strength_buckets)), self.castle_strength_buckets - 1)
-        resources = min(int(kingdom.resources / (75 / self.resource_buckets)), self.resource_buckets - 1)
-        soldiers = min(int(kingdom.soldiers / (75 / self.soldier_buckets)), self.soldier_buckets - 1)
-        return castle_strength, resources, soldiers
+        return self.encoder.discretize(kingdom)
 
     def get_state_index(self, state1, state2):
         """The function combines the discretized states of two kingdoms (A and B) into a single index 
         for a Q-table in a reinforcement learning environment. It scales the index of Kingdom A's state 
         by the total number of possible states for a single kingdom, then adds the index of Kingdom B's 
         state, ensuring a unique index for every possible state combination."""
-        state1_index = (state1[0] * (self.resource_buckets * self.soldier_buckets) + state1[1] * self.soldier_buckets + state1[2])
-        state1_index *= self.castle_strength_buckets * self.resource_buckets * self.soldier_buckets
-        state2_index = (state2[0] * (self.resource_buckets * self.soldier_buckets) + state2[1] * self.soldier_buckets + state2[2])
-        return state1_index + state2_index
+        return self.encoder.index(state1, state2)
 
     def choose_action(self, state_index, epsilon):
         """Function to choose an action, using epsilon-greedy policy"""
         if np.random.random() < epsilon:
-            return np.random.choice([0, 1, 2, 3])
+            return np.random.randint(4)
         else:
             return np.argmax(self.q_table[state_index])
 
@@ -140,13 +141,13 @@ class QLearningAgent:
         opponent, chooses an action, and updates the Q-table. It returns a boolean indicating whether
         the game is over."""
         # Store the previous states
-        prev_state1 = self.discretize_state(kingdom)
-        prev_state2 = self.discretize_state(opponent)
+        prev_state1 = self.encoder.discretize(kingdom)
+        prev_state2 = self.encoder.discretize(opponent)
         
-        state_index = self.get_state_index(prev_state1, prev_state2)
+        state_index = self.encoder.encode(kingdom, opponent)
 
         # Kingdom takes its turn
-        action = self.choose_action(self.q_table, self.state_index, self.epsilon)
+        action = self.choose_action(state_index, epsilon)
         
         # Handle and execute the different actions
         attack_outcome = None
@@ -162,9 +163,9 @@ class QLearningAgent:
             attack_outcome, _ = kingdom.attack(opponent)
 
         # Store the current states
-        curr_state1 = self.discretize_state(kingdom)
-        curr_state2 = self.discretize_state(opponent)
-        next_state_index = self.get_state_index(curr_state1, curr_state2)
+        curr_state1 = self.encoder.discretize(kingdom)
+        curr_state2 = self.encoder.discretize(opponent)
+        next_state_index = self.encoder.encode(kingdom, opponent)
 
         # Calculate the reward based on the action taken and the outcome
         reward = self.get_reward(prev_state1, prev_state2, curr_state1, curr_state2, action, attack_outcome, kingdom, opponent)
@@ -175,12 +176,12 @@ class QLearningAgent:
             print(f"{kingdom.name} takes action: {action_names[action]} | State: {prev_state1}, Opponent State: {prev_state2} | Reward: {reward}")
 
         # Update the Q-table
-        self.update_q_table(self.q_table, self.state_index, self.action, self.reward, self.next_state_index, self.alpha, self.gamma)
+        self.update_q_table(state_index, action, reward, next_state_index)
 
         # Check if game is done
         return (kingdom.castle_strength <= 0 or opponent.castle_strength <= 0, reward, action)
 
-    def run_episode(self, epsilon):
+    def run_episode(self, epsilon, recorder=None, episode=0):
         """
         The function simulates turns between two kingdoms, `Kingdom A` and `Kingdom B`. `Kingdom A` uses the Q-table 
         for decision-making, while `Kingdom B` takes random actions. The episode ends when either a terminal state 
@@ -192,6 +193,7 @@ class QLearningAgent:
         - `gamma` (float, optional): The discount factor. Balances the importance of immediate and future rewards.
         - `epsilon` (float, optional): The exploration rate. Determines the probability of taking a random action for exploration.
         - `max_turns` (int, optional): The maximum number of turns for the episode. Helps in terminating the episode to avoid infinite loops.
+        - `recorder` (TraceRecorder, optional): Records every turn under the id `episode` (see utils/traces.py).
         """
         kingdom1 = Kingdom("Kingdom A")
         kingdom2 = Kingdom("Kingdom B")
@@ -200,51 +202,79 @@ class QLearningAgent:
         turn_count = 0
         
         while not done:
-            done, _, _ = self.take_turn(kingdom1, kingdom2, epsilon)
+            state = kingdom1.state + kingdom2.state if recorder is not None else None
+            done, reward, action = self.take_turn(kingdom1, kingdom2, epsilon)
+            if recorder is not None:
+                recorder.record(episode, turn_count, 0, action, state, reward, attack_outcome(action, state, kingdom2))
             turn_count += 1
             
             if done or turn_count >= self.max_turns:
                 break
-            done, _, _ = self.take_turn(kingdom2, kingdom1, epsilon)
+            state = kingdom2.state + kingdom1.state if recorder is not None else None
+            done, reward, action = self.take_turn(kingdom2, kingdom1, epsilon)
+            if recorder is not None:
+                recorder.record(episode, turn_count, 1, action, state, reward, attack_outcome(action, state, kingdom1))
             turn_count += 1
             
         return self.q_table
 
-    def train_q_learning(self):
+    def train_q_learning(self, checkpoint_every=None, save_csv=False, metrics=None, eval_games=None, trace_path=None,
+                         start_episode=0):
         """
         Train a Q-learning agent over a specified number of episodes.
 
         Parameters:
         - `total_episodes` (int): The total number of episodes for training the agent.
         - `q_table` (numpy.ndarray): The initial Q-table to be used and updated during training.
+        - `checkpoint_every` (int, optional): Write a checkpoint every N episodes (atomically replaced).
+        - `save_csv` (bool): Additionally export the trained Q-table as CSV (slow for large tables).
+        - `metrics` (TrainingMetrics, optional): Receives the evaluation points (default: plotted at the end).
+        - `eval_games` (int, optional): Evaluate every 100 episodes with this many games in a background
+          process (`BackgroundEvaluator`) instead of one `evaluation_game` in the training loop.
+        - `trace_path` (str, optional): Record every turn of the training episodes in this trace file
+          (see utils/traces.py).
+        - `start_episode` (int): Episodes already trained on the Q-table (resumed training), counted in
+          the checkpoints and the trace metadata.
 
         The function runs multiple episodes of Q-learning, updates the Q-table, and evaluates the agent's performance 
-        periodically. After training, the function saves the trained Q-table in both CSV and NPY formats and plots 
-        the win rate and average reward over time.
+        periodically. After training, the function saves the trained Q-table as checkpoint (see utils/checkpoint.py)
+        and plots the win rate and average reward over time.
         """
-        win_rates = []
-        average_rewards = []
-        action_freqs_total = []
+        if metrics is None:
+            metrics = TrainingMetrics(capacity=self.total_episodes // 100 + 1, action_names=self.action_names).subscribe(PlotSink())
         epsilon = self.epsilon_start
+        evaluator = BackgroundEvaluator(self.q_table, eval_games) if eval_games else None
+        recorder = TraceRecorder(trace_path, model="agent", start_episode=start_episode) if trace_path else None
+
+        try:
+            for episode in tqdm(range(self.total_episodes)):
+                self.run_episode(epsilon, recorder, episode)
+                epsilon = max(self.epsilon_min, self.epsilon_decay_rate * epsilon)
 
-        for episode in tqdm(range(self.total_episodes)):
-            self.run_episode(epsilon)
-            epsilon = max(self.epsilon_min, self.epsilon_decay_rate * epsilon)
+                if episode % 100 == 0 and evaluator:  # Snapshot for the background evaluation
+                    evaluator.submit(episode, self.q_table)
+                    for point in evaluator.poll():
+                        metrics.record(*point)
+                elif episode % 100 == 0:  # Evaluate every 100 episodes
+                    win_rate, avg_reward, action_freq = evaluation_game(self.q_table)
+                    metrics.record(episode, win_rate, avg_reward, action_freq)
+                    # print(f"Episode: {episode}, Win Rate: {win_rate}, Average Reward: {avg_reward}")
 
-            if episode % 100 == 0:  # Evaluate every 100 episodes
-                win_rate, avg_reward, action_freq = evaluation_game(self.q_table)
-                win_rates.append(win_rate)
-                average_rewards.append(avg_reward)
-                action_freqs_total.append(action_freq)
-                # print(f"Episode: {episode}, Win Rate: {win_rate}, Average Reward: {avg_reward}")
+                if checkpoint_every and (episode + 1) % checkpoint_every == 0:
+                    save_checkpoint(self.q_table, buckets=self.encoder.buckets, action_names=self.action_names, episodes=start_episode + episode + 1)
+        finally:
+            recorder.close() if recorder else None
+            for point in (evaluator.close() if evaluator else []):
+                metrics.record(*point)
         
-        print(win_rates) if PRINTER else None
-        print(action_freqs_total) if PRINTER else None
+        print(metrics.view()[1]) if PRINTER else None
+        print(metrics.view()[3]) if PRINTER else None
     
         # Save the Q-table and plot results
-        np.savetxt("./out/q_table.csv", self.q_table, delimiter=",")
-        np.save("./out/q_table.npy", self.q_table)
-        plot_evaluation(action_freqs_total, win_rates, average_rewards)
+        save_checkpoint(self.q_table, buckets=self.encoder.buckets, action_names=self.action_names, episodes=start_episode + self.total_episodes)
+        if save_csv:
+            export_csv(self.q_table)
+        metrics.close()
 
         return self.q_table
 
@@ -0,0 +1,337 @@
+#---------------------------------------------------------*\
+# Title: Batched Tabular Q Learning (many episodes in lockstep)
+# Author:
+#---------------------------------------------------------*/
+#!/usr/bin/env python3
+
+import math
+import numpy as np
+from tqdm import tqdm
+from src.KingdomBatch import KingdomBatch
+from models.model import (encoder, n_actions, alpha, gamma, epsilon_start, epsilon_min, max_turns, action_names)
+from utils.metrics import TrainingMetrics, PlotSink
+from utils.checkpoint import save_checkpoint, export_csv
+from models.q_table import make_q_table, scatter_add
+
+PRINTER = False # Print list of actions-frequencies and win-rates atfer training
+
+#---------------------------------------------------------*/
+# Functions (Helper)
+#---------------------------------------------------------*/
+def choose_actions(q_table, state_indices, epsilon, rng):
+    """Epsilon-greedy policy for a whole batch of states (ties are broken like `np.argmax`)."""
+    actions = np.argmax(q_table[state_indices], axis=1)
+    explore = rng.random(len(state_indices)) < epsilon
+    actions[explore] = rng.integers(0, n_actions, np.count_nonzero(explore))
+    return actions
+
+def get_rewards(prev_state1, cur_state1, actions, attack_success, kingdom, opponent):
+    """Vectorized `get_reward`. The rules are taken over unchanged, including that action 0 is
+    checked against the attack outcome (which is always missing, i.e. failed, for gathering)."""
+    # Define the reward values (these can be adjusted)
+    reward_for_winning = 100
+    penalty_for_lack_of_rsrc = -5
+    penalty_for_failed_attack = -10
+
+    rewards = np.zeros(len(actions))
+    rewards += np.where((actions == 2) & (cur_state1[2] == prev_state1[2]), penalty_for_lack_of_rsrc, 0)
+    rewards += np.where((actions == 3) & (cur_state1[0] == prev_state1[0]), penalty_for_lack_of_rsrc, 0)
+    rewards += np.where((actions == 0) & ~attack_success, penalty_for_failed_attack, 0)
+
+    # Check if the game has ended with the agent's victory
+    rewards += np.where((kingdom.castle_strength > 0) & (opponent.castle_strength <= 0), reward_for_winning, 0)
+    return rewards
+
+def update_q_table_batch(q_table, state_indices, actions, rewards, next_state_indices, alpha, gamma, visits=None):
+    """
+    Batched version of `update_q_table`. All TD errors are computed against the Q-table as it was
+    before the batch. Several episodes can hit the same (state, action) cell in one step; these
+    conflicting writes are resolved by applying the mean of their TD errors once:
+
+    Q(s, a) += α * mean_i(R_i + γ * max(Q(s'_i, a')) - Q(s, a))
+
+    `visits` (optional, int64 array of the shape of the Q-table) counts the updates per cell.
+    """
+    td_target = rewards + gamma * np.max(q_table[next_state_indices], axis=1)
+    td_delta = td_target - q_table[state_indices, actions]
+
+    # Accumulate the TD errors per (state, action) cell and apply their mean
+    cells, inverse = np.unique(state_indices * n_actions + actions, return_inverse=True)
+    counts = np.bincount(inverse)
+    mean_delta = np.bincount(inverse, weights=td_delta) / counts
+    if visits is not None:
+        visits.reshape(-1)[cells] += counts
+    scatter_add(q_table, cells // n_actions, cells % n_actions, alpha * mean_delta)
+
+#---------------------------------------------------------*/
+# Functions (Main)
+#---------------------------------------------------------*/
+def take_turns(kingdom, opponent, mask, q_table, alpha, gamma, epsilon, rng, encoder=encoder, visits=None):
+    """Batched `take_turn`: every game selected by `mask` chooses an action, executes it and (if
+    `alpha` > 0) updates the Q-table. Returns the done flags, rewards and actions of all games."""
+    prev_state1 = encoder.discretize_batch(kingdom)
+    state_indices = encoder.encode_batch(kingdom, opponent)
+
+    actions = choose_actions(q_table, state_indices, epsilon, rng)
+    attack_success, _ = kingdom.step(actions, opponent, mask)
+
+    curr_state1 = encoder.discretize_batch(kingdom)
+    next_state_indices = encoder.encode_batch(kingdom, opponent)
+
+    rewards = get_rewards(prev_state1, curr_state1, actions, attack_success, kingdom, opponent)
+
+    if alpha:
+        update_q_table_batch(q_table, state_indices[mask], actions[mask], rewards[mask],
+                             next_state_indices[mask], alpha, gamma, visits)
+
+    done = mask & (kingdom.is_defeated() | opponent.is_defeated())
+    return done, rewards, actions
+
+def batch_states(kingdom, opponent):
+    """Raw attributes of both sides (6 x n, `kingdom` first), e.g. the states before a turn."""
+    return np.stack([kingdom.castle_strength, kingdom.resources, kingdom.soldiers,
+                     opponent.castle_strength, opponent.resources, opponent.soldiers])
+
+def record_turns(recorder, episode_ids, turn_count, actor, mask, actions, states, rewards, opponent):
+    """Records the turn of the games selected by `mask` (`states` from before the turn). A successful
+    attack always lowers the castle strength of the opponent."""
+    attacks = np.where(actions == 3, opponent.castle_strength < states[3], -1)
+    recorder.record_batch(episode_ids[mask], turn_count[mask], actor, actions[mask], states[:, mask], rewards[mask], attacks[mask])
+
+#---------------------------------------------------------*/
+# Lockstep Driver
+#---------------------------------------------------------*/
+class Lockstep:
+    """
+    `n_envs` games of `Kingdom A` against `Kingdom B` played in lockstep until `total_episodes`
+    episodes have finished (draw after `max_turns` turns of both kingdoms together). Finished games
+    are recorded and reset, new ones are only started as long as the budget allows. The batched
+    learners (`train_q_learning_batched`, `TileCodingAgent`, `DQNAgent`) move the kingdoms through
+    callbacks of `run`, which read the games from the attributes of this object.
+
+    Per finished episode, `wins` (1 / 0.5 / 0, as in `evaluation_game`), `rewards` and
+    `actions_taken` hold the result, the summed rewards and the action counts of `Kingdom A`.
+    `episode_ids` numbers the episodes of this run in the order they start.
+    """
+
+    def __init__(self, total_episodes, n_envs, max_turns=max_turns):
+        self.total_episodes = total_episodes
+        self.n_envs = n_envs = min(n_envs, total_episodes)
+        self.max_turns = max_turns
+        self.kingdom1 = KingdomBatch(n_envs, "Kingdom A")
+        self.kingdom2 = KingdomBatch(n_envs, "Kingdom B")
+        self.turn_count = np.zeros(n_envs, dtype=np.int64)
+        self.episode_rewards = np.zeros(n_envs)
+        self.episode_actions = np.zeros((n_envs, n_actions), dtype=np.int64)
+        self.active = np.ones(n_envs, dtype=bool)
+        self.episode_ids = np.arange(n_envs)
+
+        self.wins = np.zeros(total_episodes)
+        self.rewards = np.zeros(total_episodes)
+        self.actions_taken = np.zeros((total_episodes, n_actions), dtype=np.int64)
+        self.started = n_envs
+        self.finished = 0
+
+    def run(self, act, reply, update=None, reset=None, progress=True):
+        """
+        Plays all episodes. Every step:
+
+        - `act(mask)`: `Kingdom A` moves in the live games, returns its done flags, rewards and actions.
+        - `reply(mask)`: `Kingdom B` moves in the games that did not end, returns its done flags.
+        - `update()` (optional): called after both turns, e.g. for replay updates.
+        - `reset(mask)` (optional): called with the games that were just reset (`finished` is updated).
+        """
+        with tqdm(total=self.total_episodes, disable=not progress) as progress_bar:
+            while self.finished < self.total_episodes:
+                active = self.active
+                done, reward1, action1 = act(active)
+                self.turn_count[active] += 1
+                self.episode_rewards[active] += reward1[active]
+                self.episode_actions[active, action1[active]] += 1
+
+                draw = active & ~done & (self.turn_count >= self.max_turns)
+                ended = done | draw
+
+                mask2 = active & ~ended
+                ended |= reply(mask2)
+                self.turn_count[mask2] += 1
+                update() if update is not None else None
+
+                ended_envs = np.flatnonzero(ended)[:self.total_episodes - self.finished]
+                if len(ended_envs):
+                    reset_mask = self._finish(ended_envs, draw[ended_envs])
+                    progress_bar.update(len(ended_envs))
+                    reset(reset_mask) if reset is not None else None
+
+    def _finish(self, ended_envs, draw):
+        """Records the episodes of `ended_envs`, resets their games and starts new episodes in them.
+        Returns the mask of the reset games."""
+        slots = slice(self.finished, self.finished + len(ended_envs))
+        self.wins[slots] = np.where(draw, 0.5, self.kingdom1.castle_strength[ended_envs] >
+                                    self.kingdom2.castle_strength[ended_envs])
+        self.rewards[slots] = self.episode_rewards[ended_envs]
+        self.actions_taken[slots] = self.episode_actions[ended_envs]
+        self.finished += len(ended_envs)
+
+        reset = np.zeros(self.n_envs, dtype=bool)
+        reset[ended_envs] = True
+        self.kingdom1.reset(reset)
+        self.kingdom2.reset(reset)
+        self.turn_count[reset] = 0
+        self.episode_rewards[reset] = 0
+        self.episode_actions[reset] = 0
+
+        # Only start as many new episodes as the budget allows
+        n_new = min(len(ended_envs), self.total_episodes - self.started)
+        self.active[ended_envs[n_new:]] = False
+        self.episode_ids[ended_envs[:n_new]] = self.started + np.arange(n_new)
+        self.started += n_new
+        return reset
+
+def summarize_metrics(metrics, games, first_episode=0, eval_every=100, plot=True, action_names=action_names):
+    """Summarizes blocks of `eval_every` finished episodes of a `Lockstep` run into `metrics` (a new
+    `TrainingMetrics`, plotted if `plot`, when None), numbered from `first_episode`. Returns the
+    closed metrics."""
+    total_episodes = games.total_episodes
+    if metrics is None:
+        metrics = TrainingMetrics(capacity=total_episodes // eval_every + 1, action_names=action_names)
+        metrics.subscribe(PlotSink()) if plot else None
+    blocks = np.arange(0, total_episodes, eval_every)
+    sizes = np.diff(np.append(blocks, total_episodes))
+    metrics.record_batch(first_episode + blocks, np.add.reduceat(games.wins, blocks) / sizes,
+                         np.add.reduceat(games.rewards, blocks) / sizes,
+                         np.rint(np.add.reduceat(games.actions_taken, blocks) / sizes[:, None]))
+    metrics.close()
+    return metrics
+
+#---------------------------------------------------------*/
+# Training Loop
+#---------------------------------------------------------*/
+def train_q_learning_batched(q_table=None, total_episodes=10000, n_envs=1000, epsilon=epsilon_start, alpha=alpha,
+                             gamma=gamma, opponent_epsilon=0.6, max_turns=max_turns, eval_every=100, seed=None,
+                             save=True, plot=True, encoder=encoder, epsilon_min=epsilon_min, epsilon_decay_rate=None,
+                             start_episode=0, progress=True, checkpoint_every=None, save_csv=False, metrics=None,
+                             backend="numpy", opponent=None, visits=None, recorder=None):
+    """
+    Train a Q-learning agent with many episodes running in lockstep.
+
+    Each step, all live episodes let `Kingdom A` act epsilon-greedily and update the Q-table in one
+    batched TD update (see `update_q_table_batch` for the accumulation rule), then `Kingdom B` acts
+    on the same Q-table with `opponent_epsilon` and without updates, as in `run_episode`. Finished
+    episodes are reset automatically until `total_episodes` episodes have been played. Epsilon decays
+    from `epsilon` to `epsilon_min` over `total_episodes` finished episodes (or by `epsilon_decay_rate`
+    per episode, if given).
+
+    Parameters:
+    - `q_table` (numpy.ndarray, optional): The initial Q-table, a new one is created if None.
+    - `total_episodes` (int): The total number of episodes for training the agent.
+    - `n_envs` (int): Number of episodes that are played in lockstep.
+    - `eval_every` (int): Number of finished episodes that are summarized into one data point.
+    - `seed` (int, optional): Seed for the random generator of this run.
+    - `encoder` (StateEncoder): Discretization of the states, defines the size of the Q-table.
+    - `start_episode` (int): Episodes already trained on `q_table`, continues the epsilon decay.
+    - `save` / `plot` (bool): Save the trained Q-table to ./out and plot the statistics.
+    - `metrics` (TrainingMetrics, optional): Receives one point per `eval_every` episodes.
+    - `checkpoint_every` (int, optional): Write a checkpoint every N finished episodes (atomically replaced).
+    - `save_csv` (bool): Additionally export the trained Q-table as CSV (slow for large tables).
+    - `backend` (str): Backend of a new Q-table ("numpy", "dense" or "sparse", see models/q_table.py).
+    - `opponent` (optional): Plays `Kingdom B` instead of the Q-table, an object with
+      `reset(mask, rng)` (new opponents for the selected games) and
+      `take_turns(kingdom, opponent, mask, rng)` returning the done flags (see models/league.py).
+    - `visits` (numpy.ndarray, optional): int64 array of the shape of the Q-table, counts the
+      updates per (state, action) cell (see models/sharded.py).
+    - `recorder` (TraceRecorder, optional): Records every turn of the live episodes, one
+      `record_batch` per step (see utils/traces.py). Episodes are numbered from 0 in the order they
+      start (the recorder keeps `start_episode` in its run metadata). The turns of an `opponent` are not recorded (it returns no actions).
+
+    Win rates, rewards and action frequencies are taken from the finished training episodes
+    (draws count as 0.5, as in `evaluation_game`). Returns the trained Q-table.
+    """
+    if q_table is None:
+        q_table = make_q_table(encoder.n_states, n_actions, backend)
+
+    rng = np.random.default_rng(seed)
+    if epsilon_decay_rate is None:
+        epsilon_decay_rate = math.exp((math.log(epsilon_min) - math.log(epsilon)) / total_episodes)
+
+    games = Lockstep(total_episodes, n_envs, max_turns)
+    opponent.reset(games.active, rng) if opponent is not None else None
+
+    def act(mask):
+        epsilon_now = max(epsilon_min, epsilon * epsilon_decay_rate ** (start_episode + games.finished))
+        states = batch_states(games.kingdom1, games.kingdom2) if recorder is not None else None
+        done, reward1, action1 = take_turns(games.kingdom1, games.kingdom2, mask, q_table, alpha, gamma, epsilon_now,
+                                            rng, encoder, visits)
+        if recorder is not None:
+            record_turns(recorder, games.episode_ids, games.turn_count, 0, mask, action1, states, reward1, games.kingdom2)
+        return done, reward1, action1
+
+    def reply(mask):
+        # Kingdom 2 takes its turn (More random action, no Q-Table Update)
+        if opponent is not None:
+            return opponent.take_turns(games.kingdom2, games.kingdom1, mask, rng)
+        states = batch_states(games.kingdom2, games.kingdom1) if recorder is not None else None
+        done2, reward2, action2 = take_turns(games.kingdom2, games.kingdom1, mask, q_table, 0, gamma, opponent_epsilon,
+                                             rng, encoder)
+        if recorder is not None:
+            record_turns(recorder, games.episode_ids, games.turn_count, 1, mask, action2, states, reward2, games.kingdom1)
+        return done2
+
+    def reset(mask):
+        opponent.reset(mask, rng) if opponent is not None else None
+        before = games.finished - np.count_nonzero(mask)
+        if checkpoint_every and before // checkpoint_every < games.finished // checkpoint_every:
+            save_checkpoint(q_table, buckets=encoder.buckets, action_names=action_names,
+                            episodes=start_episode + games.finished)
+
+    games.run(act, reply, reset=reset, progress=progress)
+    metrics = summarize_metrics(metrics, games, start_episode, eval_every, plot, action_names)
+
+    print(metrics.view()[1]) if PRINTER else None
+    print(metrics.view()[3]) if PRINTER else None
+
+    if save:
+        save_checkpoint(q_table, buckets=encoder.buckets, action_names=action_names, episodes=start_episode + total_episodes)
+    if save_csv:
+        export_csv(q_table)
+
+    return q_table
+
+#---------------------------------------------------------*/
+# Evaluation
+#---------------------------------------------------------*/
+def evaluate_q_table_batched(q_table, n_games=1000, opponent_epsilon=0.1, max_turns=max_turns, seed=None, encoder=encoder):
+    """
+    Plays `n_games` evaluation games at once, with the rules of `evaluation_game`: `Kingdom A` plays
+    greedily, `Kingdom B` uses the same Q-table with `opponent_epsilon`, nothing is updated.
+
+    Returns the wins (1 / 0.5 / 0 per game), the rewards of `Kingdom A` and its action counts (n_games x 4).
+    """
+    rng = np.random.default_rng(seed)
+    kingdom1 = KingdomBatch(n_games, "Kingdom A")
+    kingdom2 = KingdomBatch(n_games, "Kingdom B")
+    active = np.ones(n_games, dtype=bool)
+    draw = np.zeros(n_games, dtype=bool)
+    rewards = np.zeros(n_games)
+    actions_taken = np.zeros((n_games, n_actions), dtype=np.int64)
+    turn_count = 0
+
+    while active.any():
+        done, reward1, action1 = take_turns(kingdom1, kingdom2, active, q_table, 0, gamma, 0, rng, encoder)
+        rewards[active] += reward1[active]
+        actions_taken[active, action1[active]] += 1
+        turn_count += 1
+
+        draw |= active & ~done & (turn_count >= max_turns)
+        active &= ~done & ~draw
+
+        done2, _, _ = take_turns(kingdom2, kingdom1, active, q_table, 0, gamma, opponent_epsilon, rng, encoder)
+        turn_count += 1
+        active &= ~done2
+
+    wins = np.where(draw, 0.5, (kingdom1.castle_strength > kingdom2.castle_strength).astype(float))
+    return wins, rewards, actions_taken
+
+#-------------------------Notes-----------------------------------------------*\
+#
+#-----------------------------------------------------------------------------*\
@@ -0,0 +1,321 @@
+#---------------------------------------------------------*\
+# Title: DQN (NumPy MLP + Experience Replay)
+# Author:
+#---------------------------------------------------------*/
+#!/usr/bin/env python3
+
+import math
+import time
+import numpy as np
+from models.model import encoder, n_actions, max_turns, action_names, play_action
+from models.batch_model import get_rewards, Lockstep, summarize_metrics
+from utils.checkpoint import save_checkpoint, load_checkpoint
+
+#---------------------------------------------------------*/
+# Parameters
+#---------------------------------------------------------*/
+
+# Input normalization: raw attributes of the kingdom and of its opponent divided by their usual range
+feature_scale = np.array([100, 75, 75, 100, 75, 75], dtype=np.float32)
+n_features = len(feature_scale)
+
+default_dqn_path = "./out/dqn.qtab"
+
+def state_features(castle_strength1, resources1, soldiers1, castle_strength2, resources2, soldiers2):
+    """Normalized network input (n x 6, float32) from the raw attribute arrays of both kingdoms."""
+    return np.stack([castle_strength1, resources1, soldiers1, castle_strength2, resources2, soldiers2],
+                    axis=-1).astype(np.float32) / feature_scale
+
+#---------------------------------------------------------*/
+# Replay Buffer
+#---------------------------------------------------------*/
+class ReplayBuffer:
+    """
+    Experience replay in preallocated ring arrays (states, actions, rewards, next states, done
+    flags). Transitions are written as whole batches, once full the oldest are overwritten.
+    """
+
+    def __init__(self, capacity=100000, n_features=n_features):
+        self.capacity = capacity
+        self.states = np.zeros((capacity, n_features), dtype=np.float32)
+        self.actions = np.zeros(capacity, dtype=np.int64)
+        self.rewards = np.zeros(capacity, dtype=np.float32)
+        self.next_states = np.zeros((capacity, n_features), dtype=np.float32)
+        self.dones = np.zeros(capacity, dtype=bool)
+        self.position = 0
+        self.size = 0
+
+    def __len__(self):
+        return self.size
+
+    def add_batch(self, states, actions, rewards, next_states, dones):
+        slots = (self.position + np.arange(len(actions))) % self.capacity
+        self.states[slots] = states
+        self.actions[slots] = actions
+        self.rewards[slots] = rewards
+        self.next_states[slots] = next_states
+        self.dones[slots] = dones
+        self.position = (self.position + len(actions)) % self.capacity
+        self.size = min(self.size + len(actions), self.capacity)
+
+    def sample(self, batch_size, rng):
+        slots = rng.integers(0, self.size, batch_size)
+        return self.states[slots], self.actions[slots], self.rewards[slots], self.next_states[slots], self.dones[slots]
+
+#---------------------------------------------------------*/
+# Network
+#---------------------------------------------------------*/
+class MLP:
+    """Fully connected ReLU network with a linear output layer, parameters as a flat list
+    [W1, b1, W2, b2, ...] (float32), trained with Adam."""
+
+    def __init__(self, sizes=(n_features, 64, 64, n_actions), rng=None, learning_rate=1e-3):
+        rng = rng or np.random.default_rng()
+        self.params = []
+        for n_in, n_out in zip(sizes[:-1], sizes[1:]):
+            self.params.append((rng.standard_normal((n_in, n_out)) * math.sqrt(2 / n_in)).astype(np.float32))
+            self.params.append(np.zeros(n_out, dtype=np.float32))
+
+        # Adam state
+        self.learning_rate = learning_rate
+        self.moments = [np.zeros_like(p) for p in self.params]
+        self.velocities = [np.zeros_like(p) for p in self.params]
+        self.steps = 0
+
+    def forward(self, x):
+        """Returns the output and the activations of all layers (needed by `backward`)."""
+        activations = [x]
+        for i in range(0, len(self.params), 2):
+            x = x @ self.params[i] + self.params[i + 1]
+            if i < len(self.params) - 2:
+                x = np.maximum(x, 0)
+            activations.append(x)
+        return x, activations
+
+    def backward(self, activations, grad_output):
+        """Gradients of all parameters for the gradient `grad_output` of the output."""
+        grads = [None] * len(self.params)
+        grad = grad_output
+        for i in reversed(range(0, len(self.params), 2)):
+            grads[i] = activations[i // 2].T @ grad
+            grads[i + 1] = grad.sum(axis=0)
+            if i:
+                grad = (grad @ self.params[i].T) * (activations[i // 2] > 0)
+        return grads
+
+    def adam_step(self, grads, beta1=0.9, beta2=0.999, eps=1e-8):
+        self.steps += 1
+        correction = math.sqrt(1 - beta2 ** self.steps) / (1 - beta1 ** self.steps)
+        for param, grad, m, v in zip(self.params, grads, self.moments, self.velocities):
+            m *= beta1
+            m += (1 - beta1) * grad
+            v *= beta2
+            v += (1 - beta2) * grad * grad
+            param -= self.learning_rate * correction * m / (np.sqrt(v) + eps)
+
+    def copy_from(self, other):
+        for param, source in zip(self.params, other.params):
+            param[:] = source
+
+    def flat_params(self):
+        """All parameters as one float32 vector (W1, b1, W2, ... row-major)."""
+        return np.concatenate([param.ravel() for param in self.params])
+
+    def set_flat_params(self, vector):
+        """Inverse of `flat_params`."""
+        sizes = [param.size for param in self.params]
+        if len(vector) != sum(sizes):
+            raise ValueError(f"Expected {sum(sizes)} parameters, got {len(vector)}.")
+        for param, chunk in zip(self.params, np.split(np.asarray(vector, dtype=np.float32), np.cumsum(sizes)[:-1])):
+            param[:] = chunk.reshape(param.shape)
+
+    def __call__(self, x):
+        return self.forward(x)[0]
+
+#---------------------------------------------------------*/
+# Agent
+#---------------------------------------------------------*/
+class DQNAgent:
+    """
+    Deep Q-Network on the normalized raw attributes of both kingdoms: an online MLP trained on
+    minibatches from the replay buffer (Huber loss, Adam) against a target network that is
+    synchronized every `target_update` gradient steps. Experience is collected from games played
+    in lockstep (`KingdomBatch`), with the rewards of `get_reward` (scaled by `reward_scale`).
+
+    `take_turn` has the signature of `models.model.take_turn`, so the agent can be evaluated with
+    `evaluation_game(None, model=agent)` and `evaluate_agent(None, model=agent)`.
+    """
+
+    def __init__(self, hidden=64, learning_rate=1e-3, gamma=0.9, buffer_size=100000, batch_size=64,
+                 target_update=250, reward_scale=0.01, epsilon_start=1.0, epsilon_min=0.01, max_turns=max_turns,
+                 seed=None):
+        self.rng = np.random.default_rng(seed)
+        self.sizes = [n_features, hidden, hidden, n_actions]
+        self.online = MLP(self.sizes, self.rng, learning_rate)
+        self.target = MLP(self.sizes, self.rng)
+        self.target.copy_from(self.online)
+        self.buffer = ReplayBuffer(buffer_size)
+
+        self.learning_rate = learning_rate
+        self.gamma = gamma
+        self.batch_size = batch_size
+        self.target_update = target_update
+        self.reward_scale = reward_scale
+        self.epsilon_start = epsilon_start
+        self.epsilon_min = epsilon_min
+        self.max_turns = max_turns
+        self.action_names = action_names
+        self.episodes_trained = 0
+        self.stats = {}
+
+    # ---------------------------------------------------------*/
+    # Acting
+    # ---------------------------------------------------------*/
+    def choose_actions(self, states, epsilon):
+        """Epsilon-greedy actions for a batch of normalized states."""
+        actions = np.argmax(self.online(states), axis=1)
+        explore = self.rng.random(len(actions)) < epsilon
+        actions[explore] = self.rng.integers(0, n_actions, np.count_nonzero(explore))
+        return actions
+
+    def best_action(self, kingdom, opponent):
+        """Greedy action (0-3) for two `Kingdom` objects."""
+        states = state_features(*[np.array([value]) for value in (
+            kingdom.castle_strength, kingdom.resources, kingdom.soldiers,
+            opponent.castle_strength, opponent.resources, opponent.soldiers)])
+        return int(np.argmax(self.online(states)[0]))
+
+    def __call__(self, kingdom, opponent, rng=None):
+        """Player interface of `run_tournament` (choices 1-4)."""
+        return 1 + self.best_action(kingdom, opponent)
+
+    def take_turn(self, kingdom, opponent, q_table=None, alpha=0, gamma=None, epsilon=0):
+        """Single turn with the interface of `models.model.take_turn` (for `evaluation_game`). The
+        Q-table and learning parameters are ignored, the network is not trained here."""
+        if np.random.random() < epsilon:
+            action = np.random.randint(4)
+        else:
+            action = self.best_action(kingdom, opponent)
+
+        reward = play_action(kingdom, opponent, action)
+        return (kingdom.castle_strength <= 0 or opponent.castle_strength <= 0, reward, action)
+
+    # ---------------------------------------------------------*/
+    # Learning
+    # ---------------------------------------------------------*/
+    def learn(self):
+        """One gradient step on a minibatch from the replay buffer, returns the mean Huber loss."""
+        states, actions, rewards, next_states, dones = self.buffer.sample(self.batch_size, self.rng)
+        targets = rewards + self.gamma * self.target(next_states).max(axis=1) * ~dones
+
+        q_values, activations = self.online.forward(states)
+        rows = np.arange(len(actions))
+        errors = q_values[rows, actions] - targets
+
+        grad_output = np.zeros_like(q_values)
+        grad_output[rows, actions] = np.clip(errors, -1, 1) / len(actions)
+        self.online.adam_step(self.online.backward(activations, grad_output))
+
+        if self.online.steps % self.target_update == 0:
+            self.target.copy_from(self.online)
+        return float(np.mean(np.where(np.abs(errors) <= 1, 0.5 * errors**2, np.abs(errors) - 0.5)))
+
+    def train(self, total_episodes=1000, n_envs=16, opponent_epsilon=0.6, updates_per_step=8, warmup=500,
+              eval_every=100, progress=True, plot=True, metrics=None, save=True, start_episode=None):
+        """
+        Trains for `total_episodes` episodes with `n_envs` games in lockstep (see `Lockstep`). `Kingdom A`
+        acts with a decaying epsilon and its transitions go into the replay buffer, `Kingdom B` plays on
+        the same network with `opponent_epsilon`. After `warmup` transitions, every step runs `updates_per_step`
+        minibatch updates. With `save` the network is written to `default_dqn_path` afterwards.
+        `start_episode` (default: `episodes_trained`, restored by `load`) continues the epsilon decay
+        and the episode numbers of the metrics.
+
+        The throughput (transitions/s, gradient steps/s) is stored in `self.stats` and printed.
+        Returns the agent.
+        """
+        if start_episode is None:
+            start_episode = self.episodes_trained
+        decay = math.exp((math.log(self.epsilon_min) - math.log(self.epsilon_start)) / total_episodes)
+        games = Lockstep(total_episodes, n_envs, self.max_turns)
+        transitions, steps_before = 0, self.online.steps
+        started_at = time.perf_counter()
+
+        def act(mask):
+            # Kingdom A acts, its transitions are stored
+            nonlocal transitions
+            kingdom1, kingdom2 = games.kingdom1, games.kingdom2
+            epsilon = max(self.epsilon_min, self.epsilon_start * decay ** (start_episode + games.finished))
+            prev_state1 = encoder.discretize_batch(kingdom1)
+            states = state_features(kingdom1.castle_strength, kingdom1.resources, kingdom1.soldiers,
+                                    kingdom2.castle_strength, kingdom2.resources, kingdom2.soldiers)
+            actions = self.choose_actions(states, epsilon)
+            attack_success, _ = kingdom1.step(actions, kingdom2, mask)
+            reward1 = get_rewards(prev_state1, encoder.discretize_batch(kingdom1), actions, attack_success,
+                                  kingdom1, kingdom2)
+            done = mask & (kingdom1.is_defeated() | kingdom2.is_defeated())
+            next_states = state_features(kingdom1.castle_strength, kingdom1.resources, kingdom1.soldiers,
+                                         kingdom2.castle_strength, kingdom2.resources, kingdom2.soldiers)
+            self.buffer.add_batch(states[mask], actions[mask], reward1[mask] * self.reward_scale,
+                                  next_states[mask], done[mask])
+            transitions += int(np.count_nonzero(mask))
+            return done, reward1, actions
+
+        def reply(mask):
+            # Kingdom B acts on the same network
+            kingdom1, kingdom2 = games.kingdom1, games.kingdom2
+            states2 = state_features(kingdom2.castle_strength, kingdom2.resources, kingdom2.soldiers,
+                                     kingdom1.castle_strength, kingdom1.resources, kingdom1.soldiers)
+            kingdom2.step(self.choose_actions(states2, opponent_epsilon), kingdom1, mask)
+            return mask & (kingdom1.is_defeated() | kingdom2.is_defeated())
+
+        def update():
+            if len(self.buffer) >= max(warmup, self.batch_size):
+                for _ in range(updates_per_step):
+                    self.learn()
+
+        games.run(act, reply, update, progress=progress)
+
+        elapsed = time.perf_counter() - started_at
+        self.stats = {"transitions": transitions, "gradient_steps": self.online.steps - steps_before,
+                      "seconds": elapsed, "transitions_per_s": transitions / elapsed,
+                      "gradient_steps_per_s": (self.online.steps - steps_before) / elapsed}
+        print(f"{transitions} transitions in {elapsed:.1f} s ({self.stats['transitions_per_s']:.0f} transitions/s, "
+              f"{self.stats['gradient_steps_per_s']:.0f} gradient steps/s)") if progress else None
+
+        summarize_metrics(metrics, games, start_episode, eval_every, plot, self.action_names)
+
+        self.episodes_trained = start_episode + total_episodes
+        self.save() if save else None
+        return self
+
+    # ---------------------------------------------------------*/
+    # Files
+    # ---------------------------------------------------------*/
+    def save(self, path=default_dqn_path):
+        """Writes the online network as checkpoint (all parameters as one float32 vector, the layer
+        sizes and hyperparameters in the header, see utils/checkpoint.py)."""
+        save_checkpoint(self.online.flat_params(), path, action_names=self.action_names, episodes=self.episodes_trained,
+                        model="dqn", sizes=self.sizes, learning_rate=self.learning_rate, gamma=self.gamma,
+                        reward_scale=self.reward_scale, epsilon_min=self.epsilon_min, max_turns=self.max_turns)
+
+    @classmethod
+    def load(cls, path=default_dqn_path, seed=None):
+        """Loads a network saved with `save`, online and target network get the saved parameters.
+        The Adam state and the replay buffer are not saved, continued training starts them empty."""
+        vector, header = load_checkpoint(path, mmap=False)
+        if header.get("model") != "dqn":
+            raise ValueError(f"{path} is not a DQN checkpoint.")
+        sizes = header["sizes"]
+        if sizes[0] != n_features or sizes[-1] != n_actions or sizes[1] != sizes[2]:
+            raise ValueError(f"{path} has the layer sizes {sizes}, expected [{n_features}, h, h, {n_actions}].")
+        agent = cls(hidden=sizes[1], learning_rate=header["learning_rate"], gamma=header["gamma"],
+                    reward_scale=header["reward_scale"], epsilon_min=header["epsilon_min"],
+                    max_turns=header["max_turns"], seed=seed)
+        agent.online.set_flat_params(vector)
+        agent.target.copy_from(agent.online)
+        agent.episodes_trained = header.get("episodes") or 0
+        return agent
+
+#-------------------------Notes-----------------------------------------------*\
+#
+#-----------------------------------------------------------------------------*\
@@ -0,0 +1,181 @@
+#---------------------------------------------------------*\
+# Title: Dyna-Q (tabular Q-learning + planning on a learned model)
+# Author:
+#---------------------------------------------------------*/
+#!/usr/bin/env python3
+
+import math
+import numpy as np
+from tqdm import tqdm
+from src.Kingdom import Kingdom
+from models.model import (encoder, n_actions, alpha, gamma, epsilon_start, epsilon_min, max_turns, action_names,
+                          play_action, evaluation_game)
+from models.q_table import make_q_table, scatter_add
+from utils.checkpoint import save_checkpoint
+from utils.metrics import TrainingMetrics, PlotSink
+
+# Rewards are stored as small integers in the transition keys (offset, so that penalties are >= 0)
+reward_offset = 128
+reward_codes = 256
+
+class TransitionModel:
+    """
+    Learned model of the observed transitions (state, action) -> (next state, reward, done) with
+    counts. Every distinct outcome is one entry of a sorted int64 key array
+    ((((state * n_actions + action) * n_states + next_state) * 256 + reward + 128) * 2 + done), the
+    counts per key are kept in a parallel array. The stochastic parts of the game (the opponent, the bucketing
+    of the raw attributes) are covered by the observed frequencies of the outcomes of a cell.
+    """
+
+    def __init__(self, n_states=encoder.n_states, n_actions=n_actions):
+        self.n_states = n_states
+        self.n_actions = n_actions
+        self.keys = np.zeros(0, dtype=np.int64)
+        self.counts = np.zeros(0, dtype=np.int64)
+        self.dirty = True
+
+    def __len__(self):
+        return len(self.keys)
+
+    @property
+    def n_observations(self):
+        return int(self.counts.sum())
+
+    def record(self, states, actions, rewards, next_states, dones=False):
+        """Counts observed transitions (scalars or arrays, `dones`: the game ended in the next state)."""
+        cells = np.atleast_1d(states).astype(np.int64) * self.n_actions + np.atleast_1d(actions)
+        rewards = np.rint(np.atleast_1d(rewards)).astype(np.int64) + reward_offset
+        keys = ((cells * self.n_states + np.atleast_1d(next_states)) * reward_codes + rewards) * 2 + np.atleast_1d(dones)
+        keys, counts = np.unique(keys, return_counts=True)
+
+        positions = np.searchsorted(self.keys, keys)
+        known = positions < len(self.keys)
+        known[known] = self.keys[positions[known]] == keys[known]
+        np.add.at(self.counts, positions[known], counts[known])
+        if not known.all():
+            self.keys = np.insert(self.keys, positions[~known], keys[~known])
+            self.counts = np.insert(self.counts, positions[~known], counts[~known])
+            self.dirty = True
+
+    def _index(self):
+        """Visited (state, action) cells and the start of their outcomes in the key array."""
+        if self.dirty:
+            cells = self.keys // (self.n_states * reward_codes * 2)
+            self.cells, self.cell_starts = np.unique(cells, return_index=True)
+            self.dirty = False
+
+    def outcomes(self):
+        """All recorded outcomes: arrays of states, actions, rewards, next states and done flags (sorted
+        by cell)."""
+        rest, dones = np.divmod(self.keys, 2)
+        cells, rest = np.divmod(rest, self.n_states * reward_codes)
+        next_states, rewards = np.divmod(rest, reward_codes)
+        states, actions = np.divmod(cells, self.n_actions)
+        return states, actions, (rewards - reward_offset).astype(np.float64), next_states, dones.astype(bool)
+
+    def plan(self, q_table, n_cells, alpha, gamma, rng):
+        """
+        One vectorized planning update: `n_cells` distinct visited (state, action) cells are drawn
+        uniformly and moved towards their expected TD target under the model, i.e. the targets
+        R + γ * max(Q(s', a')) of all recorded outcomes weighted by their counts (R alone for the
+        outcomes that end the game):
+
+        Q(s, a) += α * (Σ_o count_o * (R_o + γ * max(Q(s'_o, a'))) / Σ_o count_o - Q(s, a))
+        """
+        self._index()
+        states, actions, rewards, next_states, dones = self.outcomes()
+        targets = self.counts * (rewards + gamma * np.max(q_table[next_states], axis=1) * ~dones)
+        expected = np.add.reduceat(targets, self.cell_starts) / np.add.reduceat(self.counts, self.cell_starts)
+
+        picks = rng.choice(len(self.cells), min(n_cells, len(self.cells)), replace=False)
+        cell_states, cell_actions = np.divmod(self.cells[picks], self.n_actions)
+        scatter_add(q_table, cell_states, cell_actions, alpha * (expected[picks] - q_table[cell_states, cell_actions]))
+
+def choose_action(q_table, state_index, epsilon, rng):
+    """Epsilon-greedy action (0-3) with the run's random generator."""
+    if rng.random() < epsilon:
+        return int(rng.integers(n_actions))
+    return int(np.argmax(q_table[state_index]))
+
+def train_dyna_q(q_table=None, total_episodes=1000, planning_steps=500, alpha=alpha, gamma=gamma,
+                 epsilon=epsilon_start, epsilon_min=epsilon_min, max_turns=max_turns, seed=None, start_episode=0,
+                 save=True, plot=True, progress=True, metrics=None, model=None, backend="numpy"):
+    """
+    Dyna-Q on the games of `run_episode` (Kingdom A learns, Kingdom B plays on the same table with
+    epsilon 0.6). A transition of Kingdom A runs from the state before its action to its next
+    decision point, after the reply of Kingdom B, with the reward of A over both moves (that of its
+    own action, `get_reward` only rewards the acting kingdom) and a done flag if the game ended.
+    Every transition gets the Q-learning update and is recorded in the `TransitionModel`, so the
+    real and the planning updates have the same targets (no bootstrapping from a finished game).
+    After every transition `planning_steps` distinct visited (state, action) cells are moved
+    towards their expected TD target under the model in one vectorized update
+    (`TransitionModel.plan`).
+
+    Parameters:
+    - `q_table` (numpy.ndarray, optional): The initial Q-table, a new one is created if None.
+    - `total_episodes` (int): Number of real training episodes.
+    - `planning_steps` (int): Planned cells per real step (0 = plain Q-learning).
+    - `seed` (int, optional): Seed of the run's random generator (actions and planning samples, the
+      global `np.random` state is not touched).
+    - `start_episode` (int): Episodes already trained on `q_table`, continues the epsilon decay.
+    - `model` (TransitionModel, optional): Model to continue with (e.g. from an earlier run).
+    - `backend` (str): Storage of a new Q-table ("numpy", "dense" or "sparse", see models/q_table.py).
+    - `save` / `plot` (bool): Save the trained Q-table to ./out and plot the statistics.
+
+    Returns the trained Q-table and the transition model.
+    """
+    if q_table is None:
+        q_table = make_q_table(encoder.n_states, n_actions, backend)
+    rng = np.random.default_rng(seed)
+    model = model or TransitionModel(q_table.shape[0], q_table.shape[1])
+    epsilon_decay_rate = math.exp((math.log(epsilon_min) - math.log(epsilon)) / total_episodes)
+    epsilon = max(epsilon_min, epsilon * epsilon_decay_rate ** start_episode)
+
+    if metrics is None:
+        metrics = TrainingMetrics(capacity=total_episodes // 100 + 1, action_names=action_names)
+        metrics.subscribe(PlotSink()) if plot else None
+
+    for episode in tqdm(range(total_episodes), disable=not progress):
+        kingdom1 = Kingdom("Kingdom A")
+        kingdom2 = Kingdom("Kingdom B")
+        turn_count = 0
+
+        while True:
+            # Real step of Kingdom A and the reply of Kingdom B (no reward for Kingdom A)
+            state_index = encoder.encode(kingdom1, kingdom2)
+            action = choose_action(q_table, state_index, epsilon, rng)
+            reward = play_action(kingdom1, kingdom2, action)
+            turn_count += 1
+            done = kingdom1.castle_strength <= 0 or kingdom2.castle_strength <= 0
+            if not done and turn_count < max_turns:
+                play_action(kingdom2, kingdom1, choose_action(q_table, encoder.encode(kingdom2, kingdom1), 0.6, rng))
+                turn_count += 1
+                done = kingdom1.castle_strength <= 0 or kingdom2.castle_strength <= 0
+
+            # Q-learning update and model of the transition to A's next decision point, then planning
+            next_state_index = encoder.encode(kingdom1, kingdom2)
+            target = reward if done else reward + gamma * np.max(q_table[next_state_index])
+            q_table[state_index][action] += alpha * (target - q_table[state_index][action])
+            model.record(state_index, action, reward, next_state_index, done)
+            if planning_steps:
+                model.plan(q_table, planning_steps, alpha, gamma, rng)
+
+            if done or turn_count >= max_turns:
+                break
+
+        epsilon = max(epsilon_min, epsilon_decay_rate * epsilon)
+
+        if episode % 100 == 0:  # Evaluate every 100 episodes
+            win_rate, avg_reward, action_freq = evaluation_game(q_table)
+            metrics.record(start_episode + episode, win_rate, avg_reward, action_freq)
+
+    metrics.close()
+    if save:
+        save_checkpoint(q_table, buckets=encoder.buckets, action_names=action_names, episodes=start_episode + total_episodes,
+                        model="dyna_q", planning_steps=planning_steps)
+    return q_table, model
+
+#-------------------------Notes-----------------------------------------------*\
+# The targets of all recorded outcomes are computed in every planning update,
+# so the cost hardly depends on `planning_steps` (about 2x the time per episode).
+#-----------------------------------------------------------------------------*\
@@ -0,0 +1,248 @@
+#---------------------------------------------------------*\
+# Title: Self-Play League (snapshot pool, prioritized opponents)
+# Author:
+#---------------------------------------------------------*/
+#!/usr/bin/env python3
+
+import os
+import math
+import numpy as np
+from multiprocessing import Pool, shared_memory
+from tqdm import tqdm
+from src.KingdomBatch import KingdomBatch
+from models.model import encoder, n_actions, epsilon_start, epsilon_min, max_turns, action_names
+from models.batch_model import train_q_learning_batched, choose_actions
+from models.q_table import make_q_table
+from utils.checkpoint import save_checkpoint
+from utils.metrics import TrainingMetrics, PlotSink
+
+#---------------------------------------------------------*/
+# Snapshot Pool
+#---------------------------------------------------------*/
+class SnapshotPool:
+    """
+    Frozen opponents of the league. A snapshot is the greedy policy of a Q-table (argmax per state)
+    as one uint8 row, all rows live in one block of shared memory (capacity x n_states bytes, e.g.
+    500 snapshots of 2025 states in 1 MB instead of 32 MB of float64 tables). Worker processes
+    attach to the block by its name, so no snapshot is copied per match. When the pool is full the
+    oldest snapshot is replaced.
+
+    `win_rates` holds the win rate of every snapshot against the current agent (from the latest
+    pool matches), it is only kept in the creating process.
+    """
+
+    def __init__(self, n_states=encoder.n_states, capacity=500, name=None):
+        self.n_states = n_states
+        self.capacity = capacity
+        self.owner = name is None
+        self.memory = shared_memory.SharedMemory(name=name, create=self.owner, size=capacity * n_states)
+        self.policies = np.ndarray((capacity, n_states), dtype=np.uint8, buffer=self.memory.buf)
+        self.win_rates = np.full(capacity, 0.5)
+        self.episodes = np.zeros(capacity, dtype=np.int64)
+        self.size = 0
+        self.newest = -1
+
+    def __len__(self):
+        return self.size
+
+    @property
+    def name(self):
+        return self.memory.name
+
+    def add(self, q_table, episode=0):
+        """Freezes the greedy policy of `q_table`, returns the id of the snapshot."""
+        slot = (self.newest + 1) % self.capacity
+        self.policies[slot] = np.argmax(q_table[np.arange(self.n_states)], axis=1)
+        self.win_rates[slot] = 0.5  # A copy of the agent wins half of its games against it
+        self.episodes[slot] = episode
+        self.size = min(self.size + 1, self.capacity)
+        self.newest = slot
+        return slot
+
+    def weights(self, power=2.0):
+        """
+        Prioritized fictitious self-play: snapshots are weighted by (win rate + 0.01) ** `power`,
+        opponents that beat the current agent are drawn most often (power 0 = uniform).
+        """
+        weights = (self.win_rates[:self.size] + 0.01) ** power
+        return weights / weights.sum()
+
+    def sample(self, n, rng, power=2.0):
+        return rng.choice(self.size, n, p=self.weights(power))
+
+    def close(self):
+        del self.policies
+        self.memory.close()
+        if self.owner:
+            self.memory.unlink()
+
+class LeagueOpponent:
+    """
+    `Kingdom B` of the batched trainer: every game gets its own snapshot from the pool (drawn again
+    on reset) and plays its greedy policy with `epsilon` exploration. A `self_play` fraction of the
+    games keeps the opponent of `run_episode` (the live Q-table with `self_play_epsilon`).
+    """
+
+    def __init__(self, pool, q_table, epsilon=0.2, power=2.0, self_play=0.5, self_play_epsilon=0.6, encoder=encoder):
+        self.pool = pool
+        self.q_table = q_table
+        self.epsilon = epsilon
+        self.power = power
+        self.self_play = self_play
+        self.self_play_epsilon = self_play_epsilon
+        self.encoder = encoder
+        self.ids = None
+
+    def reset(self, mask, rng):
+        """Draws new opponents for the selected games (id -1 = live Q-table)."""
+        if self.ids is None or len(self.ids) != len(mask):
+            self.ids = np.zeros(len(mask), dtype=np.int64)
+        n = np.count_nonzero(mask)
+        self.ids[mask] = np.where(rng.random(n) < self.self_play, -1, self.pool.sample(n, rng, self.power))
+
+    def take_turns(self, kingdom, opponent, mask, rng):
+        state_indices = self.encoder.encode_batch(kingdom, opponent)
+        actions = policy_actions(self.pool.policies, self.ids, state_indices, self.epsilon, rng)
+        live = self.ids < 0
+        if live.any():
+            actions[live] = choose_actions(self.q_table, state_indices[live], self.self_play_epsilon, rng)
+        kingdom.step(actions, opponent, mask)
+        return mask & (kingdom.is_defeated() | opponent.is_defeated())
+
+#---------------------------------------------------------*/
+# Matches
+#---------------------------------------------------------*/
+def policy_actions(policies, rows, state_indices, epsilon, rng):
+    """Epsilon-greedy actions of the games, game i plays the policy `policies[rows[i]]`."""
+    actions = policies[rows, state_indices].astype(np.int64)
+    explore = rng.random(len(state_indices)) < epsilon
+    actions[explore] = rng.integers(0, n_actions, np.count_nonzero(explore))
+    return actions
+
+def play_first(policy1, policy2, n_games, epsilon, rng, max_turns=max_turns, encoder=encoder):
+    """Plays `n_games` games at once in which `policy1` moves first, returns its wins (1 / 0.5 / 0)."""
+    kingdom1 = KingdomBatch(n_games, "Kingdom A")
+    kingdom2 = KingdomBatch(n_games, "Kingdom B")
+    policies = np.stack([policy1, policy2])
+    rows1, rows2 = np.zeros(n_games, dtype=np.int64), np.ones(n_games, dtype=np.int64)
+    active = np.ones(n_games, dtype=bool)
+    draw = np.zeros(n_games, dtype=bool)
+    turn_count = 0
+
+    while active.any():
+        kingdom1.step(policy_actions(policies, rows1, encoder.encode_batch(kingdom1, kingdom2), epsilon, rng), kingdom2, active)
+        turn_count += 1
+        done = kingdom1.is_defeated() | kingdom2.is_defeated()
+        draw |= active & ~done & (turn_count >= max_turns)
+        active &= ~done & ~draw
+
+        kingdom2.step(policy_actions(policies, rows2, encoder.encode_batch(kingdom2, kingdom1), epsilon, rng), kingdom1, active)
+        turn_count += 1
+        active &= ~(kingdom1.is_defeated() | kingdom2.is_defeated())
+
+    return np.where(draw, 0.5, (kingdom1.castle_strength > kingdom2.castle_strength).astype(float))
+
+def play_policies(policy1, policy2, n_games=200, epsilon=0.1, seed=None):
+    """
+    Plays `n_games` games between two greedy policies (uint8 action per state), both with `epsilon`
+    exploration (the game itself is deterministic). `policy1` moves first in half of the games.
+    Returns the wins of `policy1` (1 / 0.5 / 0 per game).
+    """
+    rng = np.random.default_rng(seed)
+    n_first = (n_games + 1) // 2
+    return np.concatenate([play_first(policy1, policy2, n_first, epsilon, rng),
+                           1 - play_first(policy2, policy1, n_games - n_first, epsilon, rng)])
+
+# Pool of the worker process (attached by name), set once per worker by `_init_worker`
+_worker_pool = None
+
+def _init_worker(name, n_states, capacity):
+    global _worker_pool
+    _worker_pool = SnapshotPool(n_states, capacity, name=name)
+
+def _play_snapshot(task):
+    """Win rate of one snapshot against another one (the current agent), both read from the pool."""
+    snapshot, agent, n_games, epsilon, seed = task
+    return play_policies(_worker_pool.policies[snapshot], _worker_pool.policies[agent], n_games, epsilon, seed).mean()
+
+#---------------------------------------------------------*/
+# Training Loop
+#---------------------------------------------------------*/
+def train_league(q_table=None, total_episodes=10000, n_envs=500, snapshot_every=500, pool_size=500,
+                 match_opponents=8, match_games=200, match_epsilon=0.1, opponent_epsilon=0.2, pfsp_power=2.0, self_play=0.5,
+                 n_workers=None, epsilon=epsilon_start, seed=None, start_episode=0, save=True, plot=True,
+                 progress=True, backend="numpy"):
+    """
+    League training: instead of a noisy copy of itself (`run_episode`), the agent plays against
+    frozen snapshots of its earlier Q-tables. Training runs in rounds of `snapshot_every` episodes
+    (`train_q_learning_batched` with a `LeagueOpponent`, one opponent per game drawn with the PFSP
+    weights of the pool). After every round the Q-table is frozen into the pool, and the current
+    greedy policy (the newest snapshot) plays `match_games` games against `match_opponents` older
+    snapshots in parallel worker processes; the results update the win rates of these snapshots.
+
+    Parameters:
+    - `q_table` (numpy.ndarray, optional): The initial Q-table, a new one is created if None.
+    - `total_episodes` (int): Number of training episodes.
+    - `n_envs` (int): Number of training episodes in lockstep.
+    - `snapshot_every` (int): Episodes per round (one new snapshot and one set of pool matches).
+    - `pool_size` (int): Capacity of the snapshot pool (the oldest snapshot is replaced).
+    - `match_opponents` / `match_games` (int): Snapshots matched per round and games per match.
+    - `opponent_epsilon` / `match_epsilon` (float): Exploration of the snapshots in training and matches.
+    - `pfsp_power` (float): Weighting of the opponents (0 = uniform, larger = focus on strong snapshots).
+    - `n_workers` (int): Worker processes for the pool matches (None = all cores, 1 = no pool).
+    - `seed` (int, optional): Seed of the training and the matches.
+
+    Returns the trained Q-table and the snapshot pool (closed, the win rates remain readable).
+    """
+    if q_table is None:
+        q_table = make_q_table(encoder.n_states, n_actions, backend)
+
+    global _worker_pool
+    n_workers = n_workers or os.cpu_count()
+    rng = np.random.default_rng(seed)
+    epsilon_decay_rate = math.exp((math.log(epsilon_min) - math.log(epsilon)) / total_episodes)
+    metrics = TrainingMetrics(capacity=total_episodes // 100 + 1, action_names=action_names)
+
+    pool = SnapshotPool(encoder.n_states, pool_size)
+    pool.add(q_table, start_episode)
+    opponent = LeagueOpponent(pool, q_table, opponent_epsilon, pfsp_power, self_play)
+    if n_workers > 1:
+        workers = Pool(n_workers, initializer=_init_worker, initargs=(pool.name, pool.n_states, pool.capacity))
+    else:
+        workers, _worker_pool = None, pool  # Matches are played in this process
+
+    try:
+        with tqdm(total=total_episodes, disable=not progress) as progress_bar:
+            for round_start in range(0, total_episodes, snapshot_every):
+                n_episodes = min(snapshot_every, total_episodes - round_start)
+                train_q_learning_batched(q_table, n_episodes, n_envs, epsilon=epsilon, seed=rng.integers(2**63),
+                                         start_episode=start_episode + round_start, epsilon_decay_rate=epsilon_decay_rate,
+                                         save=False, plot=False, progress=False, metrics=metrics, opponent=opponent)
+                newest = pool.add(q_table, start_episode + round_start + n_episodes)
+
+                # Pool matches of the current greedy policy (the newest snapshot) against older snapshots
+                others = np.setdiff1d(np.arange(len(pool)), [newest])
+                snapshots = rng.choice(others, min(match_opponents, len(others)), replace=False)
+                tasks = [(snapshot, newest, match_games, match_epsilon, rng.integers(2**63)) for snapshot in snapshots]
+                results = workers.map(_play_snapshot, tasks) if workers else [_play_snapshot(task) for task in tasks]
+                pool.win_rates[snapshots] = results
+                progress_bar.update(n_episodes)
+    finally:
+        if workers:
+            workers.close()
+            workers.join()
+        _worker_pool = None
+        pool.close()
+
+    metrics.subscribe(PlotSink()) if plot else None
+    metrics.close()
+
+    if save:
+        save_checkpoint(q_table, buckets=encoder.buckets, action_names=action_names,
+                        episodes=start_episode + total_episodes, model="league", pool_size=len(pool))
+    return q_table, pool
+
+#-------------------------Notes-----------------------------------------------*\
+# The training statistics (metrics) are the results against the league
+# opponents, not against the opponent of `evaluation_game`.
+#-----------------------------------------------------------------------------*\
@@ -0,0 +1,234 @@
+#---------------------------------------------------------*\
+# Title: Monte Carlo Tree Search Player (anytime, batched rollouts)
+# Author:
+#---------------------------------------------------------*/
+#!/usr/bin/env python3
+
+import math
+import time
+import numpy as np
+from src.Kingdom import Kingdom
+from src.KingdomBatch import KingdomBatch
+from models.model import encoder, n_actions
+from models.solver import material_value
+
+#---------------------------------------------------------*/
+# Search Tree
+#---------------------------------------------------------*/
+class Node:
+    """Statistics of one state (player to move): visits and value sums per action, from the view of
+    the player to move, and the prior probabilities of the actions."""
+
+    __slots__ = ("visits", "edge_visits", "edge_values", "priors")
+
+    def __init__(self, priors):
+        self.visits = 0
+        self.edge_visits = [0] * n_actions
+        self.edge_values = [0.0] * n_actions
+        self.priors = priors
+
+class MCTSPlayer:
+    """
+    Anytime MCTS game AI with a wall-clock budget per move (PUCT selection, zero-sum: the value of
+    a state for the player to move is 1 - the value for the other player).
+
+    - Transposition table: nodes are stored in a dict keyed on the exact state (packed kingdom of
+      the player to move, packed kingdom of the other player, plies left until the draw), so
+      transpositions share their statistics. The table is kept between moves (tree reuse): after
+      the own move and the reply the new root is usually already in the table. States with more
+      plies left than the root can not be reached anymore and are dropped.
+    - Batched rollouts: every iteration selects `n_leaves` leaves (with a virtual loss, so that they
+      differ) and plays `rollouts_per_leaf` games from each of them at once in a `KingdomBatch`,
+      for at most `rollout_depth` plies; unfinished games are scored with `material_value`.
+    - With a Q-table, the priors put 1 - `prior_epsilon` on its greedy action and the rollouts play
+      it epsilon-greedily (`rollout_epsilon`), otherwise both are uniform.
+
+    Parameters:
+    - `q_table` (numpy.ndarray, optional): Prior / rollout policy (discretized with `encoder`).
+    - `budget_ms` (float): Search time per move in milliseconds.
+    - `max_iterations` (int, optional): Fixed number of search iterations per move instead of the
+      time budget, so that the moves only depend on the seed (not on the speed of the machine).
+    - `limit` (int): Round limit of the game (draw), used if `choose` gets no `plies_left`.
+    - `exploration` (float): PUCT exploration constant.
+    - `seed` (int, optional): Seed of the rollouts (in tournaments every game is reseeded from the
+      tournament's random generator).
+    """
+
+    def __init__(self, q_table=None, budget_ms=75, limit=50, n_leaves=16, rollouts_per_leaf=8, rollout_depth=20,
+                 exploration=1.0, prior_epsilon=0.5, rollout_epsilon=0.3, max_nodes=200000, encoder=encoder,
+                 seed=None, name="MCTS", max_iterations=None):
+        if max_iterations is not None and max_iterations < 1:
+            raise ValueError(f"max_iterations must be at least 1, got {max_iterations}.")
+        self.q_table = q_table
+        self.budget_ms = budget_ms
+        self.max_iterations = max_iterations
+        self.limit = limit
+        self.n_leaves = n_leaves
+        self.rollouts_per_leaf = rollouts_per_leaf
+        self.rollout_depth = rollout_depth
+        self.exploration = exploration
+        self.prior_epsilon = prior_epsilon
+        self.rollout_epsilon = rollout_epsilon if q_table is not None else 1.0
+        self.max_nodes = max_nodes
+        self.encoder = encoder
+        self.rng = np.random.default_rng(seed)
+        self.name = name
+
+        self.table = {}  # (packed mover, packed other, plies left) -> Node
+        self.iterations = 0
+        self.game_kingdom = None
+        self.plies_played = 0
+
+    # ---------------------------------------------------------*/
+    # Tree
+    # ---------------------------------------------------------*/
+    def priors(self, mover, other):
+        if self.q_table is None:
+            return [1 / n_actions] * n_actions
+        priors = [self.prior_epsilon / n_actions] * n_actions
+        priors[int(np.argmax(self.q_table[self.encoder.encode(mover, other)]))] += 1 - self.prior_epsilon
+        return priors
+
+    def select_action(self, node):
+        """PUCT: Q + c * P * sqrt(N) / (1 + N_a), unvisited actions count with Q = 0.5."""
+        scale = self.exploration * math.sqrt(node.visits + 1)
+        best, best_score = 0, -1.0
+        for action in range(n_actions):
+            visits = node.edge_visits[action]
+            value = node.edge_values[action] / visits if visits else 0.5
+            score = value + scale * node.priors[action] / (1 + visits)
+            if score > best_score:
+                best, best_score = action, score
+        return best
+
+    def descend(self, root_key, mover, other):
+        """
+        Walks from the root to a leaf, adding a virtual loss (one visit with value 0) on the way.
+        Returns the path of (node, action), the leaf kingdoms (player to move first) with its plies
+        left, and the leaf value for its player to move if the leaf is terminal (else None).
+        """
+        path = []
+        key = root_key
+        while True:
+            if mover.castle_strength <= 0:
+                return path, (mover, other, key[2]), 0.0  # The player to move has lost
+            if key[2] <= 0:
+                return path, (mover, other, key[2]), 0.5  # Draw by the round limit
+            node = self.table.get(key)
+            if node is None:
+                self.table[key] = Node(self.priors(mover, other))
+                return path, (mover, other, key[2]), None
+
+            action = self.select_action(node)
+            node.visits += 1
+            node.edge_visits[action] += 1
+            path.append((node, action))
+            mover.apply(action, other)
+            mover, other = other, mover
+            key = (mover.pack(), other.pack(), key[2] - 1)
+
+    def backup(self, path, value):
+        """Adds the leaf value (for its player to move) along the path, flipping the view per ply."""
+        for node, action in reversed(path):
+            value = 1.0 - value
+            node.edge_values[action] += value
+
+    # ---------------------------------------------------------*/
+    # Rollouts
+    # ---------------------------------------------------------*/
+    def rollout_actions(self, actor, other, rng):
+        actions = rng.integers(0, n_actions, actor.n)
+        if self.q_table is not None:
+            greedy = rng.random(actor.n) >= self.rollout_epsilon
+            indices = self.encoder.encode_batch(actor, other)[greedy]
+            actions[greedy] = np.argmax(self.q_table[indices], axis=1)
+        return actions
+
+    def rollouts(self, leaves):
+        """Mean rollout values of the leaves (for their player to move), all games in one batch."""
+        n = len(leaves) * self.rollouts_per_leaf
+        movers = KingdomBatch.from_kingdoms([mover for mover, _, _ in leaves for _ in range(self.rollouts_per_leaf)])
+        others = KingdomBatch.from_kingdoms([other for _, other, _ in leaves for _ in range(self.rollouts_per_leaf)])
+        plies_left = np.repeat([plies for _, _, plies in leaves], self.rollouts_per_leaf)
+        active = np.ones(n, dtype=bool)
+
+        for ply in range(self.rollout_depth):
+            active &= plies_left > ply
+            if not active.any():
+                break
+            actor, other = (movers, others) if ply % 2 == 0 else (others, movers)
+            actor.step(self.rollout_actions(actor, other, self.rng), other, active)
+            active &= ~other.is_defeated()
+
+        values = np.where(movers.is_defeated(), 0.0, np.where(others.is_defeated(), 1.0, 0.5))
+        unfinished = ~movers.is_defeated() & ~others.is_defeated() & (plies_left > self.rollout_depth)
+        if unfinished.any():
+            states = np.stack([movers.castle_strength, movers.resources, movers.soldiers,
+                               others.castle_strength, others.resources, others.soldiers])
+            values[unfinished] = material_value(states[:, unfinished])
+        return values.reshape(len(leaves), self.rollouts_per_leaf).mean(axis=1)
+
+    # ---------------------------------------------------------*/
+    # Move
+    # ---------------------------------------------------------*/
+    def prune(self, plies_left):
+        """Drops all states that are not reachable from the root anymore (more plies left)."""
+        if len(self.table) > self.max_nodes:
+            self.table = {key: node for key, node in self.table.items() if key[2] <= plies_left}
+        if len(self.table) > self.max_nodes:
+            self.table = {}
+
+    def search(self, kingdom, opponent, plies_left):
+        """Runs the search until the budget (or `max_iterations`) is spent, at least one iteration,
+        returns the root node."""
+        root_key = (kingdom.pack(), opponent.pack(), plies_left)
+        self.prune(plies_left)
+        deadline = time.perf_counter() + self.budget_ms / 1000
+        last_iteration = self.iterations + self.max_iterations if self.max_iterations is not None else None
+
+        while True:
+            paths, leaves, terminal = [], [], []
+            for _ in range(self.n_leaves):
+                path, leaf, value = self.descend(root_key, kingdom.clone(), opponent.clone())
+                if value is None:
+                    paths.append(path)
+                    leaves.append(leaf)
+                else:
+                    terminal.append((path, value))
+            if leaves:
+                for path, value in zip(paths, self.rollouts(leaves)):
+                    self.backup(path, value)
+            for path, value in terminal:
+                self.backup(path, value)
+            self.iterations += 1
+            spent = self.iterations >= last_iteration if last_iteration is not None else time.perf_counter() >= deadline
+            if spent:
+                return self.table[root_key]
+
+    def choose(self, kingdom, opponent, plies_left=None):
+        """
+        Searches from the current state (`kingdom` to move) and returns the most visited action
+        as choice of the game (1-4). `plies_left` are the moves of both players until the draw
+        (default: the full game of `limit` rounds).
+        """
+        if plies_left is None:
+            plies_left = 2 * (self.limit - 1)
+        root = self.search(kingdom, opponent, plies_left)
+        return 1 + int(np.argmax(root.edge_visits))
+
+    def __call__(self, kingdom, opponent, rng):
+        """Player interface of src/tournament.py. The plies left are counted per game (a game
+        starts with new `Kingdom` objects), every game seeds the rollouts from `rng` (random.Random)."""
+        if kingdom is not self.game_kingdom:
+            self.game_kingdom = kingdom
+            self.rng = np.random.default_rng(rng.getrandbits(64))
+            start = Kingdom("Start").state
+            self.plies_played = 0 if kingdom.state == start and opponent.state == start else 1  # Second mover
+        plies_left = 2 * (self.limit - 1) - self.plies_played
+        self.plies_played += 2
+        return self.choose(kingdom, opponent, plies_left)
+
+#-------------------------Notes-----------------------------------------------*\
+# The first player of a round has 2 * (limit - round) plies left, the second
+# one 2 * (limit - round) - 1 (see `game` and `play_match`).
+#-----------------------------------------------------------------------------*\
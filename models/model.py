@@ -6,11 +6,13 @@
 
 import numpy as np
 from src.Kingdom import Kingdom
-import matplotlib.pyplot as plt
-from tqdm import tqdm
-from utils.plotting import plot_evaluation # plot_item_frequencies, plot_results
 import math
-from src.eval import evaluation_game
+from src.eval import evaluation_game, BackgroundEvaluator
+from models.state_encoder import StateEncoder
+from models.q_table import make_q_table
+from utils.checkpoint import save_checkpoint, export_csv
+from utils.metrics import TrainingMetrics, PlotSink
+from utils.traces import TraceRecorder, attack_outcome
 
 
 #---------------------------------------------------------*/
@@ -27,7 +29,11 @@ n_actions = 4
 
 # Total number of states (Squared for both Kingdoms)
 n_states = (castle_strength_buckets * resource_buckets * soldier_buckets) ** 2
-q_table = np.zeros((n_states, n_actions))
+q_table_backend = "numpy"  # "numpy" (float64), "dense" (float32) or "sparse", see models/q_table.py
+q_table = make_q_table(n_states, n_actions, q_table_backend)
+
+# Precomputed lookup tables for the discretization (shared by training, game and evaluation)
+encoder = StateEncoder(castle_strength_buckets, resource_buckets, soldier_buckets)
 
 # Placeholder variables for the learning rate, discount factor, and exploration rate
 alpha = 0.9  # Learning rate
@@ -51,42 +57,21 @@ PRINTER = False
 # ---------------------------------------------------------*/
 def discretize_state(kingdom):
     """Discretizes the state of a kingdom into predefined buckets for Q-learning. """
-    # Dynamic size of the buckets, as plausible for the game
-    castle_strength = min(int(kingdom.castle_strength / (100 / castle_strength_buckets)),castle_strength_buckets - 1,)
-    resources = min(int(kingdom.resources / (75 / resource_buckets)), resource_buckets - 1)
-    soldiers = min(int(kingdom.soldiers / (75 / soldier_buckets)), soldier_buckets - 1)
-    return castle_strength, resources, soldiers
+    # Dynamic size of the buckets, as plausible for the game (looked up in the precomputed tables)
+    return encoder.discretize(kingdom)
 
 def get_state_index(state1, state2):
     """The function combines the discretized states of two kingdoms (A and B) into a single index 
     for a Q-table in a reinforcement learning environment. It scales the index of Kingdom A's state 
     by the total number of possible states for a single kingdom, then adds the index of Kingdom B's 
     state, ensuring a unique index for every possible state combination."""
-    # Calculate the index for state1 (Kingdom A)
-    state1_index = (
-        state1[0] * (resource_buckets * soldier_buckets)
-        + state1[1] * soldier_buckets
-        + state1[2]
-    )
-    # Scale the index by the total number of possible states for both kingdoms
-    state1_index *= castle_strength_buckets * resource_buckets * soldier_buckets
-
-    # Calculate the index for state2 (Kingdom B) -> Starts at index 0, if A = (0,0,0)
-    state2_index = (
-        state2[0] * (resource_buckets * soldier_buckets)
-        + state2[1] * soldier_buckets
-        + state2[2]
-    )
-    # Add the index for state2 to the scaled index for state1 to get the final linear index
-    linear_index = state1_index + state2_index
-
-    return linear_index
+    return encoder.index(state1, state2)
 
 
 def choose_action(q_table, state_index, epsilon):
     """Function to choose an action, using epsilon-greedy policy"""
     if np.random.random() < epsilon:  # Explore: choose a random action
-        return np.random.choice([0, 1, 2, 3])
+        return np.random.randint(4)  # Same draw as `np.random.choice([0, 1, 2, 3])`, without the array
     else:  # Exploit: choose the best action from Q-table
         return np.argmax(q_table[state_index])
 
@@ -161,25 +146,18 @@ def update_q_table(q_table, state_index, action, reward, next_state_index, alpha
 #---------------------------------------------------------*/
 # Functions (Main)
 #---------------------------------------------------------*/
-def take_turn(kingdom, opponent, q_table, alpha, gamma, epsilon):
-    """Function for a single turn in the game. It takes in the current state of the kingdom and 
-    opponent, chooses an action, and updates the Q-table. It returns a boolean indicating whether
-    the game is over."""
+def play_action(kingdom, opponent, action, encoder=encoder):
+    """Executes an action (0-3) of `kingdom` and returns its reward (`get_reward`). Shared by all
+    players with the `take_turn` interface, they only differ in how they choose the action."""
     # Store the previous states
-    prev_state1 = discretize_state(kingdom)
-    prev_state2 = discretize_state(opponent)
-    
-    state_index = get_state_index(prev_state1, prev_state2)
+    prev_state1 = encoder.discretize(kingdom)
+    prev_state2 = encoder.discretize(opponent)
 
-    # Kingdom takes its turn
-    action = choose_action(q_table, state_index, epsilon)
-    
     # Handle and execute the different actions
     attack_outcome = None
-    
+
     if action == 0:  # Ressourcen sammeln
         kingdom.gather_resources()
-        attack_outcome = None
     elif action == 1:  # Soldaten trainieren
         kingdom.train_soldiers()
     elif action == 2:  # Burg befestigen
@@ -187,27 +165,36 @@ def take_turn(kingdom, opponent, q_table, alpha, gamma, epsilon):
     elif action == 3:
         attack_outcome, _ = kingdom.attack(opponent)
 
-    # Store the current states
-    curr_state1 = discretize_state(kingdom)
-    curr_state2 = discretize_state(opponent)
-    next_state_index = get_state_index(curr_state1, curr_state2)
-
     # Calculate the reward based on the action taken and the outcome
-    reward = get_reward(prev_state1, prev_state2, curr_state1, curr_state2, action, attack_outcome, kingdom, opponent)
+    return get_reward(prev_state1, prev_state2, encoder.discretize(kingdom), encoder.discretize(opponent),
+                      action, attack_outcome, kingdom, opponent)
+
+def take_turn(kingdom, opponent, q_table, alpha, gamma, epsilon):
+    """Function for a single turn in the game. It takes in the current state of the kingdom and 
+    opponent, chooses an action, and updates the Q-table. It returns a boolean indicating whether
+    the game is over."""
+    state_index = encoder.encode(kingdom, opponent)
+
+    # Kingdom takes its turn
+    action = choose_action(q_table, state_index, epsilon)
+    reward = play_action(kingdom, opponent, action)
+    next_state_index = encoder.encode(kingdom, opponent)
 
     # Print statement to show the action taken, the current state, and the reward
     if PRINTER:
         action_names = ["Attack", "Gather Resources", "Train Soldiers", "Fortify Castle"]
+        prev_state1, prev_state2 = encoder.decode(state_index)
         print(f"{kingdom.name} takes action: {action_names[action]} | State: {prev_state1}, Opponent State: {prev_state2} | Reward: {reward}")
 
-    # Update the Q-table
-    update_q_table(q_table, state_index, action, reward, next_state_index, alpha, gamma)
+    # Update the Q-table (skipped for alpha = 0, so that read-only tables can be played)
+    if alpha:
+        update_q_table(q_table, state_index, action, reward, next_state_index, alpha, gamma)
 
     # Check if game is done
     return (kingdom.castle_strength <= 0 or opponent.castle_strength <= 0, reward, action)
 
 # Updating the Q-learning run function with the corrected discretize_state
-def run_episode(q_table, alpha=alpha, gamma=gamma, epsilon=epsilon_start, max_turns=max_turns):
+def run_episode(q_table, alpha=alpha, gamma=gamma, epsilon=epsilon_start, max_turns=max_turns, recorder=None, episode=0):
     """
     The function simulates turns between two kingdoms, `Kingdom A` and `Kingdom B`. `Kingdom A` uses the Q-table 
     for decision-making, while `Kingdom B` takes random actions. The episode ends when either a terminal state 
@@ -219,6 +206,7 @@ def run_episode(q_table, alpha=alpha, gamma=gamma, epsilon=epsilon_start, max_tu
     - `gamma` (float, optional): The discount factor. Balances the importance of immediate and future rewards.
     - `epsilon` (float, optional): The exploration rate. Determines the probability of taking a random action for exploration.
     - `max_turns` (int, optional): The maximum number of turns for the episode. Helps in terminating the episode to avoid infinite loops.
+    - `recorder` (TraceRecorder, optional): Records every turn under the id `episode` (see utils/traces.py).
     """
     
     kingdom1 = Kingdom("Kingdom A")
@@ -229,14 +217,20 @@ def run_episode(q_table, alpha=alpha, gamma=gamma, epsilon=epsilon_start, max_tu
         
     while not done:
         # Kingdom 1 takes its turn
-        done, _, _ = take_turn(kingdom1, kingdom2, q_table, alpha, gamma, epsilon)
+        state = kingdom1.state + kingdom2.state if recorder is not None else None
+        done, reward, action = take_turn(kingdom1, kingdom2, q_table, alpha, gamma, epsilon)
+        if recorder is not None:
+            recorder.record(episode, turn_count, 0, action, state, reward, attack_outcome(action, state, kingdom2))
         turn_count += 1
 
         if done or turn_count >= max_turns:
             break
 
         # Kingdom 2 takes its turn (More random action, no Q-Table Update)
-        done, _, _ = take_turn(kingdom2, kingdom1, q_table, alpha=0, gamma=gamma, epsilon=0.6)
+        state = kingdom2.state + kingdom1.state if recorder is not None else None
+        done, reward, action = take_turn(kingdom2, kingdom1, q_table, alpha=0, gamma=gamma, epsilon=0.6)
+        if recorder is not None:
+            recorder.record(episode, turn_count, 1, action, state, reward, attack_outcome(action, state, kingdom1))
         turn_count += 1
         
     return q_table
@@ -245,45 +239,68 @@ def run_episode(q_table, alpha=alpha, gamma=gamma, epsilon=epsilon_start, max_tu
 # Training Loop
 #---------------------------------------------------------*/
 
-def train_q_learning(q_table=q_table, total_episodes=1000, epsilon=epsilon_start, alpha=alpha):
+def train_q_learning(q_table=q_table, total_episodes=1000, epsilon=epsilon_start, alpha=alpha, checkpoint_every=None,
+                     save_csv=False, metrics=None, eval_games=None, trace_path=None):
     """
     Train a Q-learning agent over a specified number of episodes.
 
     Parameters:
     - `total_episodes` (int): The total number of episodes for training the agent.
     - `q_table` (numpy.ndarray): The initial Q-table to be used and updated during training.
+    - `checkpoint_every` (int, optional): Write a checkpoint every N episodes (atomically replaced).
+    - `save_csv` (bool): Additionally export the trained Q-table as CSV (slow for large tables).
+    - `metrics` (TrainingMetrics, optional): Receives the evaluation points (default: plotted at the end).
+    - `eval_games` (int, optional): Evaluate every 100 episodes with this many games in a background
+      process (`BackgroundEvaluator`) instead of one `evaluation_game` in the training loop.
+    - `trace_path` (str, optional): Record every turn of the training episodes in this trace file
+      (see utils/traces.py).
 
     The function runs multiple episodes of Q-learning, updates the Q-table, and evaluates the agent's performance 
-    periodically. After training, the function saves the trained Q-table in both CSV and NPY formats and plots 
-    the win rate and average reward over time.
+    periodically. After training, the function saves the trained Q-table as checkpoint (see utils/checkpoint.py)
+    and plots the win rate and average reward over time.
     """
 
-    win_rates = []
-    average_rewards = []
-    action_freqs_total = []
+    from tqdm import tqdm  # Only needed for training, `game` imports this module as well
 
-    # Run multiple episodes to train the Q-table
-    for episode in tqdm(range(total_episodes)):
-        
-        
-        run_episode(q_table, epsilon=epsilon_start, alpha=alpha)
-        epsilon = max(epsilon_min, epsilon_decay_rate * epsilon)
+    if metrics is None:
+        metrics = TrainingMetrics(capacity=total_episodes // 100 + 1, action_names=action_names).subscribe(PlotSink())
+
+    evaluator = BackgroundEvaluator(q_table, eval_games) if eval_games else None
+    recorder = TraceRecorder(trace_path, model="q_learning") if trace_path else None
+
+    try:
+        # Run multiple episodes to train the Q-table
+        for episode in tqdm(range(total_episodes)):
+
+
+            run_episode(q_table, epsilon=epsilon_start, alpha=alpha, recorder=recorder, episode=episode)
+            epsilon = max(epsilon_min, epsilon_decay_rate * epsilon)
+
+            if episode % 100 == 0 and evaluator:  # Snapshot for the background evaluation
+                evaluator.submit(episode, q_table)
+                for point in evaluator.poll():
+                    metrics.record(*point)
+            elif episode % 100 == 0:  # Evaluate every 100 episodes
+                win_rate, avg_reward, action_freq = evaluation_game(q_table)
+                metrics.record(episode, win_rate, avg_reward, action_freq)
+                # print(f"Episode: {episode}, Win Rate: {win_rate}, Average Reward: {avg_reward}")
 
-        if episode % 100 == 0:  # Evaluate every 100 episodes
-            win_rate, avg_reward, action_freq = evaluation_game(q_table)
-            win_rates.append(win_rate)
-            average_rewards.append(avg_reward)
-            action_freqs_total.append(action_freq)
-            # print(f"Episode: {episode}, Win Rate: {win_rate}, Average Reward: {avg_reward}")
+            if checkpoint_every and (episode + 1) % checkpoint_every == 0:
+                save_checkpoint(q_table, buckets=encoder.buckets, action_names=action_names, episodes=episode + 1)
+    finally:
+        recorder.close() if recorder else None
+        for point in (evaluator.close() if evaluator else []):
+            metrics.record(*point)
 
-    plot_evaluation(action_freqs_total, win_rates, average_rewards)
+    metrics.close()
     
-    print(win_rates) if PRINTER else None
-    print(action_freqs_total) if PRINTER else None
+    print(metrics.view()[1]) if PRINTER else None
+    print(metrics.view()[3]) if PRINTER else None
     
     q_table_trained = q_table
-    np.savetxt("./out/q_table.csv", q_table, delimiter=",")
-    np.save("./out/q_table.npy", q_table)
+    save_checkpoint(q_table, buckets=encoder.buckets, action_names=action_names, episodes=total_episodes)
+    if save_csv:
+        export_csv(q_table)
     
     return q_table_trained
             
@@ -0,0 +1,116 @@
+#---------------------------------------------------------*\
+# Title: Greedy Policy (read-only artifact, batched inference)
+# Author:
+#---------------------------------------------------------*/
+#!/usr/bin/env python3
+
+import os
+import numpy as np
+from models.model import encoder, max_turns, action_names, play_action
+from utils.checkpoint import save_checkpoint, load_checkpoint, load_q_table, read_header
+
+default_policy_path = "./out/policy.qpol"
+
+class GreedyPolicy:
+    """
+    The greedy policy of a Q-table, precomputed once: the best action of every state as one uint8
+    array (ties resolved like `np.argmax`, the lowest action wins), the second-best action and a
+    flag for the states in which both have the same Q-value. A move is one index lookup, a batch
+    of moves one gather (`act`); nothing here reads or writes Q-values, so a policy can be played
+    and served without the learning path (3 bytes per state instead of 32).
+
+    The object has the interfaces of a tournament player (`__call__`) and of the `model` argument
+    of `evaluation_game` / `evaluate_agent` (`take_turn`, `max_turns`, `action_names`).
+    """
+
+    def __init__(self, actions, second=None, tied=None, encoder=encoder, max_turns=max_turns, action_names=action_names):
+        self.actions = np.asarray(actions, dtype=np.uint8)
+        self.second = np.asarray(second if second is not None else actions, dtype=np.uint8)
+        self.tied = np.asarray(tied if tied is not None else np.zeros(len(self.actions)), dtype=bool)
+        self.encoder = encoder
+        self.max_turns = max_turns
+        self.action_names = action_names
+        self._action_list = self.actions.tolist()  # Python lists are faster for single lookups
+
+    def __len__(self):
+        return len(self.actions)
+
+    @classmethod
+    def from_q_table(cls, q_table, encoder=encoder):
+        """Best and second-best action per state of a Q-table (any backend, see models/q_table.py)."""
+        q_table = np.asarray(q_table)
+        order = np.argsort(-q_table, axis=1, kind="stable")[:, :2]  # Stable: ties keep the lower action first
+        best_values, second_values = np.take_along_axis(q_table, order, axis=1).T
+        return cls(order[:, 0], order[:, 1], best_values == second_values, encoder)
+
+    @classmethod
+    def from_table(cls, table, encoder=encoder):
+        """Policy of an n_states x 3 uint8 table (best, second-best, tied), see `table`."""
+        return cls(table[:, 0], table[:, 1], table[:, 2].astype(bool), encoder)
+
+    def table(self):
+        """The policy as one n_states x 3 uint8 array (best, second-best, tied), the file layout."""
+        return np.stack([self.actions, self.second, self.tied.astype(np.uint8)], axis=1)
+
+    # ---------------------------------------------------------*/
+    # Inference
+    # ---------------------------------------------------------*/
+    def act(self, state_indices, rng=None):
+        """
+        Actions (0-3) of a batch of state indices. With `rng` (np.random.Generator) the states in
+        which the two best actions are tied get one of them at random, otherwise the result equals
+        `np.argmax` over the Q-table rows.
+        """
+        state_indices = np.asarray(state_indices)
+        actions = self.actions[state_indices]
+        if rng is not None:
+            swap = self.tied[state_indices] & (rng.random(state_indices.shape) < 0.5)
+            actions = np.where(swap, self.second[state_indices], actions)
+        return actions
+
+    def act_batch(self, kingdoms, opponents, rng=None):
+        """Actions of a `KingdomBatch` against another one."""
+        return self.act(self.encoder.encode_batch(kingdoms, opponents), rng)
+
+    def action(self, kingdom, opponent):
+        """Action (0-3) of a single state."""
+        return self._action_list[self.encoder.encode(kingdom, opponent)]
+
+    def __call__(self, kingdom, opponent, rng=None):
+        """Player interface of `run_tournament` (choices 1-4)."""
+        return 1 + self._action_list[self.encoder.encode(kingdom, opponent)]
+
+    def take_turn(self, kingdom, opponent, q_table=None, alpha=0, gamma=None, epsilon=0):
+        """
+        Single turn with the interface of `models.model.take_turn` (for `evaluation_game`), without
+        an update. It draws from `np.random` exactly like `choose_action`, so seeded evaluations
+        give the same games as with the Q-table.
+        """
+        if np.random.random() < epsilon:
+            action = np.random.randint(4)
+        else:
+            action = self._action_list[self.encoder.encode(kingdom, opponent)]
+
+        reward = play_action(kingdom, opponent, action, self.encoder)
+        return (kingdom.castle_strength <= 0 or opponent.castle_strength <= 0, reward, action)
+
+    # ---------------------------------------------------------*/
+    # Files
+    # ---------------------------------------------------------*/
+    def save(self, path=default_policy_path, **extra):
+        """Writes the policy as checkpoint (n_states x 3 uint8: best, second-best, tied)."""
+        save_checkpoint(self.table(), path, buckets=self.encoder.buckets, action_names=self.action_names,
+                        model="greedy_policy", columns=["best", "second", "tied"], **extra)
+
+    @classmethod
+    def load(cls, path=default_policy_path, encoder=encoder):
+        """Loads a policy file, or builds the policy of a Q-table checkpoint / `.npy` file."""
+        if os.path.exists(path) and not path.endswith(".npy") and read_header(path)[0].get("model") == "greedy_policy":
+            table, _ = load_checkpoint(path, mmap=False, verify=True, expected_buckets=encoder.buckets)
+            return cls.from_table(table, encoder)
+        return cls.from_q_table(load_q_table(path, expected_buckets=encoder.buckets), encoder)
+
+#-------------------------Notes-----------------------------------------------*\
+# The random tie-break of `act` only chooses between the two best actions; in
+# unvisited states (all Q-values 0) all four actions are tied.
+#-----------------------------------------------------------------------------*\
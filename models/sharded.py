@@ -0,0 +1,127 @@
+#---------------------------------------------------------*\
+# Title: Sharded Training (seeded shards, visit-weighted merge)
+# Author:
+#---------------------------------------------------------*/
+#!/usr/bin/env python3
+
+import os
+import glob
+import hashlib
+import numpy as np
+from multiprocessing import Pool
+from models.model import encoder, n_actions, action_names
+from models.batch_model import train_q_learning_batched
+from utils.checkpoint import save_checkpoint, load_checkpoint
+
+shard_directory = "./out/shards"
+
+#---------------------------------------------------------*/
+# Shards
+#---------------------------------------------------------*/
+def shard_episodes(total_episodes, n_shards, shard):
+    """Episodes of one shard (the first `total_episodes % n_shards` shards play one more)."""
+    return total_episodes // n_shards + (shard < total_episodes % n_shards)
+
+def shard_seed(seed, n_shards, shard):
+    """Seed of one shard, spawned from `seed`: independent of where and in which order shards run."""
+    return np.random.SeedSequence(seed).spawn(n_shards)[shard]
+
+def train_shard(shard, n_shards, total_episodes=10000, seed=0, n_envs=1000):
+    """
+    Trains one shard: its slice of the episode budget with the lockstep trainer
+    (`train_q_learning_batched`), from an empty Q-table and with its own `np.random.Generator`.
+    Nothing uses the global `np.random` / `random` state, so a shard is reproducible on any machine.
+
+    Returns the Q-table of the shard and its visit counts (updates per (state, action) cell).
+    """
+    if not 0 <= shard < n_shards:
+        raise ValueError(f"Shard {shard} does not exist, a run of {n_shards} shards has the shards 0 - {n_shards - 1}.")
+    q_table = np.zeros((encoder.n_states, n_actions))
+    visits = np.zeros((encoder.n_states, n_actions), dtype=np.int64)
+    n_episodes = shard_episodes(total_episodes, n_shards, shard)
+    if n_episodes:
+        train_q_learning_batched(q_table, n_episodes, n_envs, seed=shard_seed(seed, n_shards, shard),
+                                 save=False, plot=False, progress=False, visits=visits)
+    return q_table, visits
+
+def _train_shard(task):
+    return train_shard(*task)
+
+def merge_shards(q_tables, visits):
+    """
+    Visit-weighted average of the shard tables: every cell is Σ_k n_k * Q_k / Σ_k n_k over the
+    shards k that visited it (0 if no shard did). The shards are summed in their given order, so
+    the result is bit-identical for the same shards. Returns the merged table and the total visits.
+    """
+    weighted = np.zeros(q_tables[0].shape)
+    total = np.zeros(q_tables[0].shape, dtype=np.int64)
+    for q_table, counts in zip(q_tables, visits):
+        weighted += counts * np.asarray(q_table, dtype=np.float64)
+        total += counts
+    return np.divide(weighted, total, out=np.zeros_like(weighted), where=total > 0), total
+
+#---------------------------------------------------------*/
+# Files (one pair of checkpoints per shard)
+#---------------------------------------------------------*/
+def save_shard(q_table, visits, shard, n_shards, total_episodes, seed, directory=shard_directory):
+    meta = {"shard": shard, "n_shards": n_shards, "total_episodes": total_episodes, "seed": seed}
+    path = os.path.join(directory, f"shard_{shard:03d}_of_{n_shards:03d}.qtab")
+    save_checkpoint(q_table, path, buckets=encoder.buckets, action_names=action_names,
+                    episodes=shard_episodes(total_episodes, n_shards, shard), model="shard", **meta)
+    save_checkpoint(visits, path.replace(".qtab", ".visits.qtab"), buckets=encoder.buckets, model="shard_visits", **meta)
+    return path
+
+def load_shards(directory=shard_directory):
+    """Loads all shards of a directory (sorted by shard), checks that they belong to one complete run."""
+    paths = sorted(glob.glob(os.path.join(directory, "shard_*_of_*[0-9].qtab")))
+    if not paths:
+        raise FileNotFoundError(f"No shards in {directory}.")
+    q_tables, visits, headers = [], [], []
+    for path in paths:
+        q_table, header = load_checkpoint(path, mmap=False, verify=True, expected_buckets=encoder.buckets)
+        counts, _ = load_checkpoint(path.replace(".qtab", ".visits.qtab"), mmap=False, verify=True)
+        q_tables.append(q_table)
+        visits.append(counts)
+        headers.append(header)
+
+    run = {(h["n_shards"], h["total_episodes"], h["seed"]) for h in headers}
+    if len(run) > 1:
+        raise ValueError(f"Shards of different runs in {directory}: {sorted(run)}.")
+    if [h["shard"] for h in headers] != list(range(headers[0]["n_shards"])):
+        raise ValueError(f"Incomplete run in {directory}: shards {[h['shard'] for h in headers]} of {headers[0]['n_shards']}.")
+    return q_tables, visits, headers[0]
+
+#---------------------------------------------------------*/
+# Training Loop
+#---------------------------------------------------------*/
+def train_sharded(total_episodes=10000, n_shards=4, seed=0, n_envs=1000, n_workers=None, save=True):
+    """
+    Trains `n_shards` shards (in parallel worker processes, `n_workers` None = all cores, 1 = no
+    pool) and merges them with `merge_shards`. The same `seed` and `n_shards` give a bit-identical
+    table, no matter how many workers (or machines, see `train_shard` / `save_shard` /
+    `load_shards`) are used.
+
+    Returns the merged Q-table and the total visit counts.
+    """
+    n_workers = min(n_workers or os.cpu_count(), n_shards)
+    tasks = [(shard, n_shards, total_episodes, seed, n_envs) for shard in range(n_shards)]
+    if n_workers > 1:
+        with Pool(n_workers) as pool:
+            results = pool.map(_train_shard, tasks)
+    else:
+        results = [_train_shard(task) for task in tasks]
+
+    q_table, visits = merge_shards([result[0] for result in results], [result[1] for result in results])
+    if save:
+        save_checkpoint(q_table, buckets=encoder.buckets, action_names=action_names, episodes=total_episodes,
+                        model="sharded", n_shards=n_shards, seed=seed)
+    return q_table, visits
+
+def digest(q_table):
+    """SHA-256 of a table (compare runs across machines)."""
+    return hashlib.sha256(np.ascontiguousarray(q_table).data).hexdigest()
+
+#-------------------------Notes-----------------------------------------------*\
+# Bit-identical results need the same NumPy version on all machines (the
+# generator streams and the float reductions are part of NumPy).
+#-----------------------------------------------------------------------------*\
@@ -0,0 +1,247 @@
+#---------------------------------------------------------*\
+# Title: Exact Expectimax Solver (raw state space)
+# Author:
+#---------------------------------------------------------*/
+#!/usr/bin/env python3
+
+import os
+import json
+import hashlib
+import numpy as np
+from src.Kingdom import Kingdom
+from src.KingdomBatch import KingdomBatch
+from models.model import encoder, n_actions
+
+def material_value(states):
+    """Heuristic score in [0.25, 0.75] for unfinished games, from the castle strength and soldiers
+    of both kingdoms ((6, N) attribute arrays, own kingdom first)."""
+    advantage = (states[0] + states[2]) - (states[3] + states[5])
+    return 0.5 + 0.25 * np.tanh(advantage / 50)
+
+class ExpectimaxSolver:
+    """
+    Exact solver for the game against a fixed stochastic opponent, over the raw (undiscretized) states.
+
+    The agent moves at turns 0, 2, 4, ... and the game is a draw once the agent has moved at a turn
+    `t` with `t + 1 >= max_turns` (the same cap as in `run_episode` and `evaluation_game`). The
+    opponent plays like `Kingdom B` in `run_episode`: a random action with probability
+    `opponent_epsilon`, otherwise the greedy action of `q_table` (uniformly random without a table).
+    The solver maximizes the expected evaluation score (win = 1, draw = 0.5, loss = 0).
+
+    `solve` enumerates all reachable states layer by layer (one layer per agent turn), then computes
+    the values by backward induction. Every layer is a sorted array of packed (own, opponent, turn)
+    keys, which serves as transposition table, next to the values and best actions of the states.
+    Solved layers are cached in `cache_dir`.
+
+    `horizon_value` (optional) replaces the draw score of 0.5 for games that reach `max_turns`
+    without a winner, e.g. `material_value`. This is not exact anymore, but gives the receding-horizon
+    game AI something to play for early in the game (such solutions are not cached).
+
+    The number of reachable states grows about five-fold per round (~4.5 million states at turn 14
+    from the starting position), so full 50-turn games are out of reach. Within `max_turns` the
+    solution is exact; as game AI the solver is used with a receding horizon.
+    """
+
+    def __init__(self, q_table=None, opponent_epsilon=0.6, max_turns=12, encoder=encoder, cache_dir="./out/solver",
+                 horizon_value=None):
+        self.q_table = q_table
+        self.opponent_epsilon = opponent_epsilon if q_table is not None else 1.0
+        self.max_turns = max_turns
+        self.horizon = max_turns  # Longest horizon when used as receding-horizon game AI
+        self.encoder = encoder
+        self.cache_dir = cache_dir
+        self.horizon_value = horizon_value
+
+        self.root = None
+        self.layers = {}  # turn -> (keys, values, best actions)
+
+    # ---------------------------------------------------------*/
+    # Packed states
+    # ---------------------------------------------------------*/
+    def _configure(self, root, turn):
+        """Chooses the bit widths of the packed keys, so that every reachable value fits."""
+        moves = self.max_turns // 2 + 1
+        castle_strength = max(root[0], root[3]) + 10 * moves
+        resources = max(root[1], root[4]) + 10 * moves
+        soldiers = max(root[2], root[5]) + 5 * moves
+        widths = [int(value).bit_length() for value in (castle_strength, resources, soldiers)] * 2
+        widths.append((turn + self.max_turns + 2).bit_length())
+        if sum(widths) > 63:
+            raise ValueError("State too large to be packed into 64 bits, reduce max_turns.")
+        self._shifts = np.cumsum([0] + widths[:-1]).tolist()
+        self._masks = [(1 << width) - 1 for width in widths]
+
+    def pack(self, states, turn):
+        """Packs (6, N) attribute arrays (own castle/resources/soldiers, then opponent) and the turn."""
+        keys = np.full(states.shape[1], turn << self._shifts[6], dtype=np.int64)
+        for field in range(6):
+            keys |= states[field] << self._shifts[field]
+        return keys
+
+    def unpack(self, keys):
+        """Inverse of `pack`, returns the (6, N) attribute arrays."""
+        return np.stack([(keys >> self._shifts[field]) & self._masks[field] for field in range(6)])
+
+    # ---------------------------------------------------------*/
+    # Transitions
+    # ---------------------------------------------------------*/
+    @staticmethod
+    def _step(states, action, opponent_moves=False):
+        """Applies one action to all states, either for the agent or for the opponent."""
+        own = KingdomBatch(states.shape[1])
+        opp = KingdomBatch(states.shape[1])
+        own.castle_strength, own.resources, own.soldiers = states[0:3].copy()
+        opp.castle_strength, opp.resources, opp.soldiers = states[3:6].copy()
+        actions = np.full(states.shape[1], action)
+        if opponent_moves:
+            opp.step(actions, own)
+        else:
+            own.step(actions, opp)
+        return np.stack([own.castle_strength, own.resources, own.soldiers,
+                         opp.castle_strength, opp.resources, opp.soldiers])
+
+    def _opponent_policy(self, states):
+        """Action probabilities (N, 4) of the opponent in the given states (opponent to move)."""
+        probs = np.full((states.shape[1], n_actions), self.opponent_epsilon / n_actions)
+        if self.q_table is not None:
+            indices = self.encoder.encode_arrays(*states[3:6], *states[0:3])
+            greedy = np.argmax(self.q_table[indices], axis=1)
+            probs[np.arange(states.shape[1]), greedy] += 1 - self.opponent_epsilon
+        return probs
+
+    def _expand(self, states, turn):
+        """Yields, per agent action, the states after it, the outcome flags, the opponent probabilities
+        and the successor states."""
+        for action in range(n_actions):
+            after = self._step(states, action)
+            won = after[3] <= 0
+            draw = ~won & (turn + 1 >= self.max_turns)
+            probs = self._opponent_policy(after)
+            successors = [self._step(after, reply, opponent_moves=True) for reply in range(n_actions)]
+            yield action, after, won, draw, probs, successors
+
+    # ---------------------------------------------------------*/
+    # Solving
+    # ---------------------------------------------------------*/
+    def solve(self, kingdom=None, opponent=None, turn=0, cache=True):
+        """
+        Solves the game from the given state (agent to move at `turn`, default: the starting
+        position) and returns its value. With `cache`, solved layers are read from and written to
+        `cache_dir`.
+        """
+        kingdom = kingdom or Kingdom("Kingdom A")
+        opponent = opponent or Kingdom("Kingdom B")
+        root = tuple(int(value) for value in (kingdom.castle_strength, kingdom.resources, kingdom.soldiers,
+                                              opponent.castle_strength, opponent.resources, opponent.soldiers))
+        self._configure(root, turn)
+        self.root = (root, turn)
+
+        cache = cache and self.horizon_value is None
+        path = os.path.join(self.cache_dir, f"{self._cache_key()}.npz")
+        if cache and os.path.exists(path):
+            self.load(path)
+            return self.value(kingdom, opponent, turn)
+
+        # Forward: enumerate the reachable states of every layer (agent to move)
+        states = np.array(root, dtype=np.int64).reshape(6, 1)
+        layer_states = {}
+        t = turn
+        while states.shape[1]:
+            layer_states[t] = states
+            if t + 1 >= self.max_turns:
+                break
+            candidates = []
+            for _, _, won, draw, _, successors in self._expand(states, t):
+                for successor in successors:
+                    alive = ~won & ~draw & (successor[0] > 0)
+                    candidates.append(self.pack(successor[:, alive], t + 2))
+            keys = np.unique(np.concatenate(candidates))
+            states = self.unpack(keys)
+            t += 2
+
+        # Backward: values by backward induction (transposition table = sorted keys per layer)
+        self.layers = {}
+        for t in sorted(layer_states, reverse=True):
+            states = layer_states[t]
+            q_values = self._q_values(states, t)
+            self.layers[t] = (self.pack(states, t), q_values.max(axis=1), np.argmax(q_values, axis=1).astype(np.uint8))
+            del layer_states[t]
+
+        if cache:
+            self.save(path)
+        return self.value(kingdom, opponent, turn)
+
+    def _q_values(self, states, turn, next_layer=None):
+        """Expected scores (N, 4) of the agent's actions, using the solved layer of `turn + 2`."""
+        next_keys, next_values, _ = next_layer or self.layers.get(turn + 2, (np.zeros(1, np.int64), np.zeros(1), None))
+        q_values = np.zeros((states.shape[1], n_actions))
+        for action, after, won, draw, probs, successors in self._expand(states, turn):
+            expected = np.zeros(states.shape[1])
+            for reply, successor in enumerate(successors):
+                lost = successor[0] <= 0
+                index = np.minimum(np.searchsorted(next_keys, self.pack(successor, turn + 2)), len(next_keys) - 1)
+                expected += probs[:, reply] * np.where(lost, 0.0, next_values[index])
+            horizon = 0.5 if self.horizon_value is None else self.horizon_value(after)
+            q_values[:, action] = np.where(won, 1.0, np.where(draw, horizon, expected))
+        return q_values
+
+    def policy_value(self, q_table):
+        """Expected score of the greedy policy of `q_table` from the solved root, against the same
+        opponent (ground truth to compare trained tables with the optimal value)."""
+        values = {}
+        for t in sorted(self.layers, reverse=True):
+            keys = self.layers[t][0]
+            states = self.unpack(keys)
+            next_layer = (self.layers[t + 2][0], values[t + 2], None) if t + 2 in values else None
+            q_values = self._q_values(states, t, next_layer)
+            greedy = np.argmax(q_table[self.encoder.encode_arrays(*states[0:3], *states[3:6])], axis=1)
+            values[t] = q_values[np.arange(len(keys)), greedy]
+        return float(values[self.root[1]][0])
+
+    # ---------------------------------------------------------*/
+    # Lookups
+    # ---------------------------------------------------------*/
+    def _lookup(self, kingdom, opponent, turn):
+        keys, values, actions = self.layers[turn]
+        state = np.array([kingdom.castle_strength, kingdom.resources, kingdom.soldiers,
+                          opponent.castle_strength, opponent.resources, opponent.soldiers], dtype=np.int64)
+        key = self.pack(state.reshape(6, 1), turn)[0]
+        index = np.searchsorted(keys, key)
+        if index == len(keys) or keys[index] != key:
+            raise KeyError("State was not reached from the solved root.")
+        return values[index], actions[index]
+
+    def value(self, kingdom, opponent, turn=0):
+        """Exact expected score of a solved state (agent to move)."""
+        return float(self._lookup(kingdom, opponent, turn)[0])
+
+    def best_action(self, kingdom, opponent, turn=0):
+        """Optimal action (0 = Gather Resources, ..., 3 = Attack) of a solved state."""
+        return int(self._lookup(kingdom, opponent, turn)[1])
+
+    # ---------------------------------------------------------*/
+    # On-Disk Cache
+    # ---------------------------------------------------------*/
+    def _cache_key(self):
+        config = {"root": self.root, "max_turns": self.max_turns, "opponent_epsilon": self.opponent_epsilon,
+                  "buckets": self.encoder.buckets}
+        digest = hashlib.sha1(json.dumps(config).encode())
+        if self.q_table is not None:
+            digest.update(np.ascontiguousarray(self.q_table).tobytes())
+        return digest.hexdigest()[:16]
+
+    def save(self, path):
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        arrays = {}
+        for t, (keys, values, actions) in self.layers.items():
+            arrays[f"keys_{t}"], arrays[f"values_{t}"], arrays[f"actions_{t}"] = keys, values, actions
+        np.savez(path, **arrays)
+
+    def load(self, path):
+        with np.load(path) as data:
+            turns = sorted(int(name.split("_")[1]) for name in data.files if name.startswith("keys_"))
+            self.layers = {t: (data[f"keys_{t}"], data[f"values_{t}"], data[f"actions_{t}"]) for t in turns}
+
+#-------------------------Notes-----------------------------------------------*\
+#
+#-----------------------------------------------------------------------------*\
@@ -0,0 +1,121 @@
+#---------------------------------------------------------*\
+# Title: State Encoder (precomputed lookup tables)
+# Author:
+#---------------------------------------------------------*/
+#!/usr/bin/env python3
+
+import numpy as np
+
+class StateEncoder:
+    """
+    Maps the raw attributes of two kingdoms to a Q-table index with precomputed lookup tables.
+
+    The buckets are the same as in `discretize_state`: castle strength is split over [0, 100],
+    resources and soldiers over [0, 75], everything above falls into the last bucket. For every
+    attribute the bucket of each value in that range is computed once, and pre-multiplied by its
+    place value in the linear index (as in `get_state_index`). Encoding a state is then six
+    lookups and a sum, values beyond the range are clipped to the last table entry.
+    """
+
+    def __init__(self, castle_strength_buckets=3, resource_buckets=3, soldier_buckets=5):
+        self.castle_strength_buckets = castle_strength_buckets
+        self.resource_buckets = resource_buckets
+        self.soldier_buckets = soldier_buckets
+        self.buckets = (castle_strength_buckets, resource_buckets, soldier_buckets)
+
+        # Number of states for a single kingdom and for both kingdoms (Q-table rows)
+        self.n_kingdom_states = castle_strength_buckets * resource_buckets * soldier_buckets
+        self.n_states = self.n_kingdom_states ** 2
+
+        # Bucket per raw value, identical to `min(int(value / (range / buckets)), buckets - 1)`
+        self.castle_strength_lut = self._bucket_lut(100, castle_strength_buckets)
+        self.resource_lut = self._bucket_lut(75, resource_buckets)
+        self.soldier_lut = self._bucket_lut(75, soldier_buckets)
+
+        # Place values of the buckets in the linear index (Kingdom A is scaled by all states of B)
+        place_values = (resource_buckets * soldier_buckets, soldier_buckets, 1)
+        luts = (self.castle_strength_lut, self.resource_lut, self.soldier_lut)
+        self._opponent_luts = [lut * place for lut, place in zip(luts, place_values)]
+        self._own_luts = [lut * self.n_kingdom_states for lut in self._opponent_luts]
+        self._top = [len(lut) - 1 for lut in luts]
+
+        # Python lists are faster than NumPy arrays for single lookups
+        self._bucket_lists = [lut.tolist() for lut in luts]
+        self._own_lists = [lut.tolist() for lut in self._own_luts]
+        self._opponent_lists = [lut.tolist() for lut in self._opponent_luts]
+
+    @staticmethod
+    def _bucket_lut(value_range, buckets):
+        values = np.arange(value_range + 2)
+        return np.array([min(int(value / (value_range / buckets)), buckets - 1) for value in values], dtype=np.int64)
+
+    # ---------------------------------------------------------*/
+    # Scalar API (Kingdom objects)
+    # ---------------------------------------------------------*/
+    def discretize(self, kingdom):
+        """Bucket tuple (castle_strength, resources, soldiers) of a kingdom, like `discretize_state`."""
+        castle_strength, resources, soldiers = self._bucket_lists
+        top_c, top_r, top_s = self._top
+        return (castle_strength[min(kingdom.castle_strength, top_c)],
+                resources[min(kingdom.resources, top_r)],
+                soldiers[min(kingdom.soldiers, top_s)])
+
+    def index(self, state1, state2):
+        """Linear Q-table index of two bucket tuples, like `get_state_index`."""
+        return (state1[0] * (self.resource_buckets * self.soldier_buckets) + state1[1] * self.soldier_buckets
+                + state1[2]) * self.n_kingdom_states + (state2[0] * (self.resource_buckets * self.soldier_buckets)
+                + state2[1] * self.soldier_buckets + state2[2])
+
+    def encode(self, kingdom, opponent):
+        """Q-table index of the state seen by `kingdom` (same as discretizing both and indexing)."""
+        own_c, own_r, own_s = self._own_lists
+        opp_c, opp_r, opp_s = self._opponent_lists
+        top_c, top_r, top_s = self._top
+        return (own_c[min(kingdom.castle_strength, top_c)] + own_r[min(kingdom.resources, top_r)]
+                + own_s[min(kingdom.soldiers, top_s)] + opp_c[min(opponent.castle_strength, top_c)]
+                + opp_r[min(opponent.resources, top_r)] + opp_s[min(opponent.soldiers, top_s)])
+
+    def decode(self, index):
+        """Inverse of `encode` on the bucket level, returns the bucket tuples of both kingdoms."""
+        state1, state2 = divmod(int(index), self.n_kingdom_states)
+        return self._unravel(state1), self._unravel(state2)
+
+    def _unravel(self, kingdom_index):
+        castle_strength, rest = divmod(kingdom_index, self.resource_buckets * self.soldier_buckets)
+        resources, soldiers = divmod(rest, self.soldier_buckets)
+        return castle_strength, resources, soldiers
+
+    # ---------------------------------------------------------*/
+    # Vectorized API (KingdomBatch or attribute arrays)
+    # ---------------------------------------------------------*/
+    def discretize_batch(self, kingdoms):
+        """Bucket arrays (castle_strength, resources, soldiers) of a `KingdomBatch`."""
+        return tuple(lut[np.minimum(values, top)] for lut, values, top in
+                     zip((self.castle_strength_lut, self.resource_lut, self.soldier_lut),
+                         (kingdoms.castle_strength, kingdoms.resources, kingdoms.soldiers), self._top))
+
+    def encode_batch(self, kingdoms, opponents):
+        """Q-table indices for a `KingdomBatch` (or any object with the three attribute arrays)."""
+        return self.encode_arrays(kingdoms.castle_strength, kingdoms.resources, kingdoms.soldiers,
+                                  opponents.castle_strength, opponents.resources, opponents.soldiers)
+
+    def encode_arrays(self, castle_strength1, resources1, soldiers1, castle_strength2, resources2, soldiers2):
+        """Q-table indices from the raw attribute arrays of both kingdoms."""
+        own_c, own_r, own_s = self._own_luts
+        opp_c, opp_r, opp_s = self._opponent_luts
+        top_c, top_r, top_s = self._top
+        return (own_c[np.minimum(castle_strength1, top_c)] + own_r[np.minimum(resources1, top_r)]
+                + own_s[np.minimum(soldiers1, top_s)] + opp_c[np.minimum(castle_strength2, top_c)]
+                + opp_r[np.minimum(resources2, top_r)] + opp_s[np.minimum(soldiers2, top_s)])
+
+    def decode_batch(self, indices):
+        """Vectorized `decode`, returns two tuples of bucket arrays."""
+        state1, state2 = np.divmod(np.asarray(indices), self.n_kingdom_states)
+        return self._unravel_batch(state1), self._unravel_batch(state2)
+
+    def _unravel_batch(self, kingdom_indices):
+        return np.unravel_index(kingdom_indices, self.buckets)
+
+#-------------------------Notes-----------------------------------------------*\
+#
+#-----------------------------------------------------------------------------*\
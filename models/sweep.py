@@ -0,0 +1,184 @@
+#---------------------------------------------------------*\
+# Title: Hyperparameter Sweep (Successive Halving / Hyperband)
+# Author:
+#---------------------------------------------------------*/
+#!/usr/bin/env python3
+
+import os
+import json
+import math
+import time
+import numpy as np
+from concurrent.futures import ProcessPoolExecutor
+from models.state_encoder import StateEncoder
+from models.batch_model import train_q_learning_batched, evaluate_q_table_batched
+from utils.checkpoint import save_checkpoint, load_checkpoint
+
+#---------------------------------------------------------*/
+# Parameters
+#---------------------------------------------------------*/
+
+# Default search space: lists are sampled uniformly, (low, high) tuples log-uniformly
+search_space = {
+    "castle_strength_buckets": [3, 5, 8, 10],
+    "resource_buckets": [3, 5, 8, 10],
+    "soldier_buckets": [3, 5, 8, 10],
+    "alpha": (0.05, 0.9),
+    "gamma": [0.8, 0.9, 0.95, 0.99],
+    "epsilon_decay_rate": (0.999, 0.99999),
+}
+
+results_path = "./out/sweep_results.jsonl"
+checkpoint_dir = "./out/sweep"  # Q-tables of the running trials, one directory per sweep
+
+#---------------------------------------------------------*/
+# Functions (Helper)
+#---------------------------------------------------------*/
+def sample_configs(space, n_configs, rng):
+    """Draws `n_configs` random configurations from the search space."""
+    configs = []
+    for _ in range(n_configs):
+        config = {}
+        for name, values in space.items():
+            if isinstance(values, tuple):
+                low, high = values
+                config[name] = float(math.exp(rng.uniform(math.log(low), math.log(high))))
+            else:
+                config[name] = values[rng.integers(len(values))]
+                config[name] = config[name].item() if hasattr(config[name], "item") else config[name]
+        configs.append(config)
+    return configs
+
+def run_trial(task):
+    """
+    Trains one configuration for `episodes` more episodes (continuing from the checkpoint of its last
+    rung, if given) and evaluates it. Runs in a worker process; the Q-table is written to
+    `checkpoint`, only the metrics and wall-clock go back to the parent.
+    """
+    trial_id, config, checkpoint, start_episode, episodes, eval_games, seed = task
+    started = time.perf_counter()
+
+    encoder = StateEncoder(config.get("castle_strength_buckets", 3), config.get("resource_buckets", 3),
+                           config.get("soldier_buckets", 5))
+    q_table = load_checkpoint(checkpoint, mmap=False, expected_buckets=encoder.buckets)[0] if start_episode else None
+    q_table = train_q_learning_batched(q_table=q_table, total_episodes=episodes, seed=seed, encoder=encoder,
+                                       alpha=config.get("alpha", 0.9), gamma=config.get("gamma", 0.9),
+                                       epsilon_decay_rate=config.get("epsilon_decay_rate"),
+                                       start_episode=start_episode, save=False, plot=False, progress=False)
+    save_checkpoint(q_table, checkpoint, buckets=encoder.buckets, episodes=start_episode + episodes, config=config)
+    wins, rewards, _ = evaluate_q_table_batched(q_table, eval_games, seed=seed, encoder=encoder)
+
+    metrics = {"win_rate": float(wins.mean()), "average_reward": float(rewards.mean())}
+    return trial_id, metrics, time.perf_counter() - started
+
+def write_result(record, path=results_path):
+    """Appends one trial record to the local results store (one JSON object per line)."""
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    with open(path, "a") as f:
+        f.write(json.dumps(record) + "\n")
+
+def load_results(path=results_path, sweep_id=None):
+    """Reads all records of the results store (optionally of one sweep only)."""
+    if not os.path.exists(path):
+        return []
+    with open(path) as f:
+        records = [json.loads(line) for line in f if line.strip()]
+    return [r for r in records if sweep_id is None or r["sweep_id"] == sweep_id]
+
+#---------------------------------------------------------*/
+# Functions (Main)
+#---------------------------------------------------------*/
+def successive_halving(space=search_space, n_configs=27, min_episodes=1000, eta=3, n_rungs=None, eval_games=500,
+                       n_workers=None, seed=None, path=results_path, sweep_id=None, configs=None,
+                       checkpoint_dir=checkpoint_dir):
+    """
+    Successive halving over random configurations of the search space.
+
+    All configurations are trained for `min_episodes` episodes and evaluated with `eval_games` games.
+    Only the best 1/`eta` are promoted and trained `eta` times longer (continuing from their Q-table),
+    for `n_rungs` rungs (default: until a single configuration is trained in the last rung). Trials of a rung run in parallel
+    worker processes, every trial (rung) is written to the results store with its config, metrics
+    and wall-clock. The workers keep the Q-tables in checkpoints under `checkpoint_dir/<sweep_id>`
+    (only metrics travel back through the pool); those of stopped configurations are deleted, the
+    one of the best configuration is kept (`checkpoint` in its records).
+
+    Parameters:
+    - `space` (dict): Search space, lists are sampled uniformly, (low, high) tuples log-uniformly.
+    - `n_configs` (int): Number of configurations in the first rung.
+    - `min_episodes` (int): Training episodes per configuration in the first rung.
+    - `eta` (int): Reduction factor between rungs.
+    - `eval_games` (int): Evaluation games per trial and rung.
+    - `n_workers` (int, optional): Number of worker processes (None = all cores).
+    - `seed` (int, optional): Seed for sampling and training.
+
+    Returns the best configuration and its metrics.
+    """
+    rng = np.random.default_rng(seed)
+    sweep_id = sweep_id or time.strftime("%Y%m%d-%H%M%S")
+    configs = configs or sample_configs(space, n_configs, rng)
+    n_rungs = n_rungs or int(math.log(len(configs), eta) + 1e-9) + 1
+
+    directory = os.path.join(checkpoint_dir, sweep_id)
+    checkpoints = {trial_id: os.path.join(directory, f"trial-{trial_id}.qtab") for trial_id in range(len(configs))}
+    trained = {trial_id: 0 for trial_id in range(len(configs))}
+    survivors = list(range(len(configs)))
+    metrics = {}
+
+    with ProcessPoolExecutor(n_workers) as pool:
+        for rung in range(n_rungs):
+            episodes = min_episodes * eta ** rung - trained[survivors[0]]
+            tasks = [(trial_id, configs[trial_id], checkpoints[trial_id], trained[trial_id], episodes, eval_games,
+                      int(rng.integers(2**31))) for trial_id in survivors]
+
+            results = {}
+            for trial_id, trial_metrics, wall_clock in pool.map(run_trial, tasks):
+                trained[trial_id] += episodes
+                metrics[trial_id] = trial_metrics
+                results[trial_id] = wall_clock
+
+            # Promote the best 1/eta configurations (by win rate, then by reward)
+            ranked = sorted(survivors, key=lambda t: (metrics[t]["win_rate"], metrics[t]["average_reward"]), reverse=True)
+            final = rung == n_rungs - 1
+            n_keep = 1 if final else max(1, len(survivors) // eta)
+
+            for position, trial_id in enumerate(ranked):
+                status = "stopped" if position >= n_keep else "finished" if final else "promoted"
+                write_result({"sweep_id": sweep_id, "trial": trial_id, "rung": rung, "config": configs[trial_id],
+                              "episodes": trained[trial_id], **metrics[trial_id], "wall_clock": results[trial_id],
+                              "status": status, "checkpoint": checkpoints[trial_id] if position < n_keep else None},
+                             path)
+
+            # Free the tables of stopped configurations
+            for trial_id in ranked[n_keep:]:
+                os.remove(checkpoints[trial_id])
+            survivors = ranked[:n_keep]
+
+    best = survivors[0]
+    return configs[best], metrics[best]
+
+def hyperband(space=search_space, max_episodes=27000, min_episodes=1000, eta=3, eval_games=500, n_workers=None,
+              seed=None, path=results_path, checkpoint_dir=checkpoint_dir):
+    """
+    Hyperband: runs several successive halving brackets, from many configurations starting with
+    `min_episodes` to few configurations trained with `max_episodes` from the start. Returns the
+    best configuration over all brackets and its metrics.
+    """
+    rng = np.random.default_rng(seed)
+    sweep_id = time.strftime("%Y%m%d-%H%M%S")
+    s_max = int(math.log(max_episodes / min_episodes, eta) + 1e-9)
+    best = None
+
+    for s in reversed(range(s_max + 1)):
+        n_configs = int(math.ceil((s_max + 1) / (s + 1) * eta ** s))
+        bracket_min = int(max_episodes / eta ** s)
+        config, metrics = successive_halving(space, n_configs=n_configs, min_episodes=bracket_min, eta=eta,
+                                             n_rungs=s + 1, eval_games=eval_games, n_workers=n_workers,
+                                             seed=int(rng.integers(2**31)), path=path, sweep_id=f"{sweep_id}-s{s}",
+                                             checkpoint_dir=checkpoint_dir)
+        if best is None or metrics["win_rate"] > best[1]["win_rate"]:
+            best = (config, metrics)
+    return best
+
+#-------------------------Notes-----------------------------------------------*\
+#
+#-----------------------------------------------------------------------------*\
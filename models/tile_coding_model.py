@@ -0,0 +1,218 @@
+#---------------------------------------------------------*\
+# Title: Tile Coding Agent (linear function approximation)
+# Author:
+#---------------------------------------------------------*/
+#!/usr/bin/env python3
+
+import math
+import numpy as np
+from src.KingdomBatch import KingdomBatch
+from models.model import encoder, n_actions, max_turns, action_names
+from models.batch_model import get_rewards, Lockstep, summarize_metrics
+from utils.checkpoint import save_checkpoint, load_checkpoint
+
+#---------------------------------------------------------*/
+# Parameters
+#---------------------------------------------------------*/
+
+# Raw attributes (castle strength, resources, soldiers of the kingdom and of its opponent) are
+# clipped to these ranges before tiling, everything above shares the outermost tiles
+value_ranges = (200, 150, 150, 200, 150, 150)
+
+# Large odd multipliers for hashing the tile coordinates into the weight table
+hash_multipliers = np.array([73856093, 19349663, 83492791, 2654435761, 40503, 97039], dtype=np.int64)
+tiling_multiplier = 1000003
+
+class TileCodingAgent:
+    """
+    Q-learning with a linear value function over tile-coded raw attributes of both kingdoms.
+
+    `n_tilings` overlapping grids with `tiles` tiles per attribute range are laid over the six raw
+    attributes, each grid asymmetrically offset by a fraction of a tile. Every state activates one
+    tile per tiling; the tile coordinates are hashed into a fixed table of `n_weights` weight rows,
+    so memory does not depend on the resolution. Q(s, a) is the sum of the weights of the active
+    tiles, nearby states share most of their tiles and therefore generalize.
+
+    Training runs many games in lockstep (as `train_q_learning_batched`): features are computed
+    for the whole batch at once, and the weight update of a step is one batched operation.
+    Rewards are the ones of `get_reward`.
+    """
+
+    def __init__(self, n_tilings=8, tiles=3, n_weights=2**16, alpha=0.5, gamma=0.9, epsilon_start=1.0,
+                 epsilon_min=0.01, max_turns=max_turns):
+        self.n_tilings = n_tilings
+        self.tiles = tiles
+        self.n_weights = n_weights
+        self.alpha = alpha
+        self.gamma = gamma
+        self.epsilon_start = epsilon_start
+        self.epsilon_min = epsilon_min
+        self.max_turns = max_turns
+        self.action_names = action_names
+        self.episodes_trained = 0
+
+        self.weights = np.zeros((n_weights, n_actions))
+
+        # Tiles per unit of every attribute and the offset of every tiling (in tiles, asymmetric
+        # displacement 1, 3, 5, ... per attribute)
+        self.value_ranges = np.array(value_ranges, dtype=np.float64)
+        self.scale = tiles / self.value_ranges
+        displacement = 2 * np.arange(len(value_ranges)) + 1
+        self.offsets = (np.arange(n_tilings)[:, None] * displacement % n_tilings) / n_tilings
+        self.tiling_hash = np.arange(n_tilings, dtype=np.int64) * tiling_multiplier
+
+    # ---------------------------------------------------------*/
+    # Features and Values
+    # ---------------------------------------------------------*/
+    def features_arrays(self, castle_strength1, resources1, soldiers1, castle_strength2, resources2, soldiers2):
+        """Active weight rows (n x n_tilings) for the raw attribute arrays of both kingdoms."""
+        attributes = np.stack([castle_strength1, resources1, soldiers1, castle_strength2, resources2, soldiers2], axis=-1)
+        scaled = np.minimum(attributes, self.value_ranges) * self.scale
+        coordinates = np.floor(scaled[:, None, :] + self.offsets[None]).astype(np.int64)
+        return (coordinates @ hash_multipliers + self.tiling_hash) % self.n_weights
+
+    def features(self, kingdom, opponent):
+        """Active weight rows of the states of two `KingdomBatch`es."""
+        return self.features_arrays(kingdom.castle_strength, kingdom.resources, kingdom.soldiers,
+                                    opponent.castle_strength, opponent.resources, opponent.soldiers)
+
+    def q_values(self, features):
+        """Q-values (n x n_actions) of a batch of feature rows."""
+        return self.weights[features].sum(axis=1)
+
+    def choose_actions(self, features, epsilon, rng):
+        """Epsilon-greedy policy for a batch of states."""
+        actions = np.argmax(self.q_values(features), axis=1)
+        explore = rng.random(len(actions)) < epsilon
+        actions[explore] = rng.integers(0, n_actions, np.count_nonzero(explore))
+        return actions
+
+    def update(self, features, actions, rewards, next_features, done):
+        """
+        Batched semi-gradient Q-learning update. The TD error of every game is spread over its active
+        tiles (step size alpha / n_tilings); when several games hit the same (weight, action) cell in
+        one step their TD errors are averaged, as in `update_q_table_batch`.
+        """
+        td_target = rewards + self.gamma * np.max(self.q_values(next_features), axis=1) * ~done
+        td_delta = td_target - self.q_values(features)[np.arange(len(actions)), actions]
+
+        cells, inverse = np.unique((features * n_actions + actions[:, None]).ravel(), return_inverse=True)
+        deltas = np.repeat(td_delta, self.n_tilings)
+        mean_delta = np.bincount(inverse, weights=deltas) / np.bincount(inverse)
+        self.weights.reshape(-1)[cells] += self.alpha / self.n_tilings * mean_delta
+
+    def take_turns(self, kingdom, opponent, mask, epsilon, rng, learn=True):
+        """Every game selected by `mask` chooses an action and executes it, the moving kingdoms learn if
+        `learn`. Returns the done flags, rewards and actions of all games."""
+        prev_state1 = encoder.discretize_batch(kingdom)
+        features = self.features(kingdom, opponent)
+
+        actions = self.choose_actions(features, epsilon, rng)
+        attack_success, _ = kingdom.step(actions, opponent, mask)
+
+        curr_state1 = encoder.discretize_batch(kingdom)
+        rewards = get_rewards(prev_state1, curr_state1, actions, attack_success, kingdom, opponent)
+        done = mask & (kingdom.is_defeated() | opponent.is_defeated())
+
+        if learn and mask.any():
+            next_features = self.features(kingdom, opponent)
+            self.update(features[mask], actions[mask], rewards[mask], next_features[mask], done[mask])
+        return done, rewards, actions
+
+    # ---------------------------------------------------------*/
+    # Playing
+    # ---------------------------------------------------------*/
+    def best_action(self, kingdom, opponent):
+        """Greedy action (0-3) for two `Kingdom` objects."""
+        features = self.features_arrays(*[np.array([value]) for value in (
+            kingdom.castle_strength, kingdom.resources, kingdom.soldiers,
+            opponent.castle_strength, opponent.resources, opponent.soldiers)])
+        return int(np.argmax(self.q_values(features)[0]))
+
+    def __call__(self, kingdom, opponent, rng=None):
+        """Player interface of `run_tournament` (choices 1-4)."""
+        return 1 + self.best_action(kingdom, opponent)
+
+    # ---------------------------------------------------------*/
+    # Training and Evaluation
+    # ---------------------------------------------------------*/
+    def train(self, total_episodes=1000, n_envs=20, opponent_epsilon=0.6, seed=None, eval_every=100, progress=True,
+              plot=True, save=True, metrics=None):
+        """
+        Trains for `total_episodes` episodes with `n_envs` games in lockstep (see `Lockstep`). As in
+        `run_episode`, `Kingdom A` learns with a decaying epsilon (continued after `episodes_trained`
+        episodes), `Kingdom B` plays on the same weights with `opponent_epsilon` and does not learn.
+
+        Parameters:
+        - `total_episodes` (int): Number of training episodes.
+        - `n_envs` (int): Number of games played in lockstep (smaller batches update more often).
+        - `seed` (int, optional): Seed for the random generator of this run.
+        - `eval_every` (int): Number of finished episodes summarized into one metrics point.
+        - `save` / `plot` (bool): Save the weights to ./out/tile_coding.qtab and plot the statistics.
+
+        Returns the agent.
+        """
+        rng = np.random.default_rng(seed)
+        decay = math.exp((math.log(self.epsilon_min) - math.log(self.epsilon_start)) / total_episodes)
+        games = Lockstep(total_episodes, n_envs, self.max_turns)
+
+        def act(mask):
+            epsilon = max(self.epsilon_min, self.epsilon_start * decay ** (self.episodes_trained + games.finished))
+            return self.take_turns(games.kingdom1, games.kingdom2, mask, epsilon, rng)
+
+        def reply(mask):
+            return self.take_turns(games.kingdom2, games.kingdom1, mask, opponent_epsilon, rng, learn=False)[0]
+
+        games.run(act, reply, progress=progress)
+        summarize_metrics(metrics, games, self.episodes_trained, eval_every, plot, self.action_names)
+
+        self.episodes_trained += total_episodes
+        if save:
+            self.save()
+        return self
+
+    def evaluate(self, n_games=1000, opponent_epsilon=0.1, seed=None):
+        """Evaluation games with the rules of `evaluation_game` (greedy A, B on the same weights with
+        `opponent_epsilon`). Returns the wins (1 / 0.5 / 0 per game) and rewards of `Kingdom A`."""
+        rng = np.random.default_rng(seed)
+        kingdom1, kingdom2 = KingdomBatch(n_games, "Kingdom A"), KingdomBatch(n_games, "Kingdom B")
+        active = np.ones(n_games, dtype=bool)
+        draw = np.zeros(n_games, dtype=bool)
+        rewards = np.zeros(n_games)
+        turn_count = 0
+
+        while active.any():
+            done, reward1, _ = self.take_turns(kingdom1, kingdom2, active, 0, rng, learn=False)
+            rewards[active] += reward1[active]
+            turn_count += 1
+            draw |= active & ~done & (turn_count >= self.max_turns)
+            active &= ~done & ~draw
+
+            done2, _, _ = self.take_turns(kingdom2, kingdom1, active, opponent_epsilon, rng, learn=False)
+            turn_count += 1
+            active &= ~done2
+
+        wins = np.where(draw, 0.5, (kingdom1.castle_strength > kingdom2.castle_strength).astype(float))
+        return wins, rewards
+
+    # ---------------------------------------------------------*/
+    # Checkpoints
+    # ---------------------------------------------------------*/
+    def save(self, path="./out/tile_coding.qtab"):
+        """Saves the weights as checkpoint (see utils/checkpoint.py), the tiling in the header."""
+        save_checkpoint(self.weights, path, action_names=self.action_names, episodes=self.episodes_trained,
+                        model="tile_coding", n_tilings=self.n_tilings, tiles=self.tiles, alpha=self.alpha,
+                        gamma=self.gamma)
+
+    @classmethod
+    def load(cls, path="./out/tile_coding.qtab"):
+        weights, header = load_checkpoint(path, mmap=False)
+        agent = cls(n_tilings=header["n_tilings"], tiles=header["tiles"], n_weights=len(weights),
+                    alpha=header["alpha"], gamma=header["gamma"])
+        agent.weights = weights
+        agent.episodes_trained = header["episodes"] or 0
+        return agent
+
+#-------------------------Notes-----------------------------------------------*\
+#
+#-----------------------------------------------------------------------------*\
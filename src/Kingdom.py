@@ -6,7 +6,23 @@
 
 import random
 
+# Action order used by the models (index -> action), see `take_turn` in models/model.py
+GATHER, TRAIN, FORTIFY, ATTACK = 0, 1, 2, 3
+
+# Bits per attribute in `pack` (values are never negative, 2**20 is far above any reachable value)
+FIELD_BITS = 20
+FIELD_MASK = (1 << FIELD_BITS) - 1
+
 class Kingdom:
+    """
+    One kingdom of the game. The attributes live in `__slots__` (no per-instance dict), so a
+    kingdom is small, `clone` is a copy of five references and search code (solver, MCTS) can
+    explore moves with `apply` / `undo` instead of `copy.deepcopy`. `state` and `pack` give the
+    immutable state (tuple or int) for hashing and transposition tables.
+    """
+
+    __slots__ = ("name", "player", "castle_strength", "resources", "soldiers")
+
     def __init__(self, name, player="human"):
         self.name = name
         self.player = player
@@ -67,6 +83,58 @@ class Kingdom:
             
             return False, damage
 
+    #---------------------------------------------------------*/
+    # Compact State (search)
+    #---------------------------------------------------------*/
+    @property
+    def state(self):
+        """Immutable state (castle strength, resources, soldiers)."""
+        return (self.castle_strength, self.resources, self.soldiers)
+
+    @state.setter
+    def state(self, state):
+        self.castle_strength, self.resources, self.soldiers = state
+
+    def pack(self):
+        """State as one int (castle strength, resources and soldiers in `FIELD_BITS` each)."""
+        return (self.castle_strength << 2 * FIELD_BITS) | (self.resources << FIELD_BITS) | self.soldiers
+
+    def unpack(self, packed):
+        """Restores a state from `pack`."""
+        self.castle_strength = packed >> 2 * FIELD_BITS
+        self.resources = (packed >> FIELD_BITS) & FIELD_MASK
+        self.soldiers = packed & FIELD_MASK
+
+    def clone(self):
+        kingdom = Kingdom.__new__(Kingdom)
+        kingdom.name = self.name
+        kingdom.player = self.player
+        kingdom.castle_strength = self.castle_strength
+        kingdom.resources = self.resources
+        kingdom.soldiers = self.soldiers
+        return kingdom
+
+    def apply(self, action, opponent):
+        """
+        Executes an action (0 = Gather Resources, 1 = Train Soldiers, 2 = Fortify Castle, 3 = Attack)
+        and returns the undo token (the packed states of both kingdoms before the action).
+        """
+        token = (self.pack(), opponent.pack())
+        if action == GATHER:
+            self.gather_resources()
+        elif action == TRAIN:
+            self.train_soldiers()
+        elif action == FORTIFY:
+            self.fortify_castle()
+        else:
+            self.attack(opponent)
+        return token
+
+    def undo(self, token, opponent):
+        """Reverts an action of `apply` (actions only change the two kingdoms of the game)."""
+        self.unpack(token[0])
+        opponent.unpack(token[1])
+
 #-------------------------Notes-----------------------------------------------*\
 # 
 #-----------------------------------------------------------------------------*\
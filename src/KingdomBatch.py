@@ -0,0 +1,132 @@
+#---------------------------------------------------------*\
+# Title: Kingdom-Batch (vectorized Kingdom-Class)
+# Author:
+#---------------------------------------------------------*/
+#!/usr/bin/env python3
+
+import numpy as np
+from src.Kingdom import Kingdom, GATHER, TRAIN, FORTIFY, ATTACK
+
+class KingdomBatch:
+    """
+    Struct-of-arrays version of `Kingdom` that holds N independent games at once.
+
+    Every attribute (`castle_strength`, `resources`, `soldiers`) is an int64 array of length N and
+    all actions take an optional boolean `mask`, so that only the selected games are changed. The
+    rules are exactly the ones of `Kingdom` (resource checks, attack formula, clamping at zero).
+    """
+
+    def __init__(self, n, name="Kingdom", player="machine"):
+        self.name = name
+        self.player = player
+        self.n = n
+        self.castle_strength = np.full(n, 100, dtype=np.int64)
+        self.resources = np.full(n, 50, dtype=np.int64)
+        self.soldiers = np.full(n, 50, dtype=np.int64)
+
+    @classmethod
+    def from_kingdoms(cls, kingdoms, name="Kingdom", player="machine"):
+        """Builds a batch from a list of `Kingdom` objects (e.g. to continue running games)."""
+        batch = cls(len(kingdoms), name=name, player=player)
+        batch.castle_strength[:] = [k.castle_strength for k in kingdoms]
+        batch.resources[:] = [k.resources for k in kingdoms]
+        batch.soldiers[:] = [k.soldiers for k in kingdoms]
+        return batch
+
+    def to_kingdom(self, i):
+        """Returns game `i` of the batch as a regular `Kingdom` object."""
+        kingdom = Kingdom(self.name, player=self.player)
+        kingdom.castle_strength = int(self.castle_strength[i])
+        kingdom.resources = int(self.resources[i])
+        kingdom.soldiers = int(self.soldiers[i])
+        return kingdom
+
+    def reset(self, mask=None):
+        """Resets the selected games (all, if `mask` is None) to the starting values."""
+        if mask is None:
+            mask = slice(None)
+        self.castle_strength[mask] = 100
+        self.resources[mask] = 50
+        self.soldiers[mask] = 50
+
+    def _mask(self, mask):
+        return np.ones(self.n, dtype=bool) if mask is None else mask
+
+    # ---------------------------------------------------------*/
+    # Actions
+    # ---------------------------------------------------------*/
+    def gather_resources(self, mask=None):
+        mask = self._mask(mask)
+        gathered = np.where(mask, 10, 0)
+        self.resources += gathered
+        return gathered
+
+    def train_soldiers(self, mask=None):
+        ok = self._mask(mask) & (self.resources >= 10)
+        trained = np.where(ok, 5, 0)
+        self.resources -= np.where(ok, 10, 0)
+        self.soldiers += trained
+        return trained
+
+    def fortify_castle(self, mask=None):
+        ok = self._mask(mask) & (self.resources >= 20)
+        fortified = np.where(ok, 10, 0)
+        self.castle_strength += fortified
+        self.resources -= np.where(ok, 20, 0)
+        return fortified
+
+    def attack(self, opponent, mask=None):
+        """Vectorized `Kingdom.attack`. Returns the boolean success array and the damage array
+        (0 for games that are not selected by `mask`)."""
+        mask = self._mask(mask)
+
+        # Same float arithmetic as `int(...)` in Kingdom.attack (values are never negative here)
+        attack_strength = np.maximum((self.soldiers * 0.333 + 3).astype(np.int64), 0)
+        defense_strength = np.maximum((opponent.soldiers * 0.333).astype(np.int64), 0)
+
+        success = mask & (attack_strength > defense_strength)
+        repelled = mask & ~success
+        damage = np.where(success, attack_strength - defense_strength, 0)
+        damage += np.where(repelled, defense_strength - attack_strength, 0)
+
+        # Successful attack: reduce castle strength and soldiers of the opponent (>= 0)
+        hit = np.where(success, damage, 0)
+        opponent.castle_strength -= hit
+        np.maximum(opponent.castle_strength, 0, out=opponent.castle_strength)
+        opponent.soldiers -= hit
+        np.maximum(opponent.soldiers, 0, out=opponent.soldiers)
+
+        # Repelled attack: the attacker loses soldiers (>= 0)
+        self.soldiers -= np.where(repelled, damage, 0)
+        np.maximum(self.soldiers, 0, out=self.soldiers)
+
+        return success, damage
+
+    def step(self, actions, opponent, mask=None):
+        """
+        Applies one action per game (0 = Gather Resources, 1 = Train Soldiers, 2 = Fortify Castle,
+        3 = Attack) to all games selected by `mask`.
+
+        Parameters:
+        - `actions` (numpy.ndarray): Integer action vector of length N.
+        - `opponent` (KingdomBatch): The opposing kingdoms (only changed by attacks).
+        - `mask` (numpy.ndarray, optional): Boolean array, games that are not selected are untouched.
+
+        Returns:
+        - `attack_success` (numpy.ndarray): True where an attack was successful.
+        - `damage` (numpy.ndarray): Damage dealt (or suffered, if the attack was repelled).
+        """
+        mask = self._mask(mask)
+        actions = np.asarray(actions)
+        self.gather_resources(mask & (actions == GATHER))
+        self.train_soldiers(mask & (actions == TRAIN))
+        self.fortify_castle(mask & (actions == FORTIFY))
+        return self.attack(opponent, mask & (actions == ATTACK))
+
+    def is_defeated(self):
+        """Boolean array, True where the castle has fallen."""
+        return self.castle_strength <= 0
+
+#-------------------------Notes-----------------------------------------------*\
+#
+#-----------------------------------------------------------------------------*\
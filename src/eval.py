@@ -1,20 +1,29 @@
 #---------------------------------------------------------*\
 # Title: Evaluate Agent
-# Author: 
+# Author:
 #---------------------------------------------------------*/
 #!/usr/bin/env python3
 
-import tqdm
-from src import Kingdom
-from utils.plotting import plot_evaluation # plot_item_frequencies, plot_results
+import os
+import math
+import numpy as np
+from statistics import NormalDist
+import queue
+import warnings
+from multiprocessing import Pool, Process, Queue, shared_memory
+from src.Kingdom import Kingdom
+from utils.traces import TraceRecorder, attack_outcome
+
+def evaluation_game(q_table, model=None, recorder=None, episode=0):
+    """Evaluate the agent over a specified number of episodes. With a `TraceRecorder` (see
+    utils/traces.py) every turn of both kingdoms is recorded under the id `episode`."""
+
+    if model is None:
+        from models import model  # Imported here, models.model imports this module
 
-def evaluation_game(q_table, model):
-    """Evaluate the agent over a specified number of episodes."""
-    
     total_wins = 0
     total_reward = 0
-    action_frequencies = {}
-    
+
     kingdom1 = Kingdom("Kingdom A")
     kingdom2 = Kingdom("Kingdom B")
     done = False
@@ -25,11 +34,14 @@ def evaluation_game(q_table, model):
 
     while not done:
         # Kingdom 1 takes its turn by Q-Table, learning reate = 0, exploration rate = 0
-        done, reward1, action = model.take_turn(kingdom1, kingdom2, model.q_table, 0, 0.9, 0)
+        state = kingdom1.state + kingdom2.state if recorder is not None else None
+        done, reward1, action = model.take_turn(kingdom1, kingdom2, q_table, 0, 0.9, 0)
+        if recorder is not None:
+            recorder.record(episode, turn_count, 0, action, state, reward1, attack_outcome(action, state, kingdom2))
         total_reward += reward1
         actions_list.append(action)
         turn_count += 1
-        
+
         if done:
             break
         elif turn_count >= model.max_turns:
@@ -37,39 +49,349 @@ def evaluation_game(q_table, model):
             break
 
         # Kingdom 2 takes its turn half randomly, learning reate = 0, exploration rate = 0.5
-        done, _, _ = model.take_turn(kingdom2, kingdom1, model.q_table, 0, 0.9, 0.1)
+        state = kingdom2.state + kingdom1.state if recorder is not None else None
+        done, reward2, action2 = model.take_turn(kingdom2, kingdom1, q_table, 0, 0.9, 0.1)
+        if recorder is not None:
+            recorder.record(episode, turn_count, 1, action2, state, reward2, attack_outcome(action2, state, kingdom1))
         turn_count += 1
-    
-    if draw: 
+
+    if draw:
         total_wins += 0.5
     elif kingdom1.castle_strength > kingdom2.castle_strength:
-        total_wins += 1 
-        
-    # Count the actions, use names as keys
-    for action in actions_list:
-        if model.action_names[action] in action_frequencies:
-            action_frequencies[model.action_names[action]] += 1
-        else:
-            action_frequencies[model.action_names[action]] = 1
-    
+        total_wins += 1
+
+    # Count the actions (index = action, see model.action_names)
+    action_frequencies = np.bincount(actions_list, minlength=len(model.action_names))
+
     return total_wins, total_reward, action_frequencies
 
+#---------------------------------------------------------*/
+# Parallel Evaluation (Process-Pool, shared Q-Table)
+#---------------------------------------------------------*/
+
+# Greedy policy on the shared policy table, built once per worker process by `_init_worker`
+_worker_policy = None
+_worker_memory = None
+
+def _init_worker(memory_name, shape, dtype):
+    """Attaches a worker process to the policy table in shared memory (no copy, read-only)."""
+    global _worker_policy, _worker_memory
+    from models.policy import GreedyPolicy
+    _worker_memory = shared_memory.SharedMemory(name=memory_name)
+    table = np.ndarray(shape, dtype=dtype, buffer=_worker_memory.buf)
+    table.setflags(write=False)
+    _worker_policy = GreedyPolicy.from_table(table)
+
+def _evaluate_chunk(task):
+    """Plays one chunk of evaluation games with its own seed, returns the arrays of wins, rewards
+    and action counts of the chunk, and its trace records if `first_episode` (the id of its first
+    game) is given (else None). Without `model` the chunk plays the policy of its worker process."""
+    n_episodes, seed_sequence, model, first_episode = task
+    if model is None:
+        model = _worker_policy
+
+    # `take_turn` draws from the global NumPy generator, so it is seeded per chunk
+    np.random.seed(seed_sequence.generate_state(4))
+    wins, rewards, action_counts = np.zeros(n_episodes), np.zeros(n_episodes), np.zeros((n_episodes, 4), dtype=np.int64)
+    recorder = TraceRecorder(chunk_size=64 * n_episodes) if first_episode is not None else None
+    for i in range(n_episodes):
+        wins[i], rewards[i], action_counts[i] = evaluation_game(None, model, recorder, (first_episode or 0) + i)
+    return wins, rewards, action_counts, recorder.records() if recorder else None
+
+def evaluate_agent(q_table, total_episodes=1000, n_workers=1, seed=None, chunk_size=25, plot=True, progress=True,
+                   model=None, trace_path=None):
+    """
+    Evaluate a Q-table over `total_episodes` evaluation games, optionally in parallel.
+
+    The episodes are split into chunks of `chunk_size` games, every chunk gets its own seed spawned
+    from `seed`. Results therefore only depend on `seed` and `chunk_size`, not on the number of
+    workers. The table is played by its greedy policy (`GreedyPolicy`), which is built once. With
+    `n_workers` > 1 the chunks are spread over a process pool, the policy (3 bytes per state) is
+    placed once in shared memory and read by all workers without being pickled per task.
+
+    Parameters:
+    - `q_table` (numpy.ndarray): The Q-table to be evaluated.
+    - `total_episodes` (int): Number of evaluation games.
+    - `n_workers` (int): Number of worker processes (None = all cores, 1 = no pool).
+    - `seed` (int, optional): Seed for reproducible evaluations.
+    - `chunk_size` (int): Number of games per task.
+    - `plot` (bool): Plot the results with `plot_evaluation`.
+    - `progress` (bool): Show a progress bar.
+    - `model` (optional): Object with `take_turn`, `max_turns` and `action_names` that plays instead
+      of the greedy policy of `q_table` (e.g. a `DQNAgent`, `q_table` may then be None). It is sent to every task.
+    - `trace_path` (str, optional): Record every turn of the games in this trace file (see
+      utils/traces.py). Workers return their records per chunk, they are appended in game order.
+
+    Returns the arrays of win rates, rewards and action counts (one entry per game).
+    """
+    from tqdm import tqdm  # Imported on use, keeps `import src.eval` light for the CLI
+    from models.policy import GreedyPolicy
+
+    policy = None
+    if model is None:  # Built once for all chunks
+        policy = model = GreedyPolicy.from_q_table(q_table)
+    n_workers = n_workers or os.cpu_count()
+    chunks = [min(chunk_size, total_episodes - start) for start in range(0, total_episodes, chunk_size)]
+    seeds = np.random.SeedSequence(seed).spawn(len(chunks))
+    firsts = [start if trace_path else None for start in range(0, total_episodes, chunk_size)]
+    recorder = TraceRecorder(trace_path, model="evaluation", seed=seed) if trace_path else None
+
+    # Preallocated results, filled chunk by chunk (in order)
+    win_rates = np.zeros(total_episodes)
+    average_rewards = np.zeros(total_episodes)
+    action_freqs_total = np.zeros((total_episodes, 4), dtype=np.int64)
+
+    def store(start, chunk_results):
+        end = start + len(chunk_results[0])
+        win_rates[start:end], average_rewards[start:end], action_freqs_total[start:end] = chunk_results[:3]
+        recorder.extend(chunk_results[3]) if recorder else None
+        return end
+
+    start = 0
+    try:
+        if n_workers == 1:
+            for n_episodes, seed_sequence, first in tqdm(zip(chunks, seeds, firsts), total=len(chunks), disable=not progress):
+                start = store(start, _evaluate_chunk((n_episodes, seed_sequence, model, first)))
+        elif policy is None:  # Another model is sent with every task
+            tasks = [(n_episodes, seed_sequence, model, first) for n_episodes, seed_sequence, first in zip(chunks, seeds, firsts)]
+            with Pool(n_workers) as pool:
+                for chunk_results in tqdm(pool.imap(_evaluate_chunk, tasks), total=len(tasks), disable=not progress):
+                    start = store(start, chunk_results)
+        else:
+            table = policy.table()
+            memory = shared_memory.SharedMemory(create=True, size=max(table.nbytes, 1))
+            shared_table = None
+            try:
+                shared_table = np.ndarray(table.shape, dtype=table.dtype, buffer=memory.buf)
+                shared_table[:] = table
+                tasks = [(n_episodes, seed_sequence, None, first) for n_episodes, seed_sequence, first in zip(chunks, seeds, firsts)]
+
+                with Pool(n_workers, initializer=_init_worker, initargs=(memory.name, table.shape, table.dtype.str)) as pool:
+                    for chunk_results in tqdm(pool.imap(_evaluate_chunk, tasks), total=len(tasks), disable=not progress):
+                        start = store(start, chunk_results)
+            finally:
+                del shared_table  # The view on `memory.buf` has to go first, else `close` raises a BufferError
+                try:
+                    memory.close()
+                finally:
+                    memory.unlink()  # Also if closing fails, the segment must not outlive the evaluation
+    finally:
+        recorder.close() if recorder else None
 
-def evaluate_agent(q_table, total_episodes=1000):
-    win_rates = []
-    average_rewards = []
-    action_freqs_total = []
-    
-    for episode in tqdm(range(total_episodes)):  
-        win_rate, avg_reward, action_freq = evaluation_game(q_table)
-        win_rates.append(win_rate)
-        average_rewards.append(avg_reward)
-        action_freqs_total.append(action_freq)
-        # print(f"Episode: {episode}, Win: {win_rate}, Reward: {avg_reward}")
-        
     # print("Win-Rates: ", win_rates)
-    plot_evaluation(action_freqs_total, win_rates, average_rewards)
+    if plot:
+        from utils.plotting import plot_evaluation  # matplotlib/scipy only when plotting
+        plot_evaluation(action_freqs_total, win_rates, average_rewards)
+
+    return win_rates, average_rewards, action_freqs_total
+
+#---------------------------------------------------------*/
+# Background Evaluation (separate process, Q-table snapshots)
+#---------------------------------------------------------*/
+def _background_worker(memory_names, shape, dtype, tasks, results, n_games, seed):
+    """Evaluates the snapshots of the task queue until it receives None (one greedy policy per
+    snapshot, built here so that `submit` stays cheap for the training loop)."""
+    from models.policy import GreedyPolicy
+    memories = [shared_memory.SharedMemory(name=name) for name in memory_names]
+    slots = [np.ndarray(shape, dtype=dtype, buffer=memory.buf) for memory in memories]
+    for episode, slot in iter(tasks.get, None):
+        policy = GreedyPolicy.from_q_table(slots[slot])
+        wins, rewards, action_counts, _ = _evaluate_chunk((n_games, np.random.SeedSequence([seed, episode]), policy, None))
+        results.put((episode, slot, wins.mean(), rewards.mean(), np.rint(action_counts.mean(axis=0)).astype(np.int64)))
+    del slots
+    for memory in memories:
+        memory.close()
+
+class BackgroundEvaluator:
+    """
+    Evaluates Q-table snapshots in a separate process while training goes on.
+
+    `submit` copies the Q-table into a free slot of shared memory (`n_slots` snapshots of the size
+    of the table) and queues it with its episode number; the worker plays `n_games` evaluation
+    games on it (seeded by `seed` and the episode) and streams back the point (episode, win rate,
+    average reward, average action counts). If all slots are still in evaluation, the snapshot is
+    skipped (counted in `dropped`) instead of stalling the training loop.
+
+    Usage in a training loop:
+
+        evaluator = BackgroundEvaluator(q_table, n_games=200)
+        ...
+        evaluator.submit(episode, q_table)
+        for point in evaluator.poll():      # Finished points, in episode order
+            metrics.record(*point)
+        ...
+        for point in evaluator.close():     # Waits for the outstanding snapshots
+            metrics.record(*point)
+    """
+
+    def __init__(self, q_table, n_games=100, n_slots=4, seed=0):
+        q_table = np.asarray(q_table)
+        self.memories = [shared_memory.SharedMemory(create=True, size=max(q_table.nbytes, 1)) for _ in range(n_slots)]
+        self.slots = [np.ndarray(q_table.shape, dtype=q_table.dtype, buffer=memory.buf) for memory in self.memories]
+        self.free = list(range(n_slots))
+        self.ready = []
+        self.outstanding = 0
+        self.dropped = 0
+        self.exitcode = None
+        self.tasks, self.results = Queue(), Queue()
+        self.process = Process(target=_background_worker, daemon=True,
+                               args=([memory.name for memory in self.memories], q_table.shape, q_table.dtype.str,
+                                     self.tasks, self.results, n_games, seed))
+        self.process.start()
+
+    def _collect(self, block=False, timeout=0.1):
+        """
+        Moves finished points from the result queue to `ready` and frees their slots. With `block` it
+        waits for all outstanding points, checking every `timeout` seconds that the worker is still
+        alive; returns False if it has exited before.
+        """
+        while self.outstanding:
+            try:
+                episode, slot, *point = self.results.get(block=block, timeout=timeout)
+            except queue.Empty:
+                if block and self.process.is_alive():
+                    continue
+                return not block
+            self.free.append(slot)
+            self.ready.append((episode, *point))
+            self.outstanding -= 1
+        return True
+
+    def submit(self, episode, q_table):
+        """Queues a snapshot of `q_table` for evaluation, returns False if it had to be skipped."""
+        self._collect()
+        if not self.free:
+            self.dropped += 1
+            return False
+        slot = self.free.pop()
+        np.copyto(self.slots[slot], np.asarray(q_table))
+        self.tasks.put((episode, slot))
+        self.outstanding += 1
+        return True
+
+    def poll(self):
+        """Returns the points finished since the last call (does not block)."""
+        self._collect()
+        ready, self.ready = self.ready, []
+        return ready
+
+    def close(self):
+        """
+        Waits for the outstanding snapshots, stops the worker and returns the remaining points. If the
+        worker has died, a `RuntimeWarning` reports the lost snapshots (the exit code is kept in
+        `exitcode`) and the points evaluated so far are returned. The shared memory is released in every case.
+        """
+        if self.process is None:
+            return []
+        try:
+            if self._collect(block=True):
+                self.tasks.put(None)
+                self.process.join()
+            else:
+                self.tasks.cancel_join_thread()  # Nobody reads the queue anymore
+                warnings.warn(f"Background evaluation worker exited with code {self.process.exitcode}, "
+                              f"{self.outstanding} snapshots were not evaluated.", RuntimeWarning, stacklevel=2)
+        finally:
+            if self.process.is_alive():
+                self.process.terminate()
+                self.process.join()
+            self.exitcode = self.process.exitcode
+            self.process = None
+            del self.slots
+            for memory in self.memories:
+                memory.close()
+                memory.unlink()
+        ready, self.ready = self.ready, []
+        return ready
+
+#---------------------------------------------------------*/
+# Sequential Evaluation (early stopping)
+#---------------------------------------------------------*/
+def wilson_interval(successes, n, z=1.96):
+    """Wilson score interval of a proportion (default: 95% confidence)."""
+    if n == 0:
+        return 0.0, 1.0
+    p = successes / n
+    center = (p + z**2 / (2 * n)) / (1 + z**2 / n)
+    half_width = z * math.sqrt(p * (1 - p) / n + z**2 / (4 * n**2)) / (1 + z**2 / n)
+    return max(0.0, center - half_width), min(1.0, center + half_width)
+
+def obrien_fleming_spending(fraction, alpha=0.05):
+    """Lan-DeMets alpha spending function of O'Brien-Fleming type: the error rate that may be spent
+    up to the given fraction of the maximal number of games (little early, `alpha` at the end)."""
+    return 2 - 2 * NormalDist().cdf(NormalDist().inv_cdf(1 - alpha / 2) / math.sqrt(fraction))
+
+def evaluate_sequential(q_table, baseline=None, target_width=0.1, alpha=0.05, batch_size=50, max_episodes=2000,
+                        seed=None, model=None):
+    """
+    Plays evaluation games (`evaluation_game`) in batches of `batch_size` and stops as soon as the
+    result is clear, instead of always playing a fixed number of games.
+
+    - Without `baseline`: stops when the (1 - `alpha`) Wilson interval of the win rate (draws count
+      0.5) is at most `target_width` wide.
+    - With a `baseline` table: both tables play every batch with the same seed (paired games) and a
+      group-sequential z-test on the mean difference of the results stops with "better" or "worse".
+      The error rate `alpha` is spread over the looks with O'Brien-Fleming spending (a look may
+      spend what the spending function adds since the previous look), so the repeated looks keep
+      the overall error rate below `alpha`.
+
+    Stops after `max_episodes` games at the latest ("inconclusive" in comparisons). The batches use
+    seeds spawned from `seed`, results only depend on `seed` and `batch_size`.
+
+    Parameters:
+    - `q_table` (numpy.ndarray): The Q-table to be evaluated.
+    - `baseline` (numpy.ndarray, optional): Q-table to compare with.
+    - `target_width` (float): Width of the confidence interval to stop at (without baseline).
+    - `alpha` (float): Error rate of the interval / the test.
+    - `model` (optional): Plays instead of the greedy policies, see `evaluate_agent` (used for both tables).
+
+    Returns a dict with the number of games, the win rate and its interval, the decision ("precise",
+    "imprecise", "better", "worse" or "inconclusive") and, in comparisons, the baseline win rate,
+    the mean difference and the p-value of the last look.
+    """
+    from models.policy import GreedyPolicy
+
+    z = NormalDist().inv_cdf(1 - alpha / 2)
+    tables = [q_table] if baseline is None else [q_table, baseline]
+    players = [GreedyPolicy.from_q_table(table) if model is None else model for table in tables]  # Built once
+    seeds = np.random.SeedSequence(seed).spawn(math.ceil(max_episodes / batch_size))
+    scores, baseline_scores = np.zeros(0), np.zeros(0)
+    spent, p_value, decision = 0.0, None, None
+
+    for seed_sequence in seeds:
+        n_episodes = min(batch_size, max_episodes - len(scores))
+        scores = np.append(scores, _evaluate_chunk((n_episodes, seed_sequence, players[0], None))[0])
+
+        if baseline is None:
+            low, high = wilson_interval(scores.sum(), len(scores), z)
+            if high - low <= target_width:
+                decision = "precise"
+                break
+            continue
+
+        baseline_scores = np.append(baseline_scores, _evaluate_chunk((n_episodes, seed_sequence, players[1], None))[0])
+        differences = scores - baseline_scores
+        allowed = obrien_fleming_spending(len(scores) / max_episodes, alpha) - spent
+        spent += allowed
+        deviation = differences.std(ddof=1)
+        if deviation > 0:
+            p_value = 2 * NormalDist().cdf(-abs(differences.mean()) / (deviation / math.sqrt(len(differences))))
+        else:
+            p_value = 1.0 if differences.mean() == 0 else 0.0  # Identical results in every pair
+        if p_value < allowed:
+            decision = "better" if differences.mean() > 0 else "worse"
+            break
+
+    report = {"games": len(scores), "win_rate": float(scores.mean()), "ci": wilson_interval(float(scores.sum()), len(scores), z)}
+    if baseline is None:
+        report["decision"] = decision or "imprecise"
+    else:
+        report["decision"] = decision or "inconclusive"
+        report["baseline_win_rate"] = float(baseline_scores.mean())
+        report["difference"] = float((scores - baseline_scores).mean())
+        report["p_value"] = p_value
+    return report
 
 #-------------------------Notes-----------------------------------------------*\
-# 
-#-----------------------------------------------------------------------------*\
\ No newline at end of file
+#
+#-----------------------------------------------------------------------------*\
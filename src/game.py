@@ -8,45 +8,75 @@ import time
 import random
 import numpy as np
 from src.Kingdom import Kingdom
-from models.model import discretize_state, get_state_index, choose_action
+from models.model import encoder, choose_action
+from models.policy import GreedyPolicy
+from utils.checkpoint import load_q_table
 
 #---------------------------------------------------------*/
 # Classical Game (Against other human)
 #---------------------------------------------------------*/
-def play_turn(player, opponent, choice):
+def apply_choice(player, opponent, choice):
+    """Executes an action (1-4) without any output and returns the result of the Kingdom method."""
+    if choice == 1:
+        return player.gather_resources()
+    elif choice == 2:
+        return player.train_soldiers()
+    elif choice == 3:
+        return player.fortify_castle()
+    elif choice == 4:
+        return player.attack(opponent)
 
+def describe_turn(player, opponent, choice, result):
+    """Text of a turn, for the result of `apply_choice`."""
     if choice == 1:
-        gathered = player.gather_resources()
-        print(f"\n{player.name} gathered {gathered} resources.")
-        
+        return f"{player.name} gathered {result} resources."
+
     elif choice == 2:
-        trained = player.train_soldiers()
-        if trained:
-            print(f"\n{player.name} trained {trained} soldiers.")
+        if result:
+            return f"{player.name} trained {result} soldiers."
         else:
-            print("\nNot enough resources to train soldiers.")
-            
+            return "Not enough resources to train soldiers."
+
     elif choice == 3:
-        fortified = player.fortify_castle()
-        if fortified:
-            print(f"\n{player.name}'s castle has been fortified by {fortified}.")
+        if result:
+            return f"{player.name}'s castle has been fortified by {result}."
         else:
-            print("\nNot enough resources to fortify the castle.")
+            return "Not enough resources to fortify the castle."
 
     elif choice == 4:
-        success, damage = player.attack(opponent)
+        success, damage = result
         if success:
-            print(f"\n{player.name} successfully attacked! {opponent.name} " +
-                  f"lost {damage} castle strength and {damage} soldier(s).")
+            return (f"{player.name} successfully attacked! {opponent.name} " +
+                    f"lost {damage} castle strength and {damage} soldier(s).")
         else:
-            print(f"\n{player.name}'s attack was repelled! {player.name} " +
-                f"lost {damage} soldier(s).")
-            
-def q_table_choice(kingdom1, kingdom2, q_table):
-    state1 = discretize_state(kingdom1)
-    state2 = discretize_state(kingdom2)
-    state_index = get_state_index(state1, state2)
+            return (f"{player.name}'s attack was repelled! {player.name} " +
+                    f"lost {damage} soldier(s).")
+
+def play_turn(player, opponent, choice):
+
+    result = apply_choice(player, opponent, choice)
+    text = describe_turn(player, opponent, choice, result)
+    print(f"\n{text}") if text else None
+
+def q_table_choice(kingdom1, kingdom2, q_table, encoder=encoder):
+    state_index = encoder.encode(kingdom1, kingdom2)
     return 1 + choose_action(q_table, state_index, epsilon=0)
+
+def policy_choice(kingdom1, kingdom2, policy):
+    """Move of a precomputed `GreedyPolicy` (same choice as `q_table_choice`, one lookup)."""
+    return policy(kingdom1, kingdom2)
+
+def mcts_choice(kingdom1, kingdom2, player, plies_left):
+    """Anytime MCTS move within the player's time budget (see models/mcts.py)."""
+    return player.choose(kingdom1, kingdom2, plies_left)
+
+def solver_choice(kingdom1, kingdom2, solver, remaining_turns):
+    """Receding-horizon expectimax: solves the game from the current state over the solver's
+    horizon (at most the `remaining_turns` plies of both players until the draw, this move
+    included, as for `mcts_choice`) and plays the optimal first action."""
+    solver.max_turns = max(1, min(solver.horizon, remaining_turns))
+    solver.solve(kingdom1, kingdom2, cache=False)
+    return 1 + solver.best_action(kingdom1, kingdom2)
     
 def show_options_and_stats(player, opponent):
     """
@@ -66,13 +96,22 @@ def show_options_and_stats(player, opponent):
     print("4. Attack")
     
 
-def game(limit=50, opponent="human"):
+def game(limit=50, opponent="human", budget_ms=75):
     
     kingdom1 = Kingdom("Kingdom Atlantis")
     kingdom2 = Kingdom("Kingdom Babylon", player=opponent)
     Kingdoms = tuple(random.sample([kingdom1, kingdom2], 2))
     
-    q_table = np.load("./out/q_table.npy")
+    q_table = load_q_table(expected_buckets=encoder.buckets)
+    policy = GreedyPolicy.from_q_table(q_table)
+    solver = None
+    if opponent == "solver":
+        from models.solver import ExpectimaxSolver, material_value  # Only built for solver games
+        solver = ExpectimaxSolver(q_table, max_turns=8, horizon_value=material_value)
+    mcts = None
+    if opponent == "mcts":
+        from models.mcts import MCTSPlayer  # Only built for MCTS games
+        mcts = MCTSPlayer(np.asarray(q_table), budget_ms=budget_ms, limit=limit)
     turn = 1
     print (ascii_header)
     
@@ -82,15 +121,24 @@ def game(limit=50, opponent="human"):
         print("\n---------------------------------------------")
         print(f"Round {turn}")
 
-        # Player 1's turn
+        # Player 1's turn (plies_left: moves of both players until the draw, this one included)
+        plies_left = 2 * (limit - turn)
         show_options_and_stats(Kingdoms[0], Kingdoms[1])
         
         if Kingdoms[0].player == "human":
             choice = int(input("\nChoose your action: "))
             play_turn(Kingdoms[0], Kingdoms[1], choice)
             time.sleep(1.5)
+        elif Kingdoms[0].player == "solver":
+            choice = solver_choice(Kingdoms[0], Kingdoms[1], solver, plies_left)
+            play_turn(Kingdoms[0], Kingdoms[1], choice)
+            time.sleep(2)
+        elif Kingdoms[0].player == "mcts":
+            choice = mcts_choice(Kingdoms[0], Kingdoms[1], mcts, plies_left)
+            play_turn(Kingdoms[0], Kingdoms[1], choice)
+            time.sleep(2)
         else:
-            choice = q_table_choice(Kingdoms[0], Kingdoms[1], q_table)
+            choice = policy_choice(Kingdoms[0], Kingdoms[1], policy)
             time.sleep(2)
             play_turn(Kingdoms[0], Kingdoms[1], choice)
             time.sleep(2)
@@ -106,8 +154,16 @@ def game(limit=50, opponent="human"):
             choice = int(input("\nChoose your action: "))
             play_turn(Kingdoms[1], Kingdoms[0], choice)
             time.sleep(1.5)
+        elif Kingdoms[1].player == "solver":
+            choice = solver_choice(Kingdoms[1], Kingdoms[0], solver, plies_left - 1)
+            play_turn(Kingdoms[1], Kingdoms[0], choice)
+            time.sleep(2)
+        elif Kingdoms[1].player == "mcts":
+            choice = mcts_choice(Kingdoms[1], Kingdoms[0], mcts, plies_left - 1)
+            play_turn(Kingdoms[1], Kingdoms[0], choice)
+            time.sleep(2)
         else:
-            choice = q_table_choice(Kingdoms[1], Kingdoms[0], q_table)
+            choice = policy_choice(Kingdoms[1], Kingdoms[0], policy)
             time.sleep(2)
             play_turn(Kingdoms[1], Kingdoms[0], choice)
             time.sleep(2)
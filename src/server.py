@@ -0,0 +1,261 @@
+#---------------------------------------------------------*\
+# Title: Game Server (asyncio, JSON lines over TCP)
+# Author:
+#---------------------------------------------------------*/
+#!/usr/bin/env python3
+
+import json
+import random
+import asyncio
+import itertools
+import numpy as np
+from src.Kingdom import Kingdom
+from src.game import apply_choice, describe_turn
+from models.policy import GreedyPolicy
+
+# Protocol: one JSON object per line in both directions.
+#
+# Client -> server:
+#   {"type": "new", "mode": "human" | "ai", "limit": 50, "pace_ms": 0}   start a session
+#   {"type": "move", "session": 3, "choice": 1-4}                        move of the human player
+#   {"type": "quit", "session": 3}                                       end a session
+#
+# Server -> client:
+#   {"type": "started", "session": 3, "you": "Kingdom Atlantis" | null, "order": [...], "state": {...}}
+#   {"type": "your_turn", "session": 3, "round": 1, "state": {...}}
+#   {"type": "turn", "session": 3, "round": 1, "player": "...", "choice": 4, "message": "...", "state": {...}}
+#   {"type": "end", "session": 3, "result": "win" | "draw", "winner": "..." | null, "rounds": 12}
+#   {"type": "error", "message": "..."}
+
+#---------------------------------------------------------*/
+# Parameters
+#---------------------------------------------------------*/
+host = "127.0.0.1"
+port = 8765
+pace_ms = 0  # Delay after every move of a session (the `time.sleep` of `game`, without blocking)
+batch_window_ms = 2  # How long the AI batcher waits for more sessions before it moves
+
+#---------------------------------------------------------*/
+# Batched AI
+#---------------------------------------------------------*/
+class AIBatcher:
+    """
+    Greedy moves (`GreedyPolicy`) for all sessions at once: sessions await `choose`, the batcher
+    collects the requests for `batch_window_ms` and answers them with one vectorized encoding and
+    one gather from the precomputed policy.
+    """
+
+    def __init__(self, policy, batch_window_ms=batch_window_ms):
+        self.policy = policy
+        self.window = batch_window_ms / 1000
+        self.pending = []
+        self.wakeup = asyncio.Event()
+        self.task = None
+        self.n_batches = 0
+        self.n_moves = 0
+
+    def start(self):
+        self.task = asyncio.get_running_loop().create_task(self.run())
+
+    async def choose(self, kingdom, opponent):
+        future = asyncio.get_running_loop().create_future()
+        self.pending.append((kingdom.state + opponent.state, future))
+        self.wakeup.set()
+        return await future
+
+    async def run(self):
+        while True:
+            await self.wakeup.wait()
+            await asyncio.sleep(self.window)
+            self.wakeup.clear()
+            requests, self.pending = self.pending, []
+            if not requests:
+                continue
+            states = np.array([state for state, _ in requests], dtype=np.int64).T
+            choices = 1 + self.policy.act(self.policy.encoder.encode_arrays(*states)).astype(np.int64)
+            for (_, future), choice in zip(requests, choices.tolist()):
+                if not future.done():
+                    future.set_result(choice)
+            self.n_batches += 1
+            self.n_moves += len(requests)
+
+    def stop(self):
+        if self.task:
+            self.task.cancel()
+
+#---------------------------------------------------------*/
+# Sessions
+#---------------------------------------------------------*/
+def is_int(value):
+    """JSON integer (`bool` is a subclass of `int`, but no valid number here)."""
+    return isinstance(value, int) and not isinstance(value, bool)
+
+def kingdom_state(kingdom1, kingdom2):
+    return {kingdom.name: {"castle_strength": kingdom.castle_strength, "resources": kingdom.resources,
+                           "soldiers": kingdom.soldiers} for kingdom in (kingdom1, kingdom2)}
+
+class Session:
+    """
+    One game with the rules of `game`: random order of the kingdoms, `apply_choice` per move, a win
+    when a castle falls and a draw after `limit` rounds. In "human" mode Kingdom Atlantis is played
+    by the client (moves arrive through `moves`), in "ai" mode both kingdoms are played by the AI.
+    """
+
+    def __init__(self, session_id, send, batcher, mode="human", limit=50, pace_ms=pace_ms):
+        self.id = session_id
+        self.send = send
+        self.batcher = batcher
+        self.mode = mode
+        self.limit = limit
+        self.pace = pace_ms / 1000
+        self.moves = asyncio.Queue()
+        self.kingdom1 = Kingdom("Kingdom Atlantis", player="human" if mode == "human" else "machine")
+        self.kingdom2 = Kingdom("Kingdom Babylon", player="machine")
+        self.order = random.sample([self.kingdom1, self.kingdom2], 2)
+        self.turn = 1
+
+    def message(self, kind, **fields):
+        return {"type": kind, "session": self.id, **fields}
+
+    async def next_choice(self, player, opponent):
+        if player.player == "machine":
+            return await self.batcher.choose(player, opponent)
+
+        await self.send(self.message("your_turn", round=self.turn, state=kingdom_state(self.kingdom1, self.kingdom2)))
+        while True:
+            choice = await self.moves.get()
+            if choice in (1, 2, 3, 4):
+                return choice
+            await self.send({"type": "error", "session": self.id, "message": f"Invalid choice {choice!r}, expected 1-4."})
+
+    async def run(self):
+        await self.send(self.message("started", you=self.kingdom1.name if self.mode == "human" else None,
+                                     order=[kingdom.name for kingdom in self.order],
+                                     state=kingdom_state(self.kingdom1, self.kingdom2)))
+        while True:
+            for player, opponent in (self.order, self.order[::-1]):
+                choice = await self.next_choice(player, opponent)
+                result = apply_choice(player, opponent, choice)
+                await self.send(self.message("turn", round=self.turn, player=player.name, choice=choice,
+                                             message=describe_turn(player, opponent, choice, result),
+                                             state=kingdom_state(self.kingdom1, self.kingdom2)))
+                if opponent.castle_strength <= 0:
+                    return await self.send(self.message("end", result="win", winner=player.name, rounds=self.turn))
+                if self.pace:
+                    await asyncio.sleep(self.pace)
+
+            # Check Turn Limit
+            self.turn += 1
+            if self.turn >= self.limit:
+                return await self.send(self.message("end", result="draw", winner=None, rounds=self.turn))
+
+#---------------------------------------------------------*/
+# Server
+#---------------------------------------------------------*/
+class GameServer:
+    """
+    Hosts any number of concurrent sessions (human vs. AI or AI vs. AI) on one event loop. Every
+    connection can open several sessions; the AI moves of all sessions are batched (`AIBatcher`).
+    """
+
+    def __init__(self, policy, host=host, port=port, pace_ms=pace_ms, batch_window_ms=batch_window_ms, max_limit=1000):
+        self.policy = policy if isinstance(policy, GreedyPolicy) else GreedyPolicy.from_q_table(policy)
+        self.host = host
+        self.port = port
+        self.pace_ms = pace_ms
+        self.batch_window_ms = batch_window_ms
+        self.max_limit = max_limit
+        self.ids = itertools.count(1)
+        self.sessions = {}
+        self.finished = 0
+        self.failed = 0
+        self.batcher = None
+        self.server = None
+
+    async def start(self):
+        self.batcher = AIBatcher(self.policy, self.batch_window_ms)
+        self.batcher.start()
+        self.server = await asyncio.start_server(self.handle, self.host, self.port, limit=2**16)
+        self.port = self.server.sockets[0].getsockname()[1]  # Actual port (for port 0)
+        return self
+
+    async def serve_forever(self):
+        await self.start()
+        print(f"Kingdom game server on {self.host}:{self.port}")
+        async with self.server:
+            await self.server.serve_forever()
+
+    async def close(self):
+        for task in list(self.sessions.values()):
+            task.cancel()
+        self.batcher.stop()
+        self.server.close()
+        await self.server.wait_closed()
+
+    def new_session(self, request, send):
+        mode = request.get("mode", "human")
+        limit = request.get("limit", 50)
+        pace = request.get("pace_ms", self.pace_ms)
+        if (mode not in ("human", "ai") or not is_int(limit) or not 1 < limit <= self.max_limit
+                or not isinstance(pace, (int, float)) or isinstance(pace, bool) or pace < 0):
+            raise ValueError(f"Invalid session request {request}.")
+        session = Session(next(self.ids), send, self.batcher, mode, limit, pace)
+        task = asyncio.get_running_loop().create_task(session.run())
+        self.sessions[session.id] = task
+        task.add_done_callback(lambda task: self.end_session(session.id, task))
+        return session
+
+    def end_session(self, session_id, task=None):
+        """Removes a finished session; the exception of a failed one is retrieved and counted (a lost
+        connection is not reported, every other error is printed)."""
+        if self.sessions.pop(session_id, None) is not None:
+            self.finished += 1
+        error = task.exception() if task is not None and not task.cancelled() else None
+        if error is not None:
+            self.failed += 1
+            print(f"Session {session_id} failed: {error!r}") if not isinstance(error, ConnectionError) else None
+
+    async def handle(self, reader, writer):
+        """One client connection: routes its requests to its sessions, cancels them on disconnect."""
+        lock = asyncio.Lock()
+        own = {}
+
+        async def send(message):
+            async with lock:
+                writer.write((json.dumps(message) + "\n").encode())
+                await writer.drain()
+
+        try:
+            async for line in reader:
+                try:
+                    request = json.loads(line)
+                    kind = request.get("type")
+                    if kind == "new":
+                        session = self.new_session(request, send)
+                        own[session.id] = session
+                    elif kind in ("move", "quit") and is_int(request.get("session")) and request["session"] in own:
+                        session = own[request["session"]]
+                        if kind == "move":
+                            session.moves.put_nowait(request.get("choice"))
+                        elif session.id in self.sessions:
+                            self.sessions[session.id].cancel()
+                    else:
+                        raise ValueError(f"Unknown request {request}.")
+                except (ValueError, AttributeError, TypeError) as error:
+                    await send({"type": "error", "message": str(error)})
+        except (ConnectionError, ValueError):
+            pass  # Disconnected or a line above the stream limit
+        finally:
+            for session_id in own:
+                if session_id in self.sessions:
+                    self.sessions[session_id].cancel()
+            writer.close()
+
+def serve(policy, host=host, port=port, pace_ms=pace_ms, batch_window_ms=batch_window_ms):
+    """Runs the game server (with a `GreedyPolicy` or a Q-table) until it is interrupted."""
+    asyncio.run(GameServer(policy, host, port, pace_ms, batch_window_ms).serve_forever())
+
+#-------------------------Notes-----------------------------------------------*\
+# Sessions are coroutines, waiting for a human move or the pace delay does
+# not block the other sessions.
+#-----------------------------------------------------------------------------*\
@@ -0,0 +1,139 @@
+#---------------------------------------------------------*\
+# Title: Headless AI-vs-AI Tournament
+# Author:
+#---------------------------------------------------------*/
+#!/usr/bin/env python3
+
+import random
+import numpy as np
+from src.Kingdom import Kingdom
+from src.game import apply_choice
+from src.eval import wilson_interval
+from models.model import encoder
+from models.policy import GreedyPolicy
+from utils.checkpoint import load_q_table, read_header
+
+#---------------------------------------------------------*/
+# Players
+#---------------------------------------------------------*/
+def random_policy(kingdom, opponent, rng):
+    """Uniformly random action."""
+    return rng.randint(1, 4)
+
+def builder_policy(kingdom, opponent, rng):
+    """Fortifies and trains while resources allow, gathers otherwise, attacks when clearly stronger."""
+    if kingdom.soldiers > opponent.soldiers + 20:
+        return 4
+    if kingdom.resources >= 20 and kingdom.castle_strength <= opponent.castle_strength:
+        return 3
+    if kingdom.resources >= 10:
+        return 2
+    return 1
+
+def aggressive_policy(kingdom, opponent, rng):
+    """Attacks whenever the attack succeeds, trains soldiers otherwise."""
+    if int(kingdom.soldiers * 0.333 + 3) > int(opponent.soldiers * 0.333):
+        return 4
+    return 2 if kingdom.resources >= 10 else 1
+
+scripted_policies = {
+    "random": random_policy,
+    "builder": builder_policy,
+    "aggressive": aggressive_policy,
+}
+
+def parse_iterations(text):
+    """Number of search iterations of an "mcts:N" player spec (a positive integer)."""
+    if not text.isdigit() or int(text) < 1:
+        raise ValueError(f"Invalid player 'mcts:{text}': N must be a positive number of search iterations.")
+    return int(text)
+
+def make_player(spec):
+    """
+    Creates a player from a Q-table (array or checkpoint path), a tile coding or DQN checkpoint, an
+    exported `GreedyPolicy` (.qpol), the name of a scripted policy, "mcts" (MCTS with the default
+    Q-table as prior, 75 ms per move), "mcts:N" (N search iterations per move, reproducible with the
+    tournament seed) or a callable `policy(kingdom, opponent, rng) -> choice (1-4)`.
+    """
+    if callable(spec):
+        return spec
+    if isinstance(spec, str) and spec in scripted_policies:
+        return scripted_policies[spec]
+    if isinstance(spec, str) and (spec == "mcts" or spec.startswith("mcts:")):
+        from models.mcts import MCTSPlayer
+        max_iterations = parse_iterations(spec[len("mcts:"):]) if spec != "mcts" else None
+        return MCTSPlayer(np.asarray(load_q_table(expected_buckets=encoder.buckets)), max_iterations=max_iterations)
+    if isinstance(spec, str) and spec.endswith(".qpol"):
+        return GreedyPolicy.load(spec)
+    model = read_header(spec)[0].get("model") if isinstance(spec, str) and spec.endswith(".qtab") else None
+    if model == "tile_coding":
+        from models.tile_coding_model import TileCodingAgent
+        return TileCodingAgent.load(spec)
+    if model == "dqn":
+        from models.dqn_model import DQNAgent
+        return DQNAgent.load(spec)
+    if isinstance(spec, str):
+        spec = load_q_table(spec, expected_buckets=encoder.buckets)
+    return GreedyPolicy.from_q_table(spec)
+
+#---------------------------------------------------------*/
+# Matches
+#---------------------------------------------------------*/
+def play_match(player1, player2, limit=50, rng=random):
+    """
+    Plays one silent game with the rules of `game`: the starting kingdom is drawn with
+    `random.sample`, the game is a draw when `limit` rounds are reached.
+
+    Returns 1 if `player1` wins, 0 for a draw and -1 if `player2` wins.
+    """
+    kingdom1 = Kingdom("Kingdom Atlantis", player="machine")
+    kingdom2 = Kingdom("Kingdom Babylon", player="machine")
+    (first, first_player), (second, second_player) = rng.sample([(kingdom1, player1), (kingdom2, player2)], 2)
+    sign = 1 if first is kingdom1 else -1
+    turn = 1
+
+    while True:
+        apply_choice(first, second, first_player(first, second, rng))
+        if second.castle_strength <= 0:
+            return sign
+
+        apply_choice(second, first, second_player(second, first, rng))
+        if first.castle_strength <= 0:
+            return -sign
+
+        turn += 1
+        if turn >= limit:
+            return 0
+
+def run_tournament(player1, player2, n_games=1000, limit=50, seed=None):
+    """
+    Plays `n_games` headless games between two players (Q-tables, checkpoint paths, names of
+    scripted policies or callables), without sleeps or output.
+
+    Returns a dict with wins, draws and losses of `player1` and 95% Wilson intervals of their rates.
+    """
+    rng = random.Random(seed)
+    player1, player2 = make_player(player1), make_player(player2)
+    for player in (player1, player2):
+        if hasattr(player, "plies_played"):
+            player.limit = limit  # MCTS players count the plies until the draw
+
+    outcomes = [play_match(player1, player2, limit, rng) for _ in range(n_games)]
+    wins, draws = outcomes.count(1), outcomes.count(0)
+    losses = n_games - wins - draws
+
+    report = {"games": n_games, "wins": wins, "draws": draws, "losses": losses}
+    for label, count in (("win", wins), ("draw", draws), ("loss", losses)):
+        report[f"{label}_rate"] = count / n_games
+        report[f"{label}_ci"] = wilson_interval(count, n_games)
+    return report
+
+def print_report(report, name1="Player 1", name2="Player 2"):
+    print(f"\n{name1} vs {name2} ({report['games']} games)")
+    for label, count in (("win", "wins"), ("draw", "draws"), ("loss", "losses")):
+        low, high = report[f"{label}_ci"]
+        print(f"{count.capitalize():>6}: {report[count]:>6} ({report[label + '_rate']:.1%}, 95% CI {low:.1%} - {high:.1%})")
+
+#-------------------------Notes-----------------------------------------------*\
+#
+#-----------------------------------------------------------------------------*\
@@ -0,0 +1,42 @@
+import os
+import numpy as np
+import pytest
+from models.q_table import SparseQTable
+from utils.checkpoint import save_checkpoint, load_checkpoint, read_header
+
+def test_dense_round_trip(tmp_path):
+    path = str(tmp_path / "q_table.qtab")
+    q_table = np.random.default_rng(0).standard_normal((60, 4))
+    save_checkpoint(q_table, path, buckets=(3, 4, 5), action_names=("a", "b", "c", "d"), episodes=120, seed=7)
+
+    header, offset = read_header(path)
+    assert offset % 64 == 0
+    assert header["shape"] == [60, 4] and header["buckets"] == [3, 4, 5] and header["episodes"] == 120
+    assert header["action_names"] == ["a", "b", "c", "d"] and header["seed"] == 7
+
+    for mmap in (True, False):
+        loaded, _ = load_checkpoint(path, mmap=mmap, verify=True, expected_buckets=(3, 4, 5))
+        np.testing.assert_array_equal(loaded, q_table)
+    with pytest.raises(ValueError):
+        load_checkpoint(path, expected_buckets=(1, 1, 1))
+    assert os.listdir(tmp_path) == ["q_table.qtab"]  # No temporary file left behind
+
+def test_sparse_round_trip(tmp_path):
+    path = str(tmp_path / "sparse.qtab")
+    dense = np.zeros((1000, 4), dtype=np.float32)
+    dense[[3, 17, 999]] = np.arange(12, dtype=np.float32).reshape(3, 4) + 1
+    q_table = SparseQTable.from_array(dense)
+    save_checkpoint(q_table, path, episodes=5)
+
+    header, _ = read_header(path)
+    assert header["layout"] == "sparse" and header["n_rows"] == len(q_table.sparse_arrays()[0])
+    loaded, _ = load_checkpoint(path, verify=True)
+    assert isinstance(loaded, SparseQTable)
+    np.testing.assert_array_equal(np.asarray(loaded), dense)
+
+def test_failed_write_removes_temporary_file(tmp_path):
+    target = tmp_path / "q_table.qtab"
+    target.mkdir()  # `os.replace` fails after the data was written
+    with pytest.raises(OSError):
+        save_checkpoint(np.zeros((2, 4)), str(target), episodes=1)
+    assert os.listdir(tmp_path) == ["q_table.qtab"] and not os.listdir(target)
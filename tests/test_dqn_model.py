@@ -0,0 +1,43 @@
+import numpy as np
+from models.dqn_model import MLP
+
+def make_network(sizes=(6, 5, 4, 4), seed=0):
+    """Small network in float64, so finite differences are exact enough to compare."""
+    network = MLP(sizes, np.random.default_rng(seed), learning_rate=0.01)
+    network.params = [param.astype(np.float64) for param in network.params]
+    network.moments = [np.zeros_like(param) for param in network.params]
+    network.velocities = [np.zeros_like(param) for param in network.params]
+    return network
+
+def test_backward_matches_numerical_gradient():
+    rng = np.random.default_rng(1)
+    network = make_network()
+    x = rng.standard_normal((7, 6))
+    grad_output = rng.standard_normal((7, 4))  # Loss: sum(output * grad_output)
+
+    _, activations = network.forward(x)
+    grads = network.backward(activations, grad_output)
+
+    step = 1e-6
+    for param, grad in zip(network.params, grads):
+        numerical = np.zeros_like(param)
+        for index in np.ndindex(param.shape):
+            value = param[index]
+            param[index] = value + step
+            loss_plus = np.sum(network(x) * grad_output)
+            param[index] = value - step
+            loss_minus = np.sum(network(x) * grad_output)
+            param[index] = value
+            numerical[index] = (loss_plus - loss_minus) / (2 * step)
+        np.testing.assert_allclose(grad, numerical, rtol=1e-5, atol=1e-7)
+
+def test_first_adam_step_moves_by_learning_rate():
+    # With empty moments, the bias-corrected first step is learning_rate * sign(gradient) (up to eps)
+    rng = np.random.default_rng(2)
+    network = make_network()
+    before = [param.copy() for param in network.params]
+    grads = [rng.standard_normal(param.shape) for param in network.params]
+
+    network.adam_step(grads)
+    for old, new, grad in zip(before, network.params, grads):
+        np.testing.assert_allclose(new - old, -0.01 * np.sign(grad), rtol=1e-3)
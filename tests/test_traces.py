@@ -0,0 +1,29 @@
+import numpy as np
+from utils.traces import TraceRecorder, load_traces, read_trace_header
+
+def record_run(path, n_episodes, **meta):
+    with TraceRecorder(path, chunk_size=4, **meta) as recorder:
+        for episode in range(n_episodes):
+            for turn in range(3):
+                recorder.record(episode, turn, turn % 2, 1, (1, 2, 3, 4, 5, 6), 0.5)
+    return recorder.first_episode
+
+def test_appended_runs_keep_episode_ids_unique(tmp_path):
+    path = str(tmp_path / "traces.ktrace")
+    assert record_run(path, 5, run=1) == 0
+    assert record_run(path, 4, run=2) == 5
+
+    header, _ = read_trace_header(path)
+    assert header["next_episode"] == 9 and header["n_records"] == 27
+    assert [run["first_episode"] for run in header["runs"]] == [0, 5]
+    traces, _ = load_traces(path)
+    assert np.array_equal(np.unique(traces["episode"]), np.arange(9))
+
+def test_interrupted_run_falls_back_to_scanning(tmp_path):
+    path = str(tmp_path / "traces.ktrace")
+    record_run(path, 2)
+    recorder = TraceRecorder(path, chunk_size=1)  # Never closed: the header keeps the old count
+    recorder.record(3, 0, 0, 1, (1, 2, 3, 4, 5, 6), 0.0)
+    recorder.file.close()
+
+    assert record_run(path, 1) == 6
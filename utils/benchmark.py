@@ -0,0 +1,305 @@
+#---------------------------------------------------------*\
+# Title: Benchmark Suite (fixed workloads, JSON baselines)
+# Author:
+#---------------------------------------------------------*/
+#!/usr/bin/env python3
+
+import os
+import sys
+import json
+import time
+import random
+import platform
+import tempfile
+import statistics
+import numpy as np
+
+#---------------------------------------------------------*/
+# Parameters
+#---------------------------------------------------------*/
+
+baseline_path = "./out/benchmark_baseline.json"
+results_path = "./out/benchmark_results.json"
+
+# Allowed slowdown against the baseline before a benchmark counts as regression (0.2 = 20%)
+tolerance = 0.2
+
+# Fixed seed of all workloads
+seed = 0
+
+#---------------------------------------------------------*/
+# Functions (Helper)
+#---------------------------------------------------------*/
+def seed_all(value=seed):
+    """Seeds both generators used by the game (`random` in Kingdom, `np.random` in the models)."""
+    random.seed(value)
+    np.random.seed(value)
+
+def best_rate(run, work, repeat):
+    """Runs `run()` `repeat` times and returns the best rate (`work` units per second)."""
+    best = float("inf")
+    for _ in range(repeat):
+        seed_all()
+        started = time.perf_counter()
+        run()
+        best = min(best, time.perf_counter() - started)
+    return work / best
+
+#---------------------------------------------------------*/
+# Benchmarks (each returns its value, the unit is given in `benchmarks`)
+#---------------------------------------------------------*/
+def bench_kingdom_actions(scale=1.0, repeat=3):
+    """Raw `Kingdom` throughput: a fixed random sequence of the four actions on two kingdoms."""
+    from src.Kingdom import Kingdom
+    n = int(200000 * scale)
+    choices = np.random.default_rng(seed).integers(0, 4, n).tolist()
+
+    def run():
+        kingdom1, kingdom2 = Kingdom("A"), Kingdom("B")
+        actions = (kingdom1.gather_resources, kingdom1.train_soldiers, kingdom1.fortify_castle,
+                   lambda: kingdom1.attack(kingdom2))
+        for choice in choices:
+            actions[choice]()
+            if kingdom2.castle_strength <= 0 or kingdom1.soldiers <= 0:
+                kingdom1.__init__("A")
+                kingdom2.__init__("B")
+
+    return best_rate(run, n, repeat)
+
+def bench_kingdom_apply_undo(scale=1.0, repeat=3):
+    """Search primitive of `Kingdom`: clone, then apply and undo a fixed random sequence of actions."""
+    from src.Kingdom import Kingdom
+    n = int(200000 * scale)
+    choices = np.random.default_rng(seed).integers(0, 4, n).tolist()
+
+    def run():
+        kingdom1, kingdom2 = Kingdom("A"), Kingdom("B")
+        for choice in choices:
+            clone = kingdom1.clone()
+            clone.undo(clone.apply(choice, kingdom2), kingdom2)
+
+    return best_rate(run, n, repeat)
+
+def bench_policy_act(scale=1.0, repeat=3):
+    """`GreedyPolicy.act` on batches of 1000 random states (one gather per batch), states/s."""
+    from models.model import encoder
+    from models.policy import GreedyPolicy
+    rng = np.random.default_rng(seed)
+    policy = GreedyPolicy.from_q_table(rng.random((encoder.n_states, 4)))
+    batches = rng.integers(0, encoder.n_states, (max(1, int(1000 * scale)), 1000))
+
+    def run():
+        for states in batches:
+            policy.act(states)
+
+    return best_rate(run, batches.size, repeat)
+
+def bench_model_take_turn(scale=1.0, repeat=3):
+    """`models.model.take_turn` with updates (alpha = 0.9, epsilon = 0.5), turns/s."""
+    from src.Kingdom import Kingdom
+    from models import model
+    n = int(20000 * scale)
+    q_table = np.zeros((model.encoder.n_states, model.n_actions))
+
+    def run():
+        kingdom1, kingdom2 = Kingdom("A"), Kingdom("B")
+        for _ in range(n):
+            done, _, _ = model.take_turn(kingdom1, kingdom2, q_table, 0.9, 0.9, 0.5)
+            if done:
+                kingdom1, kingdom2 = Kingdom("A"), Kingdom("B")
+            kingdom1, kingdom2 = kingdom2, kingdom1
+
+    return best_rate(run, n, repeat)
+
+def bench_model_run_episode(scale=1.0, repeat=3):
+    """`models.model.run_episode` (epsilon = 0.5), episodes/s."""
+    from models import model
+    n = int(500 * scale)
+    q_table = np.zeros((model.encoder.n_states, model.n_actions))
+
+    def run():
+        for _ in range(n):
+            model.run_episode(q_table, epsilon=0.5)
+
+    return best_rate(run, n, repeat)
+
+def bench_agent_take_turn(scale=1.0, repeat=3):
+    """`QLearningAgent.take_turn` (epsilon = 0.5), turns/s."""
+    from src.Kingdom import Kingdom
+    from models.Q_Learning_model import QLearningAgent
+    n = int(20000 * scale)
+    agent = QLearningAgent()
+
+    def run():
+        kingdom1, kingdom2 = Kingdom("A"), Kingdom("B")
+        for _ in range(n):
+            done, _, _ = agent.take_turn(kingdom1, kingdom2, 0.5)
+            if done:
+                kingdom1, kingdom2 = Kingdom("A"), Kingdom("B")
+            kingdom1, kingdom2 = kingdom2, kingdom1
+
+    return best_rate(run, n, repeat)
+
+def bench_agent_run_episode(scale=1.0, repeat=3):
+    """`QLearningAgent.run_episode` (epsilon = 0.5), episodes/s."""
+    from models.Q_Learning_model import QLearningAgent
+    n = int(500 * scale)
+    agent = QLearningAgent()
+
+    def run():
+        for _ in range(n):
+            agent.run_episode(0.5)
+
+    return best_rate(run, n, repeat)
+
+def bench_evaluate_agent(scale=1.0, repeat=3):
+    """`evaluate_agent` in the main process (no pool, no plot), evaluation games/s."""
+    from models import model
+    from src.eval import evaluate_agent
+    n = int(500 * scale)
+    q_table = np.zeros((model.encoder.n_states, model.n_actions))
+    return best_rate(lambda: evaluate_agent(q_table, n, n_workers=1, seed=seed, plot=False, progress=False), n, repeat)
+
+def bench_checkpoint_save(scale=1.0, repeat=3):
+    """`save_checkpoint` of a 1M x 4 float64 Q-table (32 MB), MB/s."""
+    from utils.checkpoint import save_checkpoint
+    q_table = np.random.default_rng(seed).random((int(1000000 * scale), 4))
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, "q_table.qtab")
+        return best_rate(lambda: save_checkpoint(q_table, path), q_table.nbytes / 1e6, repeat)
+
+def bench_checkpoint_load(scale=1.0, repeat=3):
+    """`load_q_table` of a 1M x 4 float64 Q-table into memory (no mmap), MB/s."""
+    from utils.checkpoint import save_checkpoint, load_q_table
+    q_table = np.random.default_rng(seed).random((int(1000000 * scale), 4))
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, "q_table.qtab")
+        save_checkpoint(q_table, path)
+        return best_rate(lambda: load_q_table(path, mmap=False), q_table.nbytes / 1e6, repeat)
+
+def bench_episodes_to_target(scale=1.0, repeat=3, target_win_rate=0.95, check_every=50, max_episodes=20000):
+    """
+    Sample efficiency of `models.model`: training episodes (`run_episode` with the epsilon decay of
+    the module) until the greedy policy reaches `target_win_rate` in 500 seeded evaluation games.
+    Median over `repeat` training seeds, `max_episodes` if the target is never reached.
+    """
+    from models import model
+    from models.batch_model import evaluate_q_table_batched
+    needed = []
+    for run in range(repeat):
+        seed_all(seed + run)
+        q_table = np.zeros((model.encoder.n_states, model.n_actions))
+        epsilon = model.epsilon_start
+        episodes = max_episodes
+        for episode in range(1, max_episodes + 1):
+            model.run_episode(q_table, epsilon=epsilon)
+            epsilon = max(model.epsilon_min, model.epsilon_decay_rate * epsilon)
+            if episode % check_every == 0 and evaluate_q_table_batched(q_table, 500, seed=seed)[0].mean() >= target_win_rate:
+                episodes = episode
+                break
+        needed.append(episodes)
+    return float(statistics.median(needed))
+
+# name -> (function, unit, higher_is_better)
+benchmarks = {
+    "kingdom_actions": (bench_kingdom_actions, "actions/s", True),
+    "kingdom_apply_undo": (bench_kingdom_apply_undo, "moves/s", True),
+    "policy_act": (bench_policy_act, "states/s", True),
+    "model_take_turn": (bench_model_take_turn, "turns/s", True),
+    "model_run_episode": (bench_model_run_episode, "episodes/s", True),
+    "agent_take_turn": (bench_agent_take_turn, "turns/s", True),
+    "agent_run_episode": (bench_agent_run_episode, "episodes/s", True),
+    "evaluate_agent": (bench_evaluate_agent, "episodes/s", True),
+    "checkpoint_save": (bench_checkpoint_save, "MB/s", True),
+    "checkpoint_load": (bench_checkpoint_load, "MB/s", True),
+    "episodes_to_target": (bench_episodes_to_target, "episodes", False),
+}
+
+#---------------------------------------------------------*/
+# Functions (Main)
+#---------------------------------------------------------*/
+def run_benchmarks(names=None, scale=1.0, repeat=3, progress=True):
+    """
+    Runs the benchmarks (all if `names` is None) with their fixed seeds and workloads.
+
+    Parameters:
+    - `names` (list, optional): Names of the benchmarks to run (see `benchmarks`).
+    - `scale` (float): Scales the workload sizes (e.g. 0.1 for a quick run).
+    - `repeat` (int): Repetitions per benchmark, the best repetition is reported.
+
+    Returns a dict with the machine info and one entry (value, unit, higher_is_better) per benchmark.
+    """
+    results = {}
+    for name in names or list(benchmarks):
+        function, unit, higher_is_better = benchmarks[name]
+        value = function(scale=scale, repeat=repeat)
+        results[name] = {"value": value, "unit": unit, "higher_is_better": higher_is_better}
+        if progress:
+            print(f"{name:<20} {value:>14.1f} {unit}")
+
+    return {
+        "created": time.strftime("%Y-%m-%d %H:%M:%S"),
+        "python": platform.python_version(),
+        "numpy": np.__version__,
+        "platform": platform.platform(),
+        "scale": scale,
+        "benchmarks": results,
+    }
+
+def save_results(results, path=results_path):
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    with open(path, "w") as f:
+        json.dump(results, f, indent=4)
+
+def load_results(path=baseline_path):
+    with open(path) as f:
+        return json.load(f)
+
+def compare(results, baseline, tolerance=tolerance):
+    """
+    Compares results against a baseline. Returns one row per common benchmark: name, baseline value,
+    current value, relative change (positive = better) and whether it is a regression beyond `tolerance`.
+    """
+    rows = []
+    for name, current in results["benchmarks"].items():
+        if name not in baseline["benchmarks"]:
+            continue
+        reference = baseline["benchmarks"][name]["value"]
+        if current["higher_is_better"]:
+            change = current["value"] / reference - 1
+        else:
+            change = reference / current["value"] - 1
+        rows.append((name, reference, current["value"], change, change < -tolerance))
+    return rows
+
+def print_comparison(rows, tolerance=tolerance):
+    print(f"\n{'Benchmark':<20}{'Baseline':>14}{'Current':>14}{'Change':>9}")
+    for name, reference, value, change, regression in rows:
+        print(f"{name:<20}{reference:>14.1f}{value:>14.1f}{change:>+9.1%}{'  REGRESSION' if regression else ''}")
+    n_regressions = sum(row[4] for row in rows)
+    print(f"{n_regressions} regression(s) beyond {tolerance:.0%}" if n_regressions else f"No regressions beyond {tolerance:.0%}")
+
+def check(names=None, scale=1.0, repeat=3, baseline=baseline_path, tolerance=tolerance, save_baseline=False):
+    """
+    Runs the suite, writes the results to ./out/benchmark_results.json and compares them against the
+    baseline (or stores them as new baseline with `save_baseline`, or if there is none yet).
+    Returns True if no benchmark regressed beyond `tolerance`.
+    """
+    results = run_benchmarks(names, scale, repeat)
+    save_results(results)
+    if save_baseline or not os.path.exists(baseline):
+        save_results(results, baseline)
+        print(f"Baseline saved to {baseline}")
+        return True
+
+    reference = load_results(baseline)
+    if reference.get("scale") != scale:
+        print(f"Warning: baseline was measured with scale {reference.get('scale')}, not {scale}", file=sys.stderr)
+    rows = compare(results, reference, tolerance)
+    print_comparison(rows, tolerance)
+    return not any(row[4] for row in rows)
+
+#-------------------------Notes-----------------------------------------------*\
+# Rates are the best of `repeat` runs (least disturbed by other processes),
+# `episodes_to_target` is a sample-efficiency benchmark (lower is better).
+#-----------------------------------------------------------------------------*\
@@ -0,0 +1,148 @@
+#---------------------------------------------------------*\
+# Title: Q-Table Checkpoints (binary, memory-mappable)
+# Author:
+#---------------------------------------------------------*/
+#!/usr/bin/env python3
+
+import os
+import json
+import struct
+import tempfile
+import hashlib
+import numpy as np
+
+# File layout: MAGIC | header length (uint32, little endian) | JSON header | padding | raw C-order array
+# Sparse tables (layout "sparse"): ... | padding | sorted visited states (int64) | their rows (C-order)
+MAGIC = b"KQTABLE1"
+ALIGNMENT = 64
+
+default_path = "./out/q_table.qtab"
+legacy_path = "./out/q_table.npy"
+
+def save_checkpoint(q_table, path=default_path, buckets=None, action_names=None, episodes=None, **extra):
+    """
+    Writes a Q-table checkpoint: a JSON header (bucket configuration, action order, dtype, shape,
+    episode count, SHA-256 of the data) followed by the raw array at a 64-byte aligned offset, so
+    that it can be opened with `np.memmap` without copying. The file is written to a unique temporary
+    file in the same directory first and then renamed, so readers never see a half-written checkpoint
+    and concurrent writers (e.g. sweep workers) do not share a temporary file.
+
+    Parameters:
+    - `q_table` (numpy.ndarray): The Q-table to be saved.
+    - `path` (str): Target file.
+    - `buckets` (tuple): (castle_strength_buckets, resource_buckets, soldier_buckets) of the table.
+    - `action_names` (tuple): Names of the actions in column order.
+    - `episodes` (int): Number of training episodes behind the table.
+    - `extra`: Further JSON-serializable metadata.
+
+    A sparse table (`SparseQTable`, see models/q_table.py) is written in the sparse layout: the
+    sorted visited states and their rows, so its file has the size of the visited part only.
+    """
+    if hasattr(q_table, "sparse_arrays"):
+        states, values = q_table.sparse_arrays()
+        arrays = [np.ascontiguousarray(states, dtype=np.int64), np.ascontiguousarray(values)]
+        layout = {"layout": "sparse", "n_rows": len(states)}
+    else:
+        arrays = [np.ascontiguousarray(q_table)]
+        layout = {}
+    digest = hashlib.sha256()
+    for array in arrays:
+        digest.update(array.data)
+    header = {
+        "dtype": arrays[-1].dtype.str,
+        "shape": list(q_table.shape),
+        "buckets": list(buckets) if buckets is not None else None,
+        "action_names": list(action_names) if action_names is not None else None,
+        "episodes": episodes,
+        "sha256": digest.hexdigest(),
+        **layout,
+        **extra,
+    }
+    header_bytes = json.dumps(header).encode()
+    prefix_length = len(MAGIC) + 4 + len(header_bytes)
+    padding = b" " * (-prefix_length % ALIGNMENT)
+
+    directory = os.path.dirname(path) or "."
+    os.makedirs(directory, exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(prefix=f".{os.path.basename(path)}.", suffix=".tmp", dir=directory)
+    try:
+        with os.fdopen(fd, "wb") as f:
+            os.fchmod(f.fileno(), 0o644)  # mkstemp creates the file private (0600)
+            f.write(MAGIC)
+            f.write(struct.pack("<I", len(header_bytes) + len(padding)))
+            f.write(header_bytes + padding)
+            for array in arrays:
+                f.write(array.data)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, path)
+    except BaseException:
+        os.unlink(tmp_path)
+        raise
+
+def read_header(path):
+    """Reads the JSON header of a checkpoint and the offset of the array data."""
+    with open(path, "rb") as f:
+        if f.read(len(MAGIC)) != MAGIC:
+            raise ValueError(f"{path} is not a Q-table checkpoint.")
+        (header_length,) = struct.unpack("<I", f.read(4))
+        header = json.loads(f.read(header_length))
+    return header, len(MAGIC) + 4 + header_length
+
+def load_checkpoint(path=default_path, mmap=True, verify=False, expected_buckets=None):
+    """
+    Opens a checkpoint and returns the Q-table and its header. With `mmap` the table is a read-only
+    `np.memmap` on the file (zero-copy), otherwise it is read into memory. A checkpoint in the sparse
+    layout is read into a `SparseQTable` (always in memory, never densified).
+
+    Parameters:
+    - `verify` (bool): Check the SHA-256 of the data against the header.
+    - `expected_buckets` (tuple, optional): Raise a ValueError if the table was trained with another
+      bucket configuration.
+    """
+    header, offset = read_header(path)
+    dtype, shape = np.dtype(header["dtype"]), tuple(header["shape"])
+
+    if expected_buckets is not None and header["buckets"] is not None and tuple(header["buckets"]) != tuple(expected_buckets):
+        raise ValueError(f"Q-table was trained with buckets {header['buckets']}, expected {list(expected_buckets)}.")
+
+    if header.get("layout") == "sparse":
+        from models.q_table import SparseQTable  # Only needed for sparse checkpoints
+        n_rows = header["n_rows"]
+        states = np.fromfile(path, dtype=np.int64, count=n_rows, offset=offset)
+        values = np.fromfile(path, dtype=dtype, count=n_rows * shape[1], offset=offset + states.nbytes).reshape(n_rows, shape[1])
+        digest = hashlib.sha256(states.data)
+        digest.update(values.data)
+        if verify and digest.hexdigest() != header["sha256"]:
+            raise ValueError(f"Checksum mismatch in {path}.")
+        return SparseQTable.from_sparse(shape[0], states, values), header
+
+    if mmap:
+        q_table = np.memmap(path, dtype=dtype, mode="r", offset=offset, shape=shape)
+    else:
+        q_table = np.fromfile(path, dtype=dtype, offset=offset).reshape(shape)
+
+    if verify and hashlib.sha256(np.ascontiguousarray(q_table).data).hexdigest() != header["sha256"]:
+        raise ValueError(f"Checksum mismatch in {path}.")
+    return q_table, header
+
+def load_q_table(path=default_path, mmap=True, expected_buckets=None):
+    """
+    Loads a Q-table from a checkpoint or a legacy `.npy` file. If the default checkpoint does not
+    exist yet, the legacy `./out/q_table.npy` is used.
+    """
+    if path == default_path and not os.path.exists(path) and os.path.exists(legacy_path):
+        path = legacy_path
+    with open(path, "rb") as f:
+        is_checkpoint = f.read(len(MAGIC)) == MAGIC
+    if is_checkpoint:
+        return load_checkpoint(path, mmap=mmap, expected_buckets=expected_buckets)[0]
+    return np.load(path, mmap_mode="r" if mmap else None)
+
+def export_csv(q_table, path="./out/q_table.csv"):
+    """Explicit (slow) text export of a Q-table."""
+    np.savetxt(path, q_table, delimiter=",")
+
+#-------------------------Notes-----------------------------------------------*\
+#
+#-----------------------------------------------------------------------------*\
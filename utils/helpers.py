@@ -18,14 +18,17 @@ def analyze_q_table(q_table):
     dict: A dictionary containing the count of non-zero elements, total elements, 
           count of rows with at least one non-zero element, and total rows.
     """
+    # Sparse tables are analyzed on their visited rows (unvisited rows are zero)
+    values = q_table.sparse_arrays()[1] if hasattr(q_table, "sparse_arrays") else q_table
+
     # Count of non-zero elements in the Q-table
-    non_zero_elements_count = np.count_nonzero(q_table)
+    non_zero_elements_count = int(np.count_nonzero(values))
 
     # Total number of elements in the Q-table
     total_elements_count = q_table.size
 
     # Count of rows with at least one non-zero element
-    rows_with_non_zero = np.count_nonzero(np.count_nonzero(q_table, axis=1))
+    rows_with_non_zero = int(np.count_nonzero(np.count_nonzero(values, axis=1)))
 
     # Total number of rows in the Q-table
     total_rows_count = q_table.shape[0]
@@ -36,10 +39,10 @@ def analyze_q_table(q_table):
 
     # Create a dictionary with the analysis results
     results_dict = {
-        "ratio_non_zero_elements (%)": np.round(ratio_non_zero_elements, 2),
+        "ratio_non_zero_elements (%)": round(ratio_non_zero_elements, 2),
         "non_zero_elements": non_zero_elements_count,
         "total_elements": total_elements_count,
-        "ratio_rows_with_non_zero (%)": np.round(ratio_rows_with_non_zero, 2),
+        "ratio_rows_with_non_zero (%)": round(ratio_rows_with_non_zero, 2),
         "rows_with_non_zero_element": rows_with_non_zero,
         "total_rows": total_rows_count
     }
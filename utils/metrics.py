@@ -0,0 +1,120 @@
+#---------------------------------------------------------*\
+# Title: Training Metrics (ring buffers + streaming consumers)
+# Author:
+#---------------------------------------------------------*/
+#!/usr/bin/env python3
+
+import os
+import numpy as np
+
+class TrainingMetrics:
+    """
+    Preallocated ring buffers for the evaluation points of a training run: episode number, win rate,
+    reward and integer action counts. Only the last `capacity` points are kept, every new point is
+    streamed to the subscribed consumers (see `ConsoleSummary`, `CsvSink`, `PlotSink`), so nothing
+    per episode has to be kept as Python objects.
+
+    `action_names` label the action counts (CSV header, plot legend); the trainers pass the names
+    of their model (`models.model.action_names`), without them the actions are numbered.
+    """
+
+    def __init__(self, capacity=10000, n_actions=4, action_names=None):
+        self.capacity = capacity
+        self.action_names = tuple(action_names) if action_names is not None else tuple(f"Action {i}" for i in range(n_actions))
+        self.episodes = np.zeros(capacity, dtype=np.int64)
+        self.win_rates = np.zeros(capacity)
+        self.rewards = np.zeros(capacity)
+        self.action_counts = np.zeros((capacity, n_actions), dtype=np.int64)
+        self.count = 0  # Number of recorded points (including overwritten ones)
+        self.consumers = []
+
+    def subscribe(self, consumer):
+        """Adds a consumer with `consume(metrics, slot)` and `close(metrics)`, returns the metrics."""
+        self.consumers.append(consumer)
+        return self
+
+    def record(self, episode, win_rate, reward, action_counts):
+        """Writes one evaluation point into the ring buffers and passes it to all consumers."""
+        slot = self.count % self.capacity
+        self.episodes[slot] = episode
+        self.win_rates[slot] = win_rate
+        self.rewards[slot] = reward
+        self.action_counts[slot] = action_counts
+        self.count += 1
+        for consumer in self.consumers:
+            consumer.consume(self, slot)
+
+    def record_batch(self, episodes, win_rates, rewards, action_counts):
+        """Records several points at once (arrays of equal length)."""
+        for point in zip(episodes, win_rates, rewards, action_counts):
+            self.record(*point)
+
+    def __len__(self):
+        return min(self.count, self.capacity)
+
+    def view(self):
+        """Returns the retained points in chronological order: episodes, win rates, rewards, action counts."""
+        order = np.arange(self.count - len(self), self.count) % self.capacity
+        return self.episodes[order], self.win_rates[order], self.rewards[order], self.action_counts[order]
+
+    def close(self):
+        for consumer in self.consumers:
+            consumer.close(self)
+
+#---------------------------------------------------------*/
+# Consumers
+#---------------------------------------------------------*/
+class ConsoleSummary:
+    """Prints a running summary (mean win rate and reward of the last `every` points)."""
+
+    def __init__(self, every=10):
+        self.every = every
+
+    def consume(self, metrics, slot):
+        if metrics.count % self.every == 0:
+            recent = np.arange(metrics.count - min(self.every, len(metrics)), metrics.count) % metrics.capacity
+            print(f"Episode {metrics.episodes[slot]}: win rate {metrics.win_rates[recent].mean():.2f}, "
+                  f"reward {metrics.rewards[recent].mean():.1f}")
+
+    def close(self, metrics):
+        _, win_rates, rewards, _ = metrics.view()
+        if len(win_rates):
+            print(f"Overall: win rate {win_rates.mean():.2f}, reward {rewards.mean():.1f} ({metrics.count} points)")
+
+class CsvSink:
+    """Streams every point as one CSV line to a file."""
+
+    def __init__(self, path="./out/metrics.csv"):
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self.file = open(path, "w")
+        self.header_written = False
+
+    def consume(self, metrics, slot):
+        if not self.header_written:
+            self.file.write(",".join(["episode", "win_rate", "reward", *metrics.action_names]) + "\n")
+            self.header_written = True
+        counts = ",".join(str(c) for c in metrics.action_counts[slot])
+        self.file.write(f"{metrics.episodes[slot]},{metrics.win_rates[slot]},{metrics.rewards[slot]},{counts}\n")
+
+    def close(self, metrics):
+        self.file.close()
+
+class PlotSink:
+    """Plots the retained points with `plot_evaluation` when the run is closed."""
+
+    def __init__(self, save_path="./out/combined_plot.pdf"):
+        self.save_path = save_path
+
+    def consume(self, metrics, slot):
+        pass
+
+    def close(self, metrics):
+        from utils.plotting import plot_evaluation  # Only needed once at the end
+        _, win_rates, rewards, action_counts = metrics.view()
+        if len(win_rates):
+            plot_evaluation(action_counts, win_rates, rewards, save_path=self.save_path,
+                            item_names={str(i): name for i, name in enumerate(metrics.action_names)})
+
+#-------------------------Notes-----------------------------------------------*\
+#
+#-----------------------------------------------------------------------------*\
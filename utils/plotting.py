@@ -13,7 +13,8 @@ def plot_evaluation(action_freqs, win_rates, average_rewards, item_names={'0': '
     """
     Combines plotting of item frequencies, win rates, average rewards, and a pie chart of won games.
     
-    :param action_freqs: Array of dictionaries with frequencies of items for the first subplot.
+    :param action_freqs: Array of action counts (n x 4) for the first subplot (a list of dictionaries
+                         with the item names as keys is accepted as well).
     :param win_rates: List of win rates for the second subplot.
     :param average_rewards: List of average rewards for the third subplot.
     :param item_names: Optional dictionary to map original item names to custom names for the first subplot.
@@ -33,17 +34,14 @@ def plot_evaluation(action_freqs, win_rates, average_rewards, item_names={'0': '
     #---------------------------------------------------------*/
     plt.subplot(2, 2, 1)
     
-     # Initialize a dictionary to accumulate frequencies
-    frequencies = {item_names[str(i)]: [] for i in range(len(item_names))}    
-    
-    # Accumulate frequencies for each item in each data point
-    for d in action_freqs:
-        for key, value in item_names.items():
-            frequencies[value].append(d.get(value, 0))
+    # Convert dictionaries (item names as keys) into rows of the action count array
+    if len(action_freqs) and isinstance(action_freqs[0], dict):
+        action_freqs = [[d.get(item_names[str(i)], 0) for i in range(len(item_names))] for d in action_freqs]
+    action_counts = np.asarray(action_freqs, dtype=float).reshape(-1, len(item_names))
            
      # Plotting the data for each item 
-    for item, freq in frequencies.items():
-        plt.plot(freq, label=item)
+    for i in range(len(item_names)):
+        plt.plot(action_counts[:, i], label=item_names[str(i)])
         
     plt.xlabel('Data Point Index')
     plt.ylabel('Frequency')
@@ -86,7 +84,7 @@ def plot_evaluation(action_freqs, win_rates, average_rewards, item_names={'0': '
     #---------------------------------------------------------*/
     plt.subplot(2, 2, 4)
     
-    episode_lengths = [sum(d.values()) for d in action_freqs]
+    episode_lengths = action_counts.sum(axis=1)
     mean, std = np.mean(episode_lengths), np.std(episode_lengths)
 
     # Generate points on the x axis between -3 and +3 standard deviations of the mean
@@ -0,0 +1,190 @@
+#---------------------------------------------------------*\
+# Title: Profiler (opt-in timing of the training hot path)
+# Author:
+#---------------------------------------------------------*/
+#!/usr/bin/env python3
+
+import os
+import json
+import time
+import importlib
+
+#---------------------------------------------------------*/
+# Parameters
+#---------------------------------------------------------*/
+
+# Instrumented functions: "module:attribute" -> phase name. Methods are patched on their class, so
+# the phases also cover every instance (e.g. the encoder of `QLearningAgent`).
+default_targets = {
+    "models.model:choose_action": "choose_action",
+    "models.model:get_reward": "get_reward",
+    "models.model:update_q_table": "update_q_table",
+    "models.model:take_turn": "take_turn",
+    "models.model:play_action": "play_action",
+    "models.model:run_episode": "run_episode",
+    "models.model:evaluation_game": "evaluation_game",
+    "models.model:train_q_learning": "train_q_learning",
+    "models.Q_Learning_model:QLearningAgent.choose_action": "choose_action",
+    "models.Q_Learning_model:QLearningAgent.get_reward": "get_reward",
+    "models.Q_Learning_model:QLearningAgent.update_q_table": "update_q_table",
+    "models.Q_Learning_model:QLearningAgent.take_turn": "take_turn",
+    "models.Q_Learning_model:QLearningAgent.run_episode": "run_episode",
+    "models.Q_Learning_model:QLearningAgent.train_q_learning": "train_q_learning",
+    "models.Q_Learning_model:evaluation_game": "evaluation_game",
+    "models.policy:GreedyPolicy.take_turn": "take_turn",
+    "models.policy:play_action": "play_action",
+    "models.state_encoder:StateEncoder.discretize": "discretize_state",
+    "models.state_encoder:StateEncoder.encode": "get_state_index",
+    "src.Kingdom:Kingdom.gather_resources": "kingdom_action",
+    "src.Kingdom:Kingdom.train_soldiers": "kingdom_action",
+    "src.Kingdom:Kingdom.fortify_castle": "kingdom_action",
+    "src.Kingdom:Kingdom.attack": "kingdom_action",
+    "src.eval:evaluation_game": "evaluation_game",
+    "src.eval:evaluate_agent": "evaluate_agent",
+}
+
+default_path = "./out/profile.json"
+
+#---------------------------------------------------------*/
+# Profiler
+#---------------------------------------------------------*/
+class Profiler:
+    """
+    Opt-in instrumentation of the training and evaluation hot path. `enable` replaces the target
+    functions by timed wrappers (in their module or class), `disable` puts the originals back. When
+    the profiler is not enabled nothing is patched, so there is no overhead at all.
+
+    Every phase records its call count, the cumulative (inclusive) time and the self time (without
+    the instrumented phases called from it, e.g. `take_turn` without `choose_action`).
+
+    Usage:
+        with Profiler() as profiler:
+            train_q_learning(...)
+        profiler.save()
+
+    Notes:
+    - Only calls through the patched module attributes are timed: a `from models.model import take_turn`
+      executed before `enable` keeps the original function.
+    - Worker processes of `evaluate_agent(n_workers > 1)` are not reported.
+    """
+
+    def __init__(self, targets=None):
+        self.targets = default_targets if targets is None else targets
+        self.phases = {}  # phase -> [calls, total seconds, self seconds]
+        self.patched = []  # (owner, attribute, original, in_dict)
+        self.stack = []  # Time spent in instrumented children of the running phases
+        self.started = None
+        self.wall_time = 0.0
+
+    def timed(self, func, phase):
+        """Wraps `func` so that its calls are counted and timed as `phase`."""
+        stats = self.phases.setdefault(phase, [0, 0.0, 0.0])
+        stack = self.stack
+        perf_counter = time.perf_counter
+
+        def wrapper(*args, **kwargs):
+            stack.append(0.0)
+            start = perf_counter()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                elapsed = perf_counter() - start
+                children = stack.pop()
+                stats[0] += 1
+                stats[1] += elapsed
+                stats[2] += elapsed - children
+                if stack:
+                    stack[-1] += elapsed
+
+        wrapper.__wrapped__ = func
+        wrapper.__name__ = getattr(func, "__name__", phase)
+        wrapper.__doc__ = getattr(func, "__doc__", None)
+        return wrapper
+
+    def enable(self):
+        """Patches all targets (modules are imported if necessary) and starts the wall clock."""
+        if self.patched:
+            return self
+        wrappers = set()
+        for target, phase in self.targets.items():
+            module_name, attribute_path = target.split(":")
+            owner = importlib.import_module(module_name)
+            *parents, attribute = attribute_path.split(".")
+            for parent in parents:
+                owner = getattr(owner, parent)
+            in_dict = attribute in vars(owner)
+            original = vars(owner)[attribute] if in_dict else getattr(owner, attribute)
+            if original in wrappers:  # Imported from a module patched before (e.g. `play_action` in models.policy)
+                self.patched.append((owner, attribute, original.__wrapped__, in_dict))
+                continue
+            wrapper = self.timed(original, phase)
+            setattr(owner, attribute, wrapper)
+            wrappers.add(wrapper)
+            self.patched.append((owner, attribute, original, in_dict))
+        self.started = time.perf_counter()
+        return self
+
+    def disable(self):
+        """Restores the original functions and stops the wall clock."""
+        for owner, attribute, original, in_dict in reversed(self.patched):
+            if in_dict:
+                setattr(owner, attribute, original)
+            else:
+                delattr(owner, attribute)
+        self.patched = []
+        if self.started is not None:
+            self.wall_time += time.perf_counter() - self.started
+            self.started = None
+
+    def __enter__(self):
+        return self.enable()
+
+    def __exit__(self, *exc_info):
+        self.disable()
+
+    def report(self):
+        """Returns the phases (calls, total/self seconds, mean µs per call, share of the wall time) and
+        the episode and turn rates as dict."""
+        wall_time = self.wall_time + (time.perf_counter() - self.started if self.started is not None else 0.0)
+        phases = {}
+        for phase, (calls, total, self_time) in sorted(self.phases.items(), key=lambda item: -item[1][2]):
+            if calls:
+                phases[phase] = {
+                    "calls": calls,
+                    "total_s": total,
+                    "self_s": self_time,
+                    "mean_us": total / calls * 1e6,
+                    "self_share": self_time / wall_time if wall_time else 0.0,
+                }
+
+        def rate(phase):
+            calls = self.phases.get(phase, [0])[0]
+            return calls / wall_time if wall_time else 0.0
+
+        return {
+            "wall_time_s": wall_time,
+            "episodes_per_s": rate("run_episode"),
+            "turns_per_s": rate("take_turn"),
+            "evaluation_games_per_s": rate("evaluation_game"),
+            "phases": phases,
+        }
+
+    def save(self, path=default_path):
+        """Writes the report as JSON and returns it."""
+        report = self.report()
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        with open(path, "w") as f:
+            json.dump(report, f, indent=4)
+        return report
+
+def print_report(report):
+    print(f"\nWall time {report['wall_time_s']:.2f} s | {report['episodes_per_s']:.0f} episodes/s | "
+          f"{report['evaluation_games_per_s']:.0f} evaluation games/s | {report['turns_per_s']:.0f} turns/s")
+    print(f"{'Phase':<18}{'Calls':>10}{'Total (s)':>11}{'Self (s)':>10}{'Mean (µs)':>11}{'Self %':>8}")
+    for phase, stats in report["phases"].items():
+        print(f"{phase:<18}{stats['calls']:>10}{stats['total_s']:>11.3f}{stats['self_s']:>10.3f}"
+              f"{stats['mean_us']:>11.1f}{stats['self_share']:>8.1%}")
+
+#-------------------------Notes-----------------------------------------------*\
+#
+#-----------------------------------------------------------------------------*\
@@ -0,0 +1,251 @@
+#---------------------------------------------------------*\
+# Title: Game Traces (columnar turn records, memory-mappable)
+# Author:
+#---------------------------------------------------------*/
+#!/usr/bin/env python3
+
+import os
+import json
+import struct
+import numpy as np
+
+# File layout: MAGIC | header length (uint32, little endian) | JSON header | padding | records
+# The records are appended in chunks, their number follows from the file size (a reader sees all
+# complete records that were flushed so far). The padding leaves `HEADER_ROOM` bytes, so that runs
+# appended to the file can be added to the header in place.
+MAGIC = b"KTRACE01"
+ALIGNMENT = 64
+HEADER_ROOM = 4096
+
+# One turn: the state before the action from the view of the actor (own attributes first, so that
+# `encoder.encode_arrays` of the six columns is the Q-table index), the action (0-3), the reward of
+# the actor and the attack outcome (1 = success, 0 = repelled, -1 = no attack)
+trace_dtype = np.dtype([
+    ("episode", "<u4"),
+    ("turn", "<u2"),
+    ("actor", "u1"),  # 0 = Kingdom A (the agent), 1 = Kingdom B
+    ("action", "u1"),
+    ("castle_strength", "<i4"),
+    ("resources", "<i4"),
+    ("soldiers", "<i4"),
+    ("opponent_castle_strength", "<i4"),
+    ("opponent_resources", "<i4"),
+    ("opponent_soldiers", "<i4"),
+    ("reward", "<f4"),
+    ("attack", "i1"),
+])
+state_fields = trace_dtype.names[4:10]
+
+default_trace_path = "./out/traces.ktrace"
+
+def attack_outcome(action, state, opponent):
+    """Attack outcome of a turn (1 / 0 / -1) from the state before it: a successful attack always
+    lowers the castle strength of the opponent."""
+    if action != 3:
+        return -1
+    return int(opponent.castle_strength < state[3])
+
+#---------------------------------------------------------*/
+# Recorder
+#---------------------------------------------------------*/
+class TraceRecorder:
+    """
+    Streams turns into a preallocated structured array of `chunk_size` records; full chunks are
+    appended to the trace file as raw bytes (nothing is pickled). An existing file is continued if
+    its record layout matches: the episode ids of the run are shifted past the largest id in the
+    file (`first_episode`), so they stay unique. `close` stores the next free id in the header. Without `path` the records are kept in memory
+    (`records`), e.g. in worker processes that send their chunk of records to the process that
+    writes the file.
+
+    Parameters:
+    - `path` (str, optional): Trace file.
+    - `chunk_size` (int): Records per write.
+    - `meta`: Further JSON-serializable metadata of the run, listed in the header (`runs`).
+    """
+
+    def __init__(self, path=None, chunk_size=65536, **meta):
+        self.path = path
+        self.buffer = np.zeros(chunk_size, dtype=trace_dtype)
+        self.size = 0
+        self.n_records = 0
+        self.chunks = []
+        self.file = None
+        self.first_episode = 0
+        if path is not None:
+            self.file, self.first_episode = open_trace(path, **meta)
+        self.next_episode = self.first_episode  # Past the largest episode id written so far
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def record(self, episode, turn, actor, action, state, reward, attack=-1):
+        """Adds one turn (`state`: the six attributes before the action, the actor's first)."""
+        self.buffer[self.size] = (self.first_episode + episode, turn, actor, action, *state, reward, attack)
+        self.size += 1
+        if self.size == len(self.buffer):
+            self.flush()
+
+    def record_batch(self, episodes, turns, actor, actions, states, rewards, attacks):
+        """Adds one turn of many games (arrays of length n, `states` of shape (6, n))."""
+        n = len(episodes)
+        start = 0
+        while start < n:
+            count = min(n - start, len(self.buffer) - self.size)
+            block = self.buffer[self.size:self.size + count]
+            rows = slice(start, start + count)
+            block["episode"], block["turn"], block["actor"] = self.first_episode + episodes[rows], turns[rows], actor
+            block["action"], block["reward"], block["attack"] = actions[rows], rewards[rows], attacks[rows]
+            for field, values in zip(state_fields, states):
+                block[field] = values[rows]
+            self.size += count
+            start += count
+            if self.size == len(self.buffer):
+                self.flush()
+
+    def extend(self, records):
+        """Appends finished records (a structured array of `trace_dtype`, episode ids of the run)."""
+        self.flush()
+        records = np.ascontiguousarray(records, dtype=trace_dtype)
+        if self.first_episode:
+            records = records.copy()
+            records["episode"] += self.first_episode
+        self._write(records)
+
+    def flush(self):
+        if self.size:
+            self._write(self.buffer[:self.size].copy() if self.file is None else self.buffer[:self.size])
+            self.size = 0
+
+    def _write(self, records):
+        if len(records):
+            self.next_episode = max(self.next_episode, int(records["episode"].max()) + 1)
+        if self.file is not None:
+            self.file.write(records.data)
+            self.file.flush()
+        else:
+            self.chunks.append(records)
+        self.n_records += len(records)
+
+    def records(self):
+        """All records of an in-memory recorder."""
+        self.flush()
+        return np.concatenate(self.chunks) if self.chunks else np.zeros(0, dtype=trace_dtype)
+
+    def close(self):
+        self.flush()
+        if self.file is not None:
+            close_trace(self.file, self.path, self.next_episode)
+            self.file = None
+
+#---------------------------------------------------------*/
+# Files
+#---------------------------------------------------------*/
+def open_trace(path, **meta):
+    """
+    Opens a trace file for appending, writes the header first if the file is new. The run is
+    added to the header (`runs`: `meta` and the id of its first episode, after the largest id in
+    the file). Returns the file and that id.
+
+    The id is read from the header (`next_episode`, written by `close_trace`) if its record count
+    still matches the file; after an interrupted run (or for older files) the episodes are scanned.
+    """
+    if os.path.exists(path) and os.path.getsize(path):
+        header, offset = read_trace_header(path)
+        if np.dtype([tuple(field) for field in header["fields"]]) != trace_dtype:
+            raise ValueError(f"{path} has another record layout.")
+        n_records = (os.path.getsize(path) - offset) // trace_dtype.itemsize
+        if "next_episode" in header and header.get("n_records") == n_records:
+            first_episode = header["next_episode"]
+        else:
+            traces, _ = load_traces(path)
+            first_episode = int(traces["episode"].max()) + 1 if len(traces) else 0
+            del traces
+        runs = trace_runs(header) + [{"first_episode": first_episode, **meta}]
+        header = {"fields": header["fields"], "runs": runs,
+                  **{key: header[key] for key in ("next_episode", "n_records") if key in header}}
+
+        f = open(path, "r+b")
+        if not write_trace_header(f, header, offset):
+            f.close()
+            raise ValueError(f"{path} has no room for another run in its header, record into a new file.")
+        f.seek(offset + n_records * trace_dtype.itemsize)
+        f.truncate()  # Drops a torn record at the end
+        return f, first_episode
+
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    header_bytes = json.dumps({"fields": [list(field) for field in trace_dtype.descr],
+                               "runs": [{"first_episode": 0, **meta}], "next_episode": 0, "n_records": 0}).encode()
+    padding = b" " * (HEADER_ROOM + -(len(MAGIC) + 4 + len(header_bytes)) % ALIGNMENT)
+    f = open(path, "wb")
+    f.write(MAGIC)
+    f.write(struct.pack("<I", len(header_bytes) + len(padding)))
+    f.write(header_bytes + padding)
+    return f, 0
+
+def write_trace_header(f, header, offset):
+    """Rewrites the JSON header in place (within the room up to the records at `offset`). Returns
+    False, without writing, if it does not fit anymore."""
+    header_bytes = json.dumps(header).encode()
+    if len(header_bytes) > offset - len(MAGIC) - 4:
+        return False
+    f.seek(len(MAGIC) + 4)
+    f.write(header_bytes.ljust(offset - len(MAGIC) - 4))
+    return True
+
+def close_trace(f, path, next_episode):
+    """Closes a trace file of `open_trace`, storing the next free episode id and the record count in
+    the header, so that the next run appended to the file does not have to scan its episodes."""
+    f.flush()
+    header, offset = read_trace_header(path)
+    header["next_episode"] = next_episode
+    header["n_records"] = (os.path.getsize(path) - offset) // trace_dtype.itemsize
+    write_trace_header(f, header, offset)  # Without room, the next `open_trace` scans instead
+    f.close()
+
+def trace_runs(header):
+    """The recording runs of a trace file (metadata and id of the first episode of each run)."""
+    if "runs" in header:
+        return header["runs"]
+    return [{"first_episode": 0, **{key: value for key, value in header.items() if key != "fields"}}]
+
+def read_trace_header(path):
+    """Reads the JSON header of a trace file and the offset of the records."""
+    with open(path, "rb") as f:
+        if f.read(len(MAGIC)) != MAGIC:
+            raise ValueError(f"{path} is not a trace file.")
+        (header_length,) = struct.unpack("<I", f.read(4))
+        header = json.loads(f.read(header_length))
+    return header, len(MAGIC) + 4 + header_length
+
+def load_traces(path=default_trace_path):
+    """
+    Memory-maps the records of a trace file (read-only structured array, no copy) and returns them
+    with the header. Columns are read with `traces["action"]`, `traces["reward"]`, ...
+    """
+    header, offset = read_trace_header(path)
+    n_records = (os.path.getsize(path) - offset) // trace_dtype.itemsize
+    if n_records == 0:
+        return np.zeros(0, dtype=trace_dtype), header
+    return np.memmap(path, dtype=trace_dtype, mode="r", offset=offset, shape=(n_records,)), header
+
+def summarize_traces(traces, n_actions=4):
+    """Turns, episodes, action frequencies and mean reward per actor and the attack success rate."""
+    summary = {"turns": len(traces), "episodes": len(np.unique(traces["episode"]))}
+    for actor, name in enumerate(("agent", "opponent")):
+        rows = traces[traces["actor"] == actor]
+        attacks = rows["attack"][rows["attack"] >= 0]
+        summary[name] = {
+            "turns": len(rows),
+            "action_frequencies": np.bincount(rows["action"], minlength=n_actions).tolist(),
+            "mean_reward": float(rows["reward"].mean()) if len(rows) else None,
+            "attack_success": float(attacks.mean()) if len(attacks) else None,
+        }
+    return summary
+
+#-------------------------Notes-----------------------------------------------*\
+# 37 bytes per turn (no padding), 1M turns are 37 MB. Episode ids are unique
+# within a file; a run's own episode number is the id minus its `first_episode`.
+#-----------------------------------------------------------------------------*\